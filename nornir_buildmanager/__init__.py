@@ -8,11 +8,31 @@
 from .exceptions import *
 import os
 
-import nornir_buildmanager.importers as importers
-import nornir_buildmanager.operations as operations 
+__all__ = ['pipelinemanager', 'VolumeManagerETree', 'templates', 'operations', 'metadata']
 
-import nornir_buildmanager.VolumeManagerETree as VolumeManager
-from . import validation
-from nornir_buildmanager.metadata import tilesetinfo
 
-__all__ = ['pipelinemanager', 'VolumeManagerETree', 'templates', 'operations', 'metadata']
\ No newline at end of file
+def _ImportSubmodules():
+    '''The submodules import nornir_imageregistration, which is slow, so they are imported when first used
+       instead of when the package is imported.  This keeps the command line responsive.'''
+    global importers, operations, VolumeManager, validation, tilesetinfo
+
+    import nornir_buildmanager.importers as importers
+    import nornir_buildmanager.operations as operations
+
+    import nornir_buildmanager.VolumeManagerETree as VolumeManager
+    from . import validation
+    from nornir_buildmanager.metadata import tilesetinfo
+
+
+# Attributes that were available after importing the package before submodules were imported on first use
+_SubmoduleAttributes = frozenset(['importers', 'operations', 'VolumeManager', 'VolumeManagerETree', 'validation', 'tilesetinfo', 'metadata'])
+
+
+def __getattr__(name):
+    if name in _SubmoduleAttributes:
+        _ImportSubmodules()
+
+        if name in globals():
+            return globals()[name]
+
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
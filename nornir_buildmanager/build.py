@@ -2,6 +2,8 @@
   
 *Note*: Certain arguments support regular expressions.  See the python :py:mod:`re` module for instructions on how to construct appropriate regular expressions.
 
+*Note*: Several pipelines can be run in order against the same loaded volume by separating them with ``+``, for example ``nornir_build volumepath Prune -Threshold 1 + Histogram + Mosaic``.
+
 .. argparse::
    :module: nornir_buildmanager.build
    :func: BuildParserRoot
@@ -15,27 +17,36 @@ import os
 import sys
 import time
 
-import matplotlib 
 #Nornir build must use a backend that does not allocate windows in the GUI should be used. 
 #Otherwise bugs will appear in multi-threaded environments
+#matplotlib is slow to import, so it is not imported here.  It reads the backend from MPLBACKEND when a stage first imports it.
 if not 'DEBUG' in os.environ: 
-    matplotlib.use('Agg') 
-
-import matplotlib.pyplot as plt
-plt.ioff()
+    os.environ['MPLBACKEND'] = 'Agg'
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
 
-from nornir_buildmanager import *
-from nornir_imageregistration.files import *
+from nornir_buildmanager import pipelinemanager, stagetrace
 from nornir_shared.misc import SetupLogging, lowpriority
 from nornir_shared.tasktimer import TaskTimer
-from pkg_resources import resource_filename
 
 import nornir_shared.prettyoutput as prettyoutput
 
 CommandParserDict = {}
 
+# Separates pipelines when several are run in one invocation
+PipelineSeparator = '+'
+
+# Parsed Pipelines.xml, loaded once per process
+_PipelineXMLTree = None
+
  
 def ConfigDataPath():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+    if os.path.isdir(path):
+        return path
+    
+    # Zipped installs must extract the config directory, pkg_resources is slow to import so it is only used here
+    from pkg_resources import resource_filename
     return resource_filename(__name__, 'config')
 
 
@@ -76,15 +87,139 @@ def _AddParserRootArguments(parser):
                         help='Provide additional output',
                         dest='verbose')
 
+    parser.add_argument('-trace',
+                        action='store_true',
+                        required=False,
+                        default=False,
+                        help='Record the time, CPU, memory and I/O of each stage.  Writes %s, a Chrome trace, and %s, a summary table, to the volume directory.' % (stagetrace.TraceFileName, stagetrace.SummaryFileName),
+                        dest='trace')
+
+    parser.add_argument('-serve',
+                        action='store_true',
+                        required=False,
+                        default=False,
+                        help='Start a build daemon that keeps the volume loaded and runs pipelines sent to it with -connect',
+                        dest='serve')
+
+    parser.add_argument('-connect',
+                        action='store_true',
+                        required=False,
+                        default=False,
+                        help='Run the pipeline in the build daemon serving the volume instead of in this process',
+                        dest='connect')
+
+    parser.add_argument('-shutdown',
+                        action='store_true',
+                        required=False,
+                        default=False,
+                        help='Stop the build daemon serving the volume',
+                        dest='shutdown')
+
 
 def _GetPipelineXMLPath():
     return os.path.join(ConfigDataPath(), 'Pipelines.xml')
 
 
-def BuildParserRoot():
+def _LoadPipelineXML():
+    global _PipelineXMLTree
+    if _PipelineXMLTree is None:
+        _PipelineXMLTree = pipelinemanager.PipelineManager.LoadPipelineXML(_GetPipelineXMLPath())
+        
+    return _PipelineXMLTree
+
+
+def _FindPipelineName(buildArgs):
+    '''
+    :return: The pipeline named on the command line, or None if no pipeline is named.  The root arguments
+             are all flags, so the pipeline name is the first positional argument after the volume path.
+    '''
+    positional = [arg for arg in buildArgs if not arg.startswith('-')]
+    if len(positional) < 2:
+        return None
+    
+    PipelineNames = pipelinemanager.PipelineManager.ListPipelines(_LoadPipelineXML())
+    if positional[1] in PipelineNames:
+        return positional[1]
+    
+    return None
+
+
+def SplitPipelineCommands(buildArgs):
+    '''
+    Split a command line naming several pipelines separated by PipelineSeparator into one command line per pipeline.
+    The root arguments and volume path before the first pipeline are repeated for each pipeline.
+
+    ``-debug Volume Prune -Threshold 1 + Histogram`` becomes ``-debug Volume Prune -Threshold 1`` and ``-debug Volume Histogram``
+    :return: List of command lines in the order the pipelines should run
+    '''
+    iVolume = None
+    for (i, arg) in enumerate(buildArgs):
+        if not arg.startswith('-'):
+            iVolume = i
+            break
+
+    if iVolume is None or not PipelineSeparator in buildArgs:
+        return [list(buildArgs)]
+
+    RootArgs = list(buildArgs[:iVolume + 1])
+    commands = []
+    PipelineArgs = []
+    for arg in buildArgs[iVolume + 1:]:
+        if arg == PipelineSeparator:
+            commands.append(RootArgs + PipelineArgs)
+            PipelineArgs = []
+        else:
+            PipelineArgs.append(arg)
+
+    commands.append(RootArgs + PipelineArgs)
+    return commands
+
+
+def ParsePipelineCommands(buildArgs):
+    '''
+    Parse every pipeline on the command line before any runs so a mistake in a later pipeline is reported immediately
+    :return: List of (parser, args) for each pipeline
+    '''
+    parsed = []
+    for commandArgs in SplitPipelineCommands(buildArgs):
+        parser = BuildParserForArgs(commandArgs)
+        args = parser.parse_args(commandArgs)
+        parsed.append((parser, args))
+
+    return parsed
+
+
+def _RequirePipelines(parsed):
+    for (parser, args) in parsed:
+        if not 'PipelineName' in args:
+            parser.error("A pipeline name is required")
+
+
+def _TimerTaskNames(parsed):
+    '''Name timer tasks by pipeline, numbering them when more than one pipeline runs so repeated pipelines are timed separately'''
+    if len(parsed) == 1:
+        return [args.PipelineName for (parser, args) in parsed]
+
+    return ['%d %s' % (i + 1, args.PipelineName) for (i, (parser, args)) in enumerate(parsed)]
+
+
+def BuildParserForArgs(buildArgs):
+    '''
+    Create a parser for the command line that only adds the arguments of the pipeline being run.  Every
+    pipeline is still listed so help output and errors for unknown pipelines are unchanged.
+    '''
+    PipelineName = _FindPipelineName(buildArgs)
+    return BuildParserRoot(SelectedPipelines=[] if PipelineName is None else [PipelineName])
+
+
+def BuildParserRoot(SelectedPipelines=None):
+    '''
+    :param list SelectedPipelines: Names of pipelines to add arguments for.  Other pipelines are listed without arguments.  Arguments for every pipeline are added if None.
+    '''
 
     # conflict_handler = 'resolve' replaces old arguments with new if both use the same option flag
-    parser = argparse.ArgumentParser('Buildscript', conflict_handler='resolve', description='Options available to all build commands.  Specific pipelines may extend the argument list.')
+    parser = argparse.ArgumentParser('Buildscript', conflict_handler='resolve', description='Options available to all build commands.  Specific pipelines may extend the argument list.',
+                                     epilog="Separate pipelines with '%s' to run several in order against the same loaded volume." % PipelineSeparator)
     _AddParserRootArguments(parser)
 
     # subparsers = parser.add_subparsers(title='help')
@@ -102,23 +237,23 @@ def BuildParserRoot():
     # update_parser = subparsers.add_parser('update', help='If directories have been copied directly into the volume this flag is required to detect them')
     
     pipeline_subparsers = parser.add_subparsers(title='Commands')
-    _AddPipelineParsers(pipeline_subparsers)
+    _AddPipelineParsers(pipeline_subparsers, SelectedPipelines)
     
     return parser
 
 
-def _AddPipelineParsers(subparsers):
+def _AddPipelineParsers(subparsers, SelectedPipelines=None):
 
-    PipelineXML = _GetPipelineXMLPath()
     # Load the element tree once and pass it to the later functions so we aren't parsing the XML text in the loop
-    PipelineXML = pipelinemanager.PipelineManager.LoadPipelineXML(PipelineXML)
+    PipelineXML = _LoadPipelineXML()
 
     for pipeline_name in pipelinemanager.PipelineManager.ListPipelines(PipelineXML):
         pipeline = pipelinemanager.PipelineManager.Load(PipelineXML, pipeline_name)
 
         pipeline_parser = subparsers.add_parser(pipeline_name, help=pipeline.Description, epilog=pipeline.Epilog)
 
-        pipeline.GetArgParser(pipeline_parser, IncludeGlobals=True)
+        if SelectedPipelines is None or pipeline_name in SelectedPipelines:
+            pipeline.GetArgParser(pipeline_parser, IncludeGlobals=True)
 
         pipeline_parser.set_defaults(func=call_pipeline, PipelineXmlFile=_GetPipelineXMLPath(), PipelineName=pipeline_name)
 
@@ -137,6 +272,7 @@ def print_help(args):
 
 
 def call_update(args):
+    from nornir_buildmanager import VolumeManagerETree
     volumeObj = VolumeManagerETree.load(args.volumepath)
     volumeObj.UpdateSubElements()
 
@@ -144,6 +280,132 @@ def call_update(args):
 def call_pipeline(args):
     pipelinemanager.PipelineManager.RunPipeline(PipelineXmlFile=args.PipelineXmlFile, PipelineName=args.PipelineName, args=args)
 
+
+class BuildSession(object):
+    '''Runs pipelines against one volume, keeping the volume loaded between pipelines'''
+
+    def __init__(self, VolumePath=None):
+        '''
+        :param str VolumePath: Only run pipelines against this volume, or any volume if None
+        '''
+        self.VolumePath = VolumePath
+        self.VolumeTree = None
+        self._VolumeFileStamp = None
+
+    @classmethod
+    def _GetVolumeFileStamp(cls, volumepath):
+        try:
+            stats = os.stat(os.path.join(volumepath, 'VolumeData.xml'))
+            return (stats.st_size, stats.st_mtime_ns)
+        except OSError:
+            return None
+
+    def Reload(self):
+        '''Discard the loaded volume so the next pipeline loads it from disk'''
+        self.VolumeTree = None
+        self._VolumeFileStamp = None
+
+    def Run(self, args):
+        '''Run the pipeline selected by parsed command line arguments'''
+
+        # Reload if the volume was changed by another process since the last pipeline ran
+        if not self.VolumeTree is None and self._VolumeFileStamp != BuildSession._GetVolumeFileStamp(args.volumepath):
+            self.Reload()
+
+        try:
+            self.VolumeTree = pipelinemanager.PipelineManager.RunPipeline(PipelineXmlFile=args.PipelineXmlFile,
+                                                                          PipelineName=args.PipelineName,
+                                                                          args=args,
+                                                                          VolumeTree=self.VolumeTree)
+        except:
+            self.Reload()
+            raise
+
+        self._VolumeFileStamp = BuildSession._GetVolumeFileStamp(args.volumepath)
+
+    def Execute(self, buildArgs):
+        '''
+        Parse a command line and run its pipelines
+        :return: Return code for the command
+        '''
+        parsed = ParsePipelineCommands(buildArgs)
+        _RequirePipelines(parsed)
+
+        if not self.VolumePath is None:
+            for (parser, args) in parsed:
+                if os.path.abspath(args.volumepath) != os.path.abspath(self.VolumePath):
+                    parser.error("This session only runs pipelines for %s" % self.VolumePath)
+
+        Timer = TaskTimer()
+        try:
+            self.RunAll(parsed, Timer)
+        finally:
+            prettyoutput.Log(str(Timer))
+
+        return 0
+
+    def RunAll(self, parsed, Timer):
+        '''Run each parsed pipeline in order, stopping at the first failure'''
+        Trace = None
+        if _GetFromNamespace(parsed[0][1], 'trace', False):
+            Trace = stagetrace.Begin()
+
+        try:
+            for ((parser, args), TaskName) in zip(parsed, _TimerTaskNames(parsed)):
+                Timer.Start(TaskName)
+                with stagetrace.Record(TaskName, 'Pipeline'):
+                    self.Run(args)
+                Timer.End(TaskName)
+        finally:
+            if not Trace is None:
+                stagetrace.End()
+                _WriteTrace(Trace, parsed[0][1].volumepath)
+
+
+def _WriteTrace(Trace, volumepath):
+    '''Write the Chrome trace and summary table of a traced build to the volume directory'''
+    Summary = Trace.Summary()
+    prettyoutput.Log(Summary)
+
+    try:
+        Trace.WriteChromeTrace(os.path.join(volumepath, stagetrace.TraceFileName))
+        with open(os.path.join(volumepath, stagetrace.SummaryFileName), 'w') as OutputFile:
+            OutputFile.write(Summary)
+    except OSError:
+        prettyoutput.Log('Could not write the stage trace to %s' % (volumepath))
+
+
+def _RunClient(buildArgs):
+    '''
+    Send the command line to the build daemon serving the volume
+    :return: Return code reported by the daemon
+    '''
+    # The daemon module only depends on the standard library, so the client does not parse the pipeline XML
+    from nornir_buildmanager import daemon
+
+    DaemonArgs = [arg for arg in buildArgs if not arg in ('-connect', '-shutdown')]
+    positional = [arg for arg in DaemonArgs if not arg.startswith('-')]
+    if len(positional) == 0:
+        prettyoutput.LogErr("A volume path is required")
+        return 2
+
+    VolumePath = positional[0]
+    Command = 'Shutdown' if '-shutdown' in buildArgs else 'Run'
+
+    try:
+        (ReturnCode, Message) = daemon.SendRequest(VolumePath, Command, DaemonArgs)
+    except daemon.DaemonNotRunningError as e:
+        prettyoutput.LogErr(str(e))
+        return 1
+
+    if len(Message) > 0:
+        if ReturnCode == 0:
+            prettyoutput.Log(Message)
+        else:
+            prettyoutput.LogErr(Message)
+
+    return ReturnCode
+
     
 def _GetFromNamespace(ns, attribname, default=None):
     if attribname in ns:
@@ -152,11 +414,12 @@ def _GetFromNamespace(ns, attribname, default=None):
         return default
 
 
-def InitLogging(buildArgs):
+def InitLogging(buildArgs, parser=None):
 
 #    nornir_shared.Misc.RunWithProfiler('Execute()', "C:/Temp/profile.pr")
 
-    parser = BuildParserRoot()
+    if parser is None:
+        parser = BuildParserForArgs(buildArgs)
 
     (args, extraargs) = parser.parse_known_args(buildArgs)
 
@@ -177,13 +440,15 @@ def Execute(buildArgs=None):
     if buildArgs is None:
         buildArgs = sys.argv[1:]
 
-    InitLogging(buildArgs)
+    if '-connect' in buildArgs or '-shutdown' in buildArgs:
+        return _RunClient(buildArgs)
 
-    Timer = TaskTimer()
+    parsed = ParsePipelineCommands(buildArgs)
+    (parser, args) = parsed[0]
 
-    parser = BuildParserRoot()
+    InitLogging(SplitPipelineCommands(buildArgs)[0], parser)
 
-    args = parser.parse_args(buildArgs)
+    Timer = TaskTimer()
    
     if args.lowpriority:
         
@@ -191,13 +456,17 @@ def Execute(buildArgs=None):
         print("Warning, using low priority flag.  This can make builds much slower")
         
     # SetupLogging(OutputPath=args.volumepath)
-    
-    try:  
-        Timer.Start(args.PipelineName)
 
-        args.func(args)
+    if args.serve:
+        from nornir_buildmanager import daemon
+        daemon.Serve(args.volumepath, BuildSession(args.volumepath))
+        return 0
 
-        Timer.End(args.PipelineName)
+    _RequirePipelines(parsed)
+    
+    try:
+        # Pipelines share the loaded volume and worker pools
+        BuildSession().RunAll(parsed, Timer)
   
     finally:
         OutStr = str(Timer)
@@ -212,5 +481,5 @@ def Execute(buildArgs=None):
 
 
 if __name__ == '__main__':
-    Execute()
+    sys.exit(Execute())
 
@@ -0,0 +1,256 @@
+'''
+Created on Oct 19, 2026
+
+Keeps a volume loaded between pipeline commands.
+
+``nornir-build -serve volumepath`` loads nothing until the first command arrives, then keeps the
+volume, parsed pipelines and worker pools in memory.  ``nornir-build -connect volumepath Pipeline ...``
+is a thin client that sends its command line to the daemon over a Unix domain socket and prints
+the pipeline's output as it runs.  Commands are run one at a time in the order they arrive.
+
+Each request and response is a single line of JSON.  A request is ``{"Command": ..., "Args": [...]}``
+where Command is one of :py:data:`Commands`.  The daemon replies with any number of
+``{"Output": text, "Stream": "stdout"|"stderr"}`` lines followed by ``{"ReturnCode": int, "Message": text}``.
+'''
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import traceback
+
+import nornir_shared.prettyoutput as prettyoutput
+
+Commands = ('Run', 'Ping', 'Shutdown')
+
+
+class DaemonNotRunningError(Exception):
+    '''Raised by the client when no daemon is serving the volume'''
+    pass
+
+
+def _CheckUnixSockets():
+    if not hasattr(socket, 'AF_UNIX'):
+        raise NotImplementedError("The build daemon requires Unix domain sockets, which this platform does not provide")
+
+
+def GetSocketPath(VolumePath):
+    '''
+    :return: The socket path used by a daemon serving the volume.  It is derived from the absolute volume path so any client can find it.
+    '''
+    digest = hashlib.sha1(os.path.abspath(VolumePath).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), 'nornir-build-%s.sock' % digest)
+
+
+def _SendMessage(sock, message):
+    sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def _ReadMessages(sock):
+    '''Yield each JSON message received until the other end closes the connection'''
+    with sock.makefile('r', encoding='utf-8') as reader:
+        for line in reader:
+            line = line.strip()
+            if len(line) > 0:
+                yield json.loads(line)
+
+
+class _ClientStream(object):
+    '''A text stream that forwards writes to the connected client.  Output is discarded once the client disconnects
+       so a pipeline keeps running if the client is interrupted.'''
+
+    def __init__(self, sock, StreamName):
+        self._sock = sock
+        self._name = StreamName
+        self._lock = threading.Lock()
+        self.connected = True
+
+    def write(self, text):
+        if len(text) == 0 or not self.connected:
+            return len(text)
+
+        with self._lock:
+            try:
+                _SendMessage(self._sock, {'Output': text, 'Stream': self._name})
+            except OSError:
+                self.connected = False
+
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+@contextlib.contextmanager
+def _ForwardLogging(stream):
+    '''Copy log records to the stream while the block runs.  Console handlers added by SetupLogging hold the
+       daemon's own stderr, so redirecting sys.stderr does not reach them.'''
+    root = logging.getLogger()
+    handler = logging.StreamHandler(stream)
+    handler.setLevel(root.getEffectiveLevel())
+    handler.setFormatter(logging.Formatter('%(levelname)s - %(name)s - %(message)s'))
+    root.addHandler(handler)
+    try:
+        yield handler
+    finally:
+        root.removeHandler(handler)
+
+
+class BuildDaemon(object):
+    '''Serves pipeline commands for one volume'''
+
+    logger = logging.getLogger(__name__ + '.BuildDaemon')
+
+    def __init__(self, VolumePath, Session, SocketPath=None):
+        '''
+        :param str VolumePath: Volume commands must run against
+        :param Session: Object with Execute(buildArgs) returning a return code and Reload() discarding the loaded volume, such as :py:class:`nornir_buildmanager.build.BuildSession`
+        :param str SocketPath: Socket to listen on, defaults to :py:func:`GetSocketPath`
+        '''
+        _CheckUnixSockets()
+
+        self.VolumePath = VolumePath
+        self.Session = Session
+        self.SocketPath = GetSocketPath(VolumePath) if SocketPath is None else SocketPath
+        self._listener = None
+        self._running = False
+
+    def Listen(self):
+        '''Create the socket.  Fails if another daemon is serving the same socket.'''
+
+        if os.path.exists(self.SocketPath):
+            if Ping(self.VolumePath, SocketPath=self.SocketPath):
+                raise OSError("A build daemon is already serving %s on %s" % (self.VolumePath, self.SocketPath))
+
+            # Left behind by a daemon that did not exit cleanly
+            os.remove(self.SocketPath)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.SocketPath)
+        os.chmod(self.SocketPath, 0o600)
+        self._listener.listen(8)
+        self._running = True
+
+    def Close(self):
+        self._running = False
+        if not self._listener is None:
+            self._listener.close()
+            self._listener = None
+
+            if os.path.exists(self.SocketPath):
+                os.remove(self.SocketPath)
+
+    def ServeForever(self):
+        '''Handle connections until a Shutdown command is received'''
+        while self._running:
+            (connection, address) = self._listener.accept()
+            with connection:
+                try:
+                    self.HandleConnection(connection)
+                except OSError as e:
+                    self.logger.warning("Lost connection to client: %s" % str(e))
+
+    def HandleConnection(self, connection):
+        for request in _ReadMessages(connection):
+            (ReturnCode, Message) = self.HandleRequest(request, connection)
+            _SendMessage(connection, {'ReturnCode': ReturnCode, 'Message': Message})
+            return
+
+    def HandleRequest(self, request, connection):
+        '''
+        :return: (ReturnCode, Message) tuple for the request
+        '''
+        Command = request.get('Command', None)
+        if Command == 'Ping':
+            return (0, os.path.abspath(self.VolumePath))
+        elif Command == 'Shutdown':
+            self._running = False
+            return (0, "Build daemon for %s stopped" % self.VolumePath)
+        elif Command != 'Run':
+            return (2, "Unknown command %s, expected one of %s" % (str(Command), ', '.join(Commands)))
+
+        Args = request.get('Args', [])
+        self.logger.info("Running: %s" % ' '.join(Args))
+
+        stdout = _ClientStream(connection, 'stdout')
+        stderr = _ClientStream(connection, 'stderr')
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), _ForwardLogging(stderr):
+            try:
+                ReturnCode = self.Session.Execute(Args)
+                return (0 if ReturnCode is None else ReturnCode, '')
+            except KeyboardInterrupt:
+                raise
+            except SystemExit as e:
+                # argparse exits after printing usage errors and help
+                return (e.code if isinstance(e.code, int) else 1, '')
+            except BaseException as e:
+                traceback.print_exc()
+                # The loaded volume may be partially updated, so it is loaded from disk for the next command
+                self.Session.Reload()
+                return (1, str(e))
+
+
+def Serve(VolumePath, Session, SocketPath=None):
+    '''Run a build daemon for the volume until it is shut down or interrupted'''
+
+    daemon = BuildDaemon(VolumePath, Session, SocketPath=SocketPath)
+    daemon.Listen()
+    prettyoutput.Log("Build daemon serving %s on %s" % (VolumePath, daemon.SocketPath))
+    try:
+        daemon.ServeForever()
+    except KeyboardInterrupt:
+        prettyoutput.Log("Build daemon interrupted")
+    finally:
+        daemon.Close()
+
+
+def SendRequest(VolumePath, Command, Args=None, SocketPath=None, stdout=None, stderr=None):
+    '''
+    Send a request to the daemon serving the volume and copy its output to stdout and stderr.
+    :return: (ReturnCode, Message) reported by the daemon
+    '''
+    _CheckUnixSockets()
+
+    if SocketPath is None:
+        SocketPath = GetSocketPath(VolumePath)
+
+    streams = {'stdout': sys.stdout if stdout is None else stdout,
+               'stderr': sys.stderr if stderr is None else stderr}
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(SocketPath)
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise DaemonNotRunningError("No build daemon is serving %s.  Start one with: nornir-build -serve %s" % (VolumePath, VolumePath))
+
+        _SendMessage(sock, {'Command': Command, 'Args': [] if Args is None else list(Args)})
+
+        for message in _ReadMessages(sock):
+            if 'ReturnCode' in message:
+                return (message['ReturnCode'], message.get('Message', ''))
+
+            stream = streams.get(message.get('Stream', 'stdout'), streams['stdout'])
+            stream.write(message.get('Output', ''))
+            stream.flush()
+
+    raise OSError("Build daemon for %s closed the connection without a result" % VolumePath)
+
+
+def Ping(VolumePath, SocketPath=None):
+    '''
+    :return: True if a daemon is serving the volume
+    '''
+    try:
+        (ReturnCode, Message) = SendRequest(VolumePath, 'Ping', SocketPath=SocketPath)
+        return ReturnCode == 0
+    except (DaemonNotRunningError, OSError):
+        return False
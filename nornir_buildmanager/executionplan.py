@@ -0,0 +1,165 @@
+'''
+Created on Oct 19, 2026
+
+Records what a pipeline would do during a dry run.
+
+A dry run walks the pipeline exactly as a build does: ``<Select>``, ``<Iterate>`` and ``<Require...>``
+elements are evaluated against the volume.  Stage functions are not called, and nothing is cleaned or saved.
+Each ``<PythonCall>`` reached is added to an :py:class:`ExecutionPlan` with one of these statuses:
+
+* ``Run``: The stage would be called
+* ``Unchanged``: The stage is memoized and its inputs match the key it recorded, so it would be skipped
+* ``Run after``: The stage depends on nodes that an earlier stage in the dry run would create
+
+Stage functions check their own outputs for staleness, so a stage listed as ``Run`` may still find
+nothing to do.  Only memoized stages can be reported as unchanged.
+
+When an earlier stage would run, a ``<Select>`` or ``<Iterate>`` for its output may not match anything
+yet.  Instead of skipping the rest of the iteration the dry run lists the ``<PythonCall>`` elements
+remaining in it as ``Run after``, against the element of the iteration and without input sizes.
+'''
+
+import collections
+import os
+
+from .stagememo import AncestorIDs, IgnoredArguments
+
+PlannedStage = collections.namedtuple('PlannedStage', ('Section', 'Function', 'Element', 'Status', 'InputBytes'))
+
+def SectionNumber(elem):
+    '''
+    :return: Number of the section containing the element, or None if it is not in a section
+    '''
+    while not elem is None:
+        if elem.tag == 'Section':
+            return int(elem.attrib.get('Number', -1))
+
+        elem = getattr(elem, 'Parent', None)
+
+    return None
+
+
+def DescribeElement(elem):
+    '''A short description of a meta-data element, its tag and name or path'''
+    for attrib in ('Name', 'Path', 'Number'):
+        if attrib in elem.attrib:
+            return '%s %s' % (elem.tag, elem.attrib[attrib])
+
+    return elem.tag
+
+
+def FormatBytes(NumBytes):
+    for units in ('B', 'KB', 'MB', 'GB'):
+        if NumBytes < 1024:
+            return '%.1f %s' % (NumBytes, units)
+
+        NumBytes = NumBytes / 1024.0
+
+    return '%.1f TB' % NumBytes
+
+
+class ExecutionPlan(object):
+    '''Stages a dry run would run, grouped by section'''
+
+    def __init__(self):
+        self.Stages = []
+        self.Cleaned = []  # (element description, reason) for elements a build would clean
+        self._PendingElements = set()  # ids of elements below which an earlier stage would create nodes
+        self._PathSizes = {}
+
+    def PathSize(self, fullpath):
+        '''
+        :return: Size of the file, or total size of the files below a directory, in bytes
+        '''
+        if fullpath in self._PathSizes:
+            return self._PathSizes[fullpath]
+
+        size = 0
+        if os.path.isfile(fullpath):
+            size = os.path.getsize(fullpath)
+        elif os.path.isdir(fullpath):
+            for (root, dirs, filenames) in os.walk(fullpath):
+                for filename in filenames:
+                    try:
+                        size += os.path.getsize(os.path.join(root, filename))
+                    except OSError:
+                        pass
+
+        self._PathSizes[fullpath] = size
+        return size
+
+    def EstimateInputSize(self, kwargs, VolumeElem):
+        '''
+        :return: Total size, in bytes, of the files and directories referred to by the element arguments of a stage.
+                 The element the stage runs against and its ancestors are not counted.
+        '''
+        ancestors = AncestorIDs(VolumeElem)
+        ancestors.add(id(VolumeElem))
+
+        paths = set()
+        for (key, value) in kwargs.items():
+            if key in IgnoredArguments or not hasattr(value, 'attrib') or id(value) in ancestors:
+                continue
+
+            if not 'Path' in value.attrib:
+                continue
+
+            try:
+                paths.add(value.FullPath)
+            except Exception:
+                continue
+
+        return sum([self.PathSize(p) for p in paths])
+
+    def MarkPending(self, VolumeElem):
+        '''Record that a stage run against the element would change the nodes below it'''
+        self._PendingElements.add(id(VolumeElem))
+
+    def IsPending(self, VolumeElem):
+        '''
+        :return: True if a stage that would run changes the nodes below the element or one of its ancestors
+        '''
+        if id(VolumeElem) in self._PendingElements:
+            return True
+
+        return len(AncestorIDs(VolumeElem).intersection(self._PendingElements)) > 0
+
+    def AddStage(self, FunctionName, VolumeElem, Status, InputBytes):
+        self.Stages.append(PlannedStage(SectionNumber(VolumeElem), FunctionName, DescribeElement(VolumeElem), Status, InputBytes))
+
+        if Status != 'Unchanged':
+            self.MarkPending(VolumeElem)
+
+    def AddDeferredStages(self, PipelineNodes, VolumeElem):
+        '''Add the <PythonCall> elements within pipeline elements that could not be evaluated until an earlier stage runs'''
+        for PipelineNode in PipelineNodes:
+            for CallNode in PipelineNode.iter('PythonCall'):
+                self.AddStage(CallNode.get('Function', CallNode.tag), VolumeElem, 'Run after', 0)
+
+    def AddCleaned(self, VolumeElem, Reason):
+        self.Cleaned.append((DescribeElement(VolumeElem), Reason))
+
+    def Report(self):
+        '''
+        :return: A table of the planned stages grouped by section
+        '''
+        NumRun = len([s for s in self.Stages if s.Status != 'Unchanged'])
+        TotalBytes = sum([s.InputBytes for s in self.Stages if s.Status != 'Unchanged'])
+
+        lines = ["Dry run: %d stages would run, %d unchanged, %s of input" % (NumRun, len(self.Stages) - NumRun, FormatBytes(TotalBytes))]
+
+        BySection = collections.OrderedDict()
+        for stage in self.Stages:
+            BySection.setdefault(stage.Section, []).append(stage)
+
+        for (section, stages) in BySection.items():
+            lines.append('Volume' if section is None else 'Section %d' % section)
+            for stage in stages:
+                lines.append('  %-10s %-45s %-25s %10s' % (stage.Status, stage.Function, stage.Element, FormatBytes(stage.InputBytes)))
+
+        if len(self.Cleaned) > 0:
+            lines.append('Invalid meta-data a build would remove:')
+            for (element, reason) in self.Cleaned:
+                lines.append('  %s: %s' % (element, reason))
+
+        return '\n'.join(lines)
@@ -0,0 +1,251 @@
+'''
+Created on Oct 19, 2026
+
+Reads import inputs directly from .tar and .zip archives so archived sections can be imported
+without extracting them first.
+
+A file inside an archive is identified by an :py:class:`ArchiveMember`, which can be passed to
+pool workers in place of a path.  Members stored without compression, which is the usual case for
+.tar files and for .zip files of already compressed images, occupy a contiguous range of the archive
+file.  :py:func:`GetStoredDataOffset` returns the start of that range so readers can seek or memory map
+the archive file directly.  Compressed members are read front to back through :py:func:`OpenMember`.
+'''
+
+import collections
+import fnmatch
+import os
+import shutil
+import struct
+import tarfile
+import zipfile
+
+import nornir_shared.prettyoutput as prettyoutput
+
+ArchiveMember = collections.namedtuple('ArchiveMember', ('ArchivePath', 'Name'))
+
+ArchiveExtensions = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz', '.zip')
+
+# Layout of the fixed length portion of a .zip local file header
+_ZipLocalHeaderFormat = '<4sHHHHHIIIHH'
+_ZipLocalHeaderSignature = b'PK\x03\x04'
+
+
+def IsArchive(path):
+    '''
+    :return: True if the path is a file with an archive extension
+    '''
+    if isinstance(path, ArchiveMember):
+        return False
+
+    return path.lower().endswith(ArchiveExtensions) and os.path.isfile(path)
+
+
+def IsZip(ArchivePath):
+    return ArchivePath.lower().endswith('.zip')
+
+
+def FindArchives(ImportPath):
+    '''
+    :return: Sorted full paths of the archives in the import directory and its subdirectories
+    '''
+    if IsArchive(ImportPath):
+        return [ImportPath]
+
+    archives = []
+    for (root, dirs, filenames) in os.walk(ImportPath):
+        for filename in filenames:
+            fullpath = os.path.join(root, filename)
+            if IsArchive(fullpath):
+                archives.append(fullpath)
+
+    return sorted(archives)
+
+
+def ListMembers(ArchivePath):
+    '''
+    :return: Names of the regular files in the archive
+    '''
+    if IsZip(ArchivePath):
+        with zipfile.ZipFile(ArchivePath, 'r') as zf:
+            return [info.filename for info in zf.infolist() if not info.is_dir()]
+
+    with tarfile.open(ArchivePath, 'r:*') as tf:
+        return [info.name for info in tf.getmembers() if info.isreg()]
+
+
+def FindArchivedInputs(ImportPath, extension):
+    '''
+    :return: ArchiveMember for every file with the extension in the archives found in the import directory
+    '''
+    pattern = '*.' + extension.lower()
+    members = []
+    for ArchivePath in FindArchives(ImportPath):
+        try:
+            names = ListMembers(ArchivePath)
+        except (tarfile.TarError, zipfile.BadZipFile, OSError) as e:
+            prettyoutput.LogErr("Unable to read archive {0}: {1}".format(ArchivePath, str(e)))
+            continue
+
+        members.extend([ArchiveMember(ArchivePath, name) for name in sorted(names) if fnmatch.fnmatch(name.lower(), pattern)])
+
+    return members
+
+
+def ReadMembers(ArchivePath, Names):
+    '''
+    Read several members in a single pass over the archive.  Opening each member of a compressed
+    .tar file with :py:func:`OpenMember` decompresses the archive from the start every time.
+    :param Names: Names of the members to read
+    :return: Generator of (name, bytes) tuples in the order the members are stored
+    '''
+    Names = set(Names)
+    if IsZip(ArchivePath):
+        with zipfile.ZipFile(ArchivePath, 'r') as zf:
+            for info in zf.infolist():
+                if info.filename in Names:
+                    yield (info.filename, zf.read(info))
+
+        return
+
+    with tarfile.open(ArchivePath, 'r|*') as tf:
+        for info in tf:
+            if info.isreg() and info.name in Names:
+                yield (info.name, tf.extractfile(info).read())
+
+
+def ContainingFile(path):
+    '''
+    :return: The file on disk holding the input, which is the archive for archive members
+    '''
+    if isinstance(path, ArchiveMember):
+        return path.ArchivePath
+
+    return path
+
+
+def GetStoredDataOffset(member):
+    '''
+    :return: Offset into the archive file of the member's bytes if they are stored uncompressed and contiguously, otherwise None
+    '''
+    if IsZip(member.ArchivePath):
+        with zipfile.ZipFile(member.ArchivePath, 'r') as zf:
+            info = zf.getinfo(member.Name)
+
+        # Bit 0 of the flags marks an encrypted member
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            return None
+
+        with open(member.ArchivePath, 'rb') as f:
+            f.seek(info.header_offset)
+            header = f.read(struct.calcsize(_ZipLocalHeaderFormat))
+
+        fields = struct.unpack(_ZipLocalHeaderFormat, header)
+        if fields[0] != _ZipLocalHeaderSignature:
+            return None
+
+        (name_length, extra_length) = fields[9:11]
+        return info.header_offset + len(header) + name_length + extra_length
+
+    try:
+        # Opening without a compression suffix fails for compressed tar files
+        with tarfile.open(member.ArchivePath, 'r:') as tf:
+            info = tf.getmember(member.Name)
+    except tarfile.ReadError:
+        return None
+
+    if not info.isreg() or info.issparse():
+        return None
+
+    return info.offset_data
+
+
+class _ArchiveMemberFile(object):
+    '''A read-only file object for an archive member that closes the archive when it is closed'''
+
+    def __init__(self, archive, fileobj):
+        self._archive = archive
+        self._fileobj = fileobj
+
+    def read(self, *args):
+        return self._fileobj.read(*args)
+
+    def seek(self, *args):
+        return self._fileobj.seek(*args)
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def close(self):
+        self._fileobj.close()
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def OpenMember(member):
+    '''
+    Open an archive member for reading.  Compressed members are decompressed as they are read,
+    seeking backwards restarts decompression from the start of the member.
+    :return: A binary file object, close it to close the archive
+    '''
+    if IsZip(member.ArchivePath):
+        archive = zipfile.ZipFile(member.ArchivePath, 'r')
+        try:
+            return _ArchiveMemberFile(archive, archive.open(member.Name, 'r'))
+        except:
+            archive.close()
+            raise
+
+    archive = tarfile.open(member.ArchivePath, 'r:*')
+    try:
+        fileobj = archive.extractfile(member.Name)
+        if fileobj is None:
+            raise ValueError("{0} is not a regular file in {1}".format(member.Name, member.ArchivePath))
+
+        return _ArchiveMemberFile(archive, fileobj)
+    except:
+        archive.close()
+        raise
+
+
+def CopyMember(member, OutputFullPath):
+    '''Stream an archive member to a file'''
+    with OpenMember(member) as src:
+        with open(OutputFullPath, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+
+def CopySidecarFiles(member, patterns, OutputDir, Names=None):
+    '''
+    Copy files matching the patterns from the member's directory in the archive, such as notes and logs, to the output directory.
+    Files that already exist in the output directory are not replaced.
+    :param list Names: Names of the members of the archive, if they were already listed
+    :return: List of full paths of copied files
+    '''
+    memberDir = os.path.dirname(member.Name)
+
+    if Names is None:
+        Names = ListMembers(member.ArchivePath)
+
+    copied = []
+    for name in Names:
+        if os.path.dirname(name) != memberDir:
+            continue
+
+        basename = os.path.basename(name)
+        if not any([fnmatch.fnmatch(basename.lower(), p) for p in patterns]):
+            continue
+
+        OutputFullPath = os.path.join(OutputDir, basename)
+        if os.path.exists(OutputFullPath):
+            continue
+
+        os.makedirs(OutputDir, exist_ok=True)
+        CopyMember(ArchiveMember(member.ArchivePath, name), OutputFullPath)
+        copied.append(OutputFullPath)
+
+    return copied
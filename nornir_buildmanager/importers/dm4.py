@@ -5,6 +5,7 @@ Created on Aug 7, 2015
 '''
 
 import collections
+import functools
 import glob
 import logging
 import os
@@ -26,6 +27,7 @@ import nornir_shared.plot as plot
 import nornir_shared.prettyoutput as prettyoutput
 import numpy as np
 from . import GetFileNameForTileNumber
+from . import sectionscheduler, watch
 
 DimensionScale = collections.namedtuple('DimensionScale', ('UnitsPerPixel', 'Units'))
 
@@ -34,6 +36,16 @@ TileExtension = 'png'  # Pillow does not support 16-bit png files, so we use the
 mosaics_loaded = {} # A cache of mosaics we've already loaded during import
 transforms_changed = {} # A cache of transforms that need updated checksums
 
+# Location of the image data in files written by the same capture.  The tag header
+# bytes just before the data are recorded to validate the layout of later files.
+DM4ImageLayout = collections.namedtuple('DM4ImageLayout', ('FileSize', 'DataOffset', 'Shape', 'Bpp', 'NumBytes', 'TagHeaderBytes'))
+
+# Number of bytes before the image data that are compared.  These bytes are the data
+# tag's byte length, '%%%%' delimiter, and array type info, which includes the pixel type and count.
+DM4TagHeaderValidationLength = 40
+
+image_layouts = {} # Image layouts, keyed by directory, found by this process
+
 
 def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
     '''Import the specified directory into the volume'''
@@ -56,11 +68,20 @@ def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
     if len(ContrastMap) == 0:
         nornir_buildmanager.importers.CreateDefaultHistogramCutoffFile(histogramFilename)
 
+    MaxConcurrentSections = kwargs.get('MaxConcurrentSections', 1)
+    InputFiles = kwargs.get('InputFiles', None)
+
+    SectionImports = []
     DirList = files.RecurseSubdirectoriesGenerator(ImportPath, RequiredFiles="*." + extension, ExcludeNames=[], ExcludedDownsampleLevels=[])
     for path in DirList:
         prettyoutput.CurseString("DM4Import", "Importing *.dm4 from {0}".format(path))
         for idocFullPath in glob.glob(os.path.join(path, '*.dm4')):
-            yield from DigitalMicrograph4Import.ToMosaic(VolumeElement, idocFullPath, VolumeElement.FullPath, FlipList=FlipList, ContrastMap=ContrastMap, tile_overlap=tile_overlap)
+            if not watch.IncludeInputFile(InputFiles, idocFullPath):
+                continue
+            
+            SectionImports.append((idocFullPath, functools.partial(DigitalMicrograph4Import.ToMosaic, VolumeElement, idocFullPath, VolumeElement.FullPath, FlipList=FlipList, ContrastMap=ContrastMap, tile_overlap=tile_overlap)))
+            
+    yield from sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections)
     
     nornir_pools.WaitOnAllPools()
     
@@ -79,30 +100,59 @@ def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
 
 def ConvertDM4ToPng(dm4FileFullPath, output_fullpath):
     # (section_number, tile_number) = DigitalMicrograph4Import.GetMetaFromFilename(dm4FileFullPath)
-    dm4data = DM4FileHandler(dm4FileFullPath)
-                   
-    #tempdir = tempfile.mkdtemp(prefix="DM4")
-     
-    #tempfilename = os.path.basename(output_fullpath + '.tif')  # cls.GetFileNameForTileNumber(tile_number, ext='tif') #Pillow does not support 16-bit PNG.  We save to TIF and convert
-    #temp_output_fullpath = os.path.join(tempdir, tempfilename)
-    
-    #image_data = dm4data.ReadImage()
-    #InputImageBpp = dm4data.image_bpp
-    #im = PIL.Image.fromarray(image_data, 'I;%d' % InputImageBpp)
-    #im = im.convert(mode='I')
-    #im.save(output_fullpath)
-    
-    im = dm4data.ReadImageAsPIL()
+    im = ReadDM4ImageAsPIL(dm4FileFullPath)
     im.save(output_fullpath)
     
-    #cmd = "magick convert %s %s" % (temp_output_fullpath, output_fullpath)
+
+def ReadDM4ImageAsPIL(dm4FileFullPath):
+    '''
+    Read the image in a DM4 file.  The first file read from a directory is parsed completely and the
+    location of its image data is cached.  Later files from the directory with the same layout are
+    read directly from that offset.  Files that fail validation are parsed completely.
+    '''
     
-    #pools = nornir_pools.GetGlobalLocalMachinePool()
-    #pools.add_process(output_fullpath, cmd)
-    #pools.wait_completion()
+    key = os.path.dirname(dm4FileFullPath)
+    layout = image_layouts.get(key, None)
+    if layout is not None:
+        im = TryReadDM4ImageWithLayout(dm4FileFullPath, layout)
+        if im is not None:
+            return im
+        
+    dm4data = DM4FileHandler(dm4FileFullPath)
+    image_shape = dm4data.ReadImageShape()
+    image_bytes = dm4data.ReadImageBytes()
     
-    #os.remove(temp_output_fullpath)
-    #os.removedirs(tempdir)
+    image_layouts[key] = dm4data.GetImageLayout(image_bytes, image_shape)
+    
+    return ImageBytesToPIL(image_bytes, dm4data.image_bpp, image_shape)
+
+
+def TryReadDM4ImageWithLayout(dm4FileFullPath, layout):
+    '''
+    Read the image data from the offset in the layout
+    :return: PIL image, or None if the file does not match the layout
+    '''
+    
+    if os.path.getsize(dm4FileFullPath) != layout.FileSize:
+        return None
+    
+    with open(dm4FileFullPath, 'rb') as hDM4:
+        hDM4.seek(layout.DataOffset - len(layout.TagHeaderBytes))
+        tag_header_bytes = hDM4.read(len(layout.TagHeaderBytes))
+        if tag_header_bytes != layout.TagHeaderBytes:
+            return None
+        
+        image_bytes = hDM4.read(layout.NumBytes)
+        
+    if len(image_bytes) != layout.NumBytes:
+        return None
+    
+    return ImageBytesToPIL(image_bytes, layout.Bpp, layout.Shape)
+
+
+def ImageBytesToPIL(image_bytes, bpp, image_shape):
+    im = PIL.Image.frombytes(data=image_bytes, mode='I;%d' % bpp, size=(int(image_shape[1]), int(image_shape[0])))
+    return im.convert(mode='I')
     
 
 class DM4FileHandler():
@@ -133,6 +183,7 @@ class DM4FileHandler():
         return self.tags.named_subdirs['ImageList'].unnamed_subdirs[1].named_subdirs['ImageData'].named_tags['PixelDepth']
     
     def __init__(self, dm4fullpath):
+        self._dm4fullpath = dm4fullpath
         self._dm4file = dm4reader.DM4File.open(dm4fullpath)
         self._tags = self._dm4file.read_directory()
         
@@ -165,12 +216,37 @@ class DM4FileHandler():
         
         return np_array
     
+    def ReadImageBytes(self):
+        return self.dm4file.read_tag_data(self.ImageDataTag).tobytes()
+    
     def ReadImageAsPIL(self):
         image_shape = self.ReadImageShape()     
-        im = PIL.Image.frombytes(data=self.dm4file.read_tag_data(self.ImageDataTag).tobytes(), mode='I;%d' % self.image_bpp, size=(image_shape[1], image_shape[0]))
-        im = im.convert(mode='I')
+        return ImageBytesToPIL(self.ReadImageBytes(), self.image_bpp, image_shape)
     
-        return im
+    def GetImageLayout(self, image_bytes, image_shape):
+        '''
+        Locate the image data in the file so files with the same layout can be read without parsing tags.
+        :param bytes image_bytes: Image data read from the tags, used to confirm the data is at the offset
+        :return: DM4ImageLayout, or None if the image data cannot be read directly
+        '''
+        data_offset = getattr(self.ImageDataTag, 'data_offset', None)
+        if data_offset is None or data_offset < DM4TagHeaderValidationLength:
+            return None
+        
+        with open(self._dm4fullpath, 'rb') as hDM4:
+            hDM4.seek(data_offset - DM4TagHeaderValidationLength)
+            tag_header_bytes = hDM4.read(DM4TagHeaderValidationLength)
+            direct_bytes = hDM4.read(len(image_bytes))
+            
+        if direct_bytes != image_bytes:
+            return None
+        
+        return DM4ImageLayout(FileSize=os.path.getsize(self._dm4fullpath),
+                              DataOffset=data_offset,
+                              Shape=tuple(int(d) for d in image_shape),
+                              Bpp=self.image_bpp,
+                              NumBytes=len(image_bytes),
+                              TagHeaderBytes=tag_header_bytes)
 
     def ReadMontageGridSize(self):
         ''':return: Image grid dimensions as array, [YDim,XDim] as uint64''' 
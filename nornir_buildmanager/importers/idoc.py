@@ -26,13 +26,21 @@ Example:
 
     * ... 
 
+Section subfolders may also be stored in .tar or .zip archives in the import folder.
+Archived captures are staged in the volume folder while they are imported.
+
 .. _SerialEM: http://bio3d.colorado.edu/SerialEM/
 
 '''
 
+import functools
+import posixpath
 import re
+import shutil
+from PIL import Image
 import nornir_buildmanager.templates
 from nornir_buildmanager.VolumeManagerETree import *
+from nornir_buildmanager.plotting import PlotLock
 from nornir_buildmanager.operations.tile import VerifyTiles
 import nornir_buildmanager.importers
 from nornir_imageregistration.files import mosaicfile
@@ -52,6 +60,7 @@ import numpy
 import nornir_buildmanager.importers.serialemlog as serialemlog
 import nornir_buildmanager.importers.shared as shared
 import nornir_buildmanager.importers.serialem_utils as serialem_utils
+from nornir_buildmanager.importers import archive, sectionscheduler, watch
 
 
 def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
@@ -66,6 +75,9 @@ def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
     MaxCutoff = float(kwargs.get('Max'))
     ContrastCutoffs = (MinCutoff, MaxCutoff)
     CameraBpp = kwargs.get('CameraBpp',None)
+    SinglePass = kwargs.get('SinglePass', False)
+    MaxConcurrentSections = kwargs.get('MaxConcurrentSections', 1)
+    InputFiles = kwargs.get('InputFiles', None)
         
     if MinCutoff < 0.0 or MinCutoff > 1.0:
         raise ValueError("Min must be between 0 and 1: %f" % MinCutoff)
@@ -87,18 +99,40 @@ def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
 
     DirList = files.RecurseSubdirectoriesGenerator(ImportPath, RequiredFiles="*." + extension, ExcludeNames=[], ExcludedDownsampleLevels=[])
 
-    DataFound = False 
+    SectionImports = []
 
     for path in DirList:
         for idocFullPath in glob.glob(os.path.join(path, '*.idoc')):
-            DataFound = True
-            yield SerialEMIDocImport.ToMosaic(VolumeElement,
-                                              idocFullPath,
-                                              ContrastCutoffs=ContrastCutoffs,
-                                              OutputImageExt=None,
-                                              FlipList=FlipList,
-                                              CameraBpp=CameraBpp,
-                                              ContrastMap=ContrastMap)
+            if not watch.IncludeInputFile(InputFiles, idocFullPath):
+                continue
+            
+            SectionImports.append((idocFullPath, functools.partial(SerialEMIDocImport.ToMosaic,
+                                                                   VolumeElement,
+                                                                   idocFullPath,
+                                                                   ContrastCutoffs=ContrastCutoffs,
+                                                                   OutputImageExt=None,
+                                                                   FlipList=FlipList,
+                                                                   CameraBpp=CameraBpp,
+                                                                   ContrastMap=ContrastMap,
+                                                                   SinglePass=SinglePass)))
+
+    # Sections inside .tar and .zip archives are staged in the volume directory as they are imported
+    if InputFiles is None:
+        for member in archive.FindArchivedInputs(ImportPath, extension):
+            SectionImports.append(('{0}:{1}'.format(member.ArchivePath, member.Name),
+                                   functools.partial(SerialEMIDocImport.ArchivedToMosaic,
+                                                     VolumeElement,
+                                                     member,
+                                                     ContrastCutoffs=ContrastCutoffs,
+                                                     OutputImageExt=None,
+                                                     FlipList=FlipList,
+                                                     CameraBpp=CameraBpp,
+                                                     ContrastMap=ContrastMap,
+                                                     SinglePass=SinglePass)))
+
+    DataFound = len(SectionImports) > 0
+    
+    yield from sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections)
 
     if not DataFound:
         raise ValueError("No data found in ImportPath %s" % ImportPath)
@@ -106,12 +140,30 @@ def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
               
 
 
+# Files the import writes into the section directory, ignored by watch mode.  The histogram image is plotted by a worker thread after the import returns.
+GeneratedFiles = ('Histogram.xml', 'Histogram.png', '*.log.npz')
+
+
+def IsCaptureComplete(idocFullPath):
+    '''Used by watch mode.  An idoc capture is complete when every tile it lists exists.'''
+    IDocData = IDoc.Load(idocFullPath, UseCache=False)
+    if IDocData.NumTiles == 0:
+        return False
+    
+    sectionDir = os.path.dirname(idocFullPath)
+    for t in IDocData.tiles:
+        if not os.path.exists(os.path.join(sectionDir, t.Image)):
+            return False
+        
+    return True
+
+
 class SerialEMIDocImport(object):
     
     
 
     @classmethod
-    def ToMosaic(cls, VolumeObj, idocFileFullPath, ContrastCutoffs, OutputImageExt=None, TargetBpp=None, FlipList=None, ContrastMap=None, CameraBpp=None, debug=None):
+    def ToMosaic(cls, VolumeObj, idocFileFullPath, ContrastCutoffs, OutputImageExt=None, TargetBpp=None, FlipList=None, ContrastMap=None, CameraBpp=None, SinglePass=False, debug=None):
         '''
         This function will convert an idoc file in the given path to a .mosaic file.
         It will also rename image files to the requested extension and subdirectory.
@@ -119,6 +171,7 @@ class SerialEMIDocImport(object):
         between the median min and max values
         :param list FlipList: List of section numbers which should have images flipped
         :param dict ContrastMap: Dictionary mapping section number to (Min, Max, Gamma) tuples 
+        :param bool SinglePass: Decode each compressed raw tile once when building the histogram and convert from an uncompressed cached copy
         '''
         if(OutputImageExt is None):
             OutputImageExt = 'png'
@@ -202,7 +255,8 @@ class SerialEMIDocImport(object):
         if(Flip):
             prettyoutput.Log("Found in FlipList.txt, flopping images")
 
-        IDocData = IDoc.Load(idocFilePath, CameraBpp=CameraBpp)
+        with sectionscheduler.MetadataUnlocked():
+            IDocData = IDoc.Load(idocFilePath, CameraBpp=CameraBpp)
 
         assert(hasattr(IDocData, 'PixelSpacing'))
         assert(hasattr(IDocData, 'DataMode'))
@@ -235,8 +289,17 @@ class SerialEMIDocImport(object):
         
         IDocData.RemoveMissingTiles(sectionDir)
         source_tile_list = [os.path.join(sectionDir, t.Image) for t in IDocData.tiles ]
+
+        RawTileCacheDir = None
+        if SinglePass and len(source_tile_list) > 0:
+            if _IsCompressedTile(source_tile_list[0]):
+                RawTileCacheDir = os.path.join(channelObj.FullPath, RawTileCacheDirName)
+            else:
+                # Caching an uncompressed tile costs a write and a read of the same size as reading it again
+                logger.info("Raw tiles are not compressed, ignoring -SinglePass for " + idocFileFullPath)
           
-        (ActualMosaicMin, ActualMosaicMax, Gamma) = cls.GetSectionContrastSettings(SectionNumber, ContrastMap, ContrastCutoffs, source_tile_list, IDocData, histogramFullPath)
+        with sectionscheduler.MetadataUnlocked():
+            (ActualMosaicMin, ActualMosaicMax, Gamma) = cls.GetSectionContrastSettings(SectionNumber, ContrastMap, ContrastCutoffs, source_tile_list, IDocData, histogramFullPath, RawTileCacheDir=RawTileCacheDir)
         ActualMosaicMax = numpy.around(ActualMosaicMax)
         ActualMosaicMin = numpy.around(ActualMosaicMin)
         
@@ -298,11 +361,19 @@ class SerialEMIDocImport(object):
             filterObj.TilePyramid.NumberOfTiles = IDocData.NumTiles
             # andValue = cls.GetBitmask(ActualMosaicMin, ActualMosaicMax, TargetBpp)
             #nornir_shared.images.ConvertImagesInDict(SourceToMissingTargetMap, Flip=Flip, Bpp=TargetBpp, Invert=Invert, bDeleteOriginal=False, MinMax=[ActualMosaicMin, ActualMosaicMax])
-            nornir_imageregistration.ConvertImagesInDict(SourceToMissingTargetMap, Flip=Flip, InputBpp=ImageBpp, OutputBpp=TargetBpp, Invert=Invert, bDeleteOriginal=False, MinMax=[ActualMosaicMin, ActualMosaicMax], Gamma=Gamma)
+            ConversionMap = SourceToMissingTargetMap
+            if RawTileCacheDir is not None:
+                ConversionMap = _UseCachedRawTiles(SourceToMissingTargetMap, RawTileCacheDir)
+                
+            with sectionscheduler.MetadataUnlocked():
+                nornir_imageregistration.ConvertImagesInDict(ConversionMap, Flip=Flip, InputBpp=ImageBpp, OutputBpp=TargetBpp, Invert=Invert, bDeleteOriginal=False, MinMax=[ActualMosaicMin, ActualMosaicMax], Gamma=Gamma)
 
         elif(Tileset.ImageMoveRequired):
             for f in SourceToMissingTargetMap:
                 shutil.copy(f, SourceToMissingTargetMap[f])
+                
+        if RawTileCacheDir is not None and os.path.exists(RawTileCacheDir):
+            shutil.rmtree(RawTileCacheDir, ignore_errors=True)
 
         # If we wrote new images replace the .mosaic file
         if len(SourceToMissingTargetMap) > 0 or not os.path.exists(SupertilePath):
@@ -332,12 +403,42 @@ class SerialEMIDocImport(object):
         return None
 
     @classmethod
-    def GetSectionContrastSettings(cls, SectionNumber, ContrastMap, ContrastCutoffs, SourceImagesFullPaths, idoc_data, histogramFullPath):
-        '''Clear and recreate the filters tile pyramid node if the filters contrast node does not match'''
+    def ArchivedToMosaic(cls, VolumeObj, member, **kwargs):
+        '''
+        Import a capture stored in a .tar or .zip archive.  Tiles are converted by pool workers that open them
+        by path, so the .idoc, notes and log are staged in the volume directory and kept, so the histogram is not
+        rebuilt the next time the section is imported.  If the outputs of an earlier import are current nothing
+        else is read.  Otherwise the archive is read once, front to back, the tiles are written to the staging
+        directory as they are read, and removed after the import.
+        :param archive.ArchiveMember member: The .idoc file in the archive
+        '''
+        StagingDir = _ArchiveStagingDir(VolumeObj, member)
+        with sectionscheduler.MetadataUnlocked():
+            (StagedIDocFullPath, TileMembers) = _StageArchivedIDoc(member, StagingDir)
+
+        if _ArchivedCaptureIsImported(VolumeObj, StagedIDocFullPath, len(TileMembers), **kwargs):
+            prettyoutput.Log("Outputs are current, skipping archived capture " + StagedIDocFullPath)
+            return None
+
+        with sectionscheduler.MetadataUnlocked():
+            StagedTiles = _StageArchivedTiles(member, TileMembers)
+            
+        try:
+            return cls.ToMosaic(VolumeObj, StagedIDocFullPath, **kwargs)
+        finally:
+            for f in StagedTiles:
+                if os.path.exists(f):
+                    os.remove(f)
+
+    @classmethod
+    def GetSectionContrastSettings(cls, SectionNumber, ContrastMap, ContrastCutoffs, SourceImagesFullPaths, idoc_data, histogramFullPath, RawTileCacheDir=None):
+        '''Clear and recreate the filters tile pyramid node if the filters contrast node does not match
+        :param str RawTileCacheDir: If the histogram must be built, save each decoded raw tile in this directory for conversion
+        '''
         Gamma = 1.0
         
         #We don't have to run this step, but it ensures the histogram is up to date
-        (ActualMosaicMin, ActualMosaicMax) = _GetMinMaxCutoffs(SourceImagesFullPaths, ContrastCutoffs[0], 1.0 - ContrastCutoffs[1], idoc_data, histogramFullPath)
+        (ActualMosaicMin, ActualMosaicMax) = _GetMinMaxCutoffs(SourceImagesFullPaths, ContrastCutoffs[0], 1.0 - ContrastCutoffs[1], idoc_data, histogramFullPath, RawTileCacheDir=RawTileCacheDir)
         
         if SectionNumber in ContrastMap:
             ActualMosaicMin = ContrastMap[SectionNumber].Min
@@ -398,7 +499,7 @@ class SerialEMIDocImport(object):
         return andValue
 
     
-def _GetMinMaxCutoffs(listfilenames, MinCutoff, MaxCutoff, idoc_data, histogramFullPath=None):
+def _GetMinMaxCutoffs(listfilenames, MinCutoff, MaxCutoff, idoc_data, histogramFullPath=None, RawTileCacheDir=None):
     
     histogramObj = None
     if not histogramFullPath is None:
@@ -421,7 +522,10 @@ def _GetMinMaxCutoffs(listfilenames, MinCutoff, MaxCutoff, idoc_data, histogramF
             if (1 << idoc_data.CameraBpp) - 1 < maxVal:
                 maxVal = (1 << idoc_data.CameraBpp) - 1
             
-        histogramObj = image_stats.Histogram(listfilenames, Bpp=Bpp, MinVal=idoc_data.Min, MaxVal=idoc_data.Max, numBins=numBins)
+        if RawTileCacheDir is None:
+            histogramObj = image_stats.Histogram(listfilenames, Bpp=Bpp, MinVal=idoc_data.Min, MaxVal=idoc_data.Max, numBins=numBins)
+        else:
+            histogramObj = _HistogramAndCacheRawTiles(listfilenames, RawTileCacheDir, Bpp=Bpp, MinVal=idoc_data.Min, MaxVal=idoc_data.Max, numBins=numBins)
 
         if not histogramFullPath is None:
             histogramObj = _CleanOutliersFromIDocHistogram(histogramObj)
@@ -433,6 +537,197 @@ def _GetMinMaxCutoffs(listfilenames, MinCutoff, MaxCutoff, idoc_data, histogramF
     return histogramObj.AutoLevel(MinCutoff, MaxCutoff)
 
 
+# Name of the channel subdirectory holding decoded raw tiles during a single pass import
+RawTileCacheDirName = 'RawTileCache'
+
+
+def _IsCompressedTile(SourceFullPath):
+    '''
+    :return: True if the raw tile must be decompressed when it is read.  Only the header is read.
+    '''
+    with Image.open(SourceFullPath) as im:
+        if im.format != 'TIFF':
+            return True
+
+        return im.info.get('compression', 'raw') != 'raw'
+
+
+def _CachedRawTilePath(RawTileCacheDir, SourceFullPath):
+    # An uncompressed TIFF, so the conversion loads it like any other tile without decompressing it
+    return os.path.join(RawTileCacheDir, os.path.splitext(os.path.basename(SourceFullPath))[0] + '.tif')
+
+
+def _HistogramAndCacheRawTile(SourceFullPath, CachedFullPath, MinVal, MaxVal, numBins):
+    '''Decode a raw tile, save the pixels for conversion, and return the tile's histogram counts'''
+    with Image.open(SourceFullPath) as im:
+        img = numpy.asarray(im)
+        im.save(CachedFullPath, format='TIFF')
+        
+    (counts, edges) = numpy.histogram(img, bins=numBins, range=(MinVal, MaxVal))
+    return counts
+
+
+def _HistogramAndCacheRawTiles(listfilenames, RawTileCacheDir, Bpp, MinVal=None, MaxVal=None, numBins=None):
+    '''
+    Build the histogram of the raw tiles while saving the decoded pixels of each tile,
+    so the conversion does not need to decode the raw tiles a second time.
+    :param int Bpp: Bits per pixel of the raw tiles, sets the range and number of bins that are not specified
+    '''
+    
+    if MinVal is None:
+        MinVal = 0
+        
+    if MaxVal is None:
+        MaxVal = (1 << Bpp) - 1
+        
+    if numBins is None:
+        numBins = 1 << Bpp
+    
+    os.makedirs(RawTileCacheDir, exist_ok=True)
+    
+    pool = nornir_pools.GetGlobalMultithreadingPool()
+    tasks = []
+    for f in listfilenames:
+        task = pool.add_task(f, _HistogramAndCacheRawTile, f, _CachedRawTilePath(RawTileCacheDir, f), MinVal, MaxVal, numBins)
+        tasks.append(task)
+    
+    total = numpy.zeros(numBins, dtype=numpy.int64)
+    for task in tasks:
+        total += task.wait_return()
+    
+    histogramObj = Histogram.Init(MinVal, MaxVal, numBins)
+    histogramObj.Bins = [int(c) for c in total]
+    return histogramObj
+
+
+def _UseCachedRawTiles(SourceToTargetMap, RawTileCacheDir):
+    '''
+    :return: A copy of the map where raw tiles with an up to date cached copy are replaced by the cached copy
+    '''
+    
+    ConversionMap = {}
+    for (source, target) in SourceToTargetMap.items():
+        cached = _CachedRawTilePath(RawTileCacheDir, source)
+        if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(source):
+            ConversionMap[cached] = target
+        else:
+            ConversionMap[source] = target
+            
+    return ConversionMap
+
+
+# Name of the volume subdirectory where archived captures are staged
+ArchivedCaptureDirName = 'ArchivedCaptures'
+
+
+def _ArchiveStagingDir(VolumeObj, member):
+    '''
+    :return: Directory where the capture of the archive member is staged, named like the section directory in the archive
+    '''
+    SectionDirName = posixpath.basename(posixpath.dirname(member.Name))
+    if len(SectionDirName) == 0:
+        SectionDirName = posixpath.splitext(posixpath.basename(member.Name))[0]
+        
+    return os.path.join(VolumeObj.FullPath, ArchivedCaptureDirName, SectionDirName)
+
+
+def _StageArchivedIDoc(member, StagingDir):
+    '''
+    Copy the .idoc, notes and log of an archived capture to the staging directory so it can be imported like a capture on disk.
+    Staged files have the modification time of the archive, so outputs are only replaced when the archive changes.
+    :param archive.ArchiveMember member: The .idoc file in the archive
+    :return: (Full path of the staged .idoc file, dictionary mapping the archived tiles the .idoc lists to their staged full paths)
+    '''
+    ArchiveModified = os.path.getmtime(member.ArchivePath)
+    StagedIDocFullPath = os.path.join(StagingDir, posixpath.basename(member.Name))
+    if os.path.exists(StagedIDocFullPath) and os.path.getmtime(StagedIDocFullPath) != ArchiveModified:
+        # The archive changed, so the staged histogram and sidecar files are stale
+        shutil.rmtree(StagingDir, ignore_errors=True)
+        
+    os.makedirs(StagingDir, exist_ok=True)
+    if not os.path.exists(StagedIDocFullPath):
+        archive.CopyMember(member, StagedIDocFullPath)
+        os.utime(StagedIDocFullPath, (ArchiveModified, ArchiveModified))
+        
+    Names = archive.ListMembers(member.ArchivePath)
+    archive.CopySidecarFiles(member, ['*notes*.*', '*.log'], StagingDir, Names=Names)
+    
+    Names = frozenset(Names)
+    IDocData = IDoc.Load(StagedIDocFullPath, UseCache=False)
+    MemberDir = posixpath.dirname(member.Name)
+    TileMembers = collections.OrderedDict()
+    for t in IDocData.tiles:
+        name = posixpath.join(MemberDir, t.Image)
+        if name in Names:
+            TileMembers[name] = os.path.join(StagingDir, t.Image)
+    
+    return (StagedIDocFullPath, TileMembers)
+
+
+def _StageArchivedTiles(member, TileMembers):
+    '''
+    Write the archived tiles to the staging directory in a single pass over the archive.  The tiles are written as they are stored, without decoding them.
+    :param dict TileMembers: Maps names of tiles in the archive to their staged full paths, see :py:func:`_StageArchivedIDoc`
+    :return: List of full paths of the staged tiles
+    '''
+    ArchiveModified = os.path.getmtime(member.ArchivePath)
+    
+    StagedTiles = []
+    for (name, data) in archive.ReadMembers(member.ArchivePath, TileMembers.keys()):
+        StagedTile = TileMembers[name]
+        with open(StagedTile, 'wb') as hFile:
+            hFile.write(data)
+            
+        os.utime(StagedTile, (ArchiveModified, ArchiveModified))
+        StagedTiles.append(StagedTile)
+        
+    return StagedTiles
+
+
+def _ArchivedCaptureIsImported(VolumeObj, StagedIDocFullPath, NumTiles, ContrastCutoffs, ContrastMap=None, CameraBpp=None, TargetBpp=None, OutputImageExt=None, **kwargs):
+    '''
+    :return: True if the volume holds current outputs for every tile of a staged capture, so importing it would find nothing to do.
+             The checks are those :py:meth:`SerialEMIDocImport.ToMosaic` makes before converting tiles.
+    '''
+    if TargetBpp is None:
+        TargetBpp = 8
+
+    if OutputImageExt is None:
+        OutputImageExt = 'png'
+
+    if ContrastMap is None:
+        ContrastMap = {}
+        
+    sectionDir = os.path.dirname(StagedIDocFullPath)
+    SectionNumber = shared.GetSectionInfo(sectionDir).number
+    histogramFullPath = os.path.join(sectionDir, 'Histogram.xml')
+    if SectionNumber < 0 or NumTiles == 0 or not os.path.exists(histogramFullPath):
+        return False
+
+    FilterObj = VolumeObj.find("Block/Section[@Number='%d']/Channel[@Name='TEM']/Filter[@Name='Raw%d']" % (SectionNumber, TargetBpp))
+    if FilterObj is None or FilterObj.TilePyramid is None:
+        return False
+    
+    SupertilePath = os.path.join(FilterObj.Parent.FullPath, 'Stage.mosaic')
+    if not os.path.exists(SupertilePath) or os.path.getmtime(SupertilePath) < os.path.getmtime(StagedIDocFullPath):
+        return False
+    
+    LevelObj = FilterObj.TilePyramid.GetLevel(1)
+    if LevelObj is None:
+        return False
+    
+    for iTile in range(0, NumTiles):
+        TargetImageName = (nornir_buildmanager.templates.Current.TileCoordFormat % iTile) + '.' + OutputImageExt
+        if not os.path.exists(os.path.join(LevelObj.FullPath, TargetImageName)):
+            return False
+    
+    with sectionscheduler.MetadataUnlocked():
+        IDocData = IDoc.Load(StagedIDocFullPath, CameraBpp=CameraBpp)
+        (ActualMosaicMin, ActualMosaicMax, Gamma) = SerialEMIDocImport.GetSectionContrastSettings(SectionNumber, ContrastMap, ContrastCutoffs, [], IDocData, histogramFullPath)
+        
+    return not FilterObj.IsContrastMismatched(numpy.around(ActualMosaicMin), numpy.around(ActualMosaicMax), Gamma)
+
+
 def _CleanOutliersFromIDocHistogram(hObj):
     '''
     For Max-Value outliers this is a legacy function that supports old versions of SerialEM that falsely reported
@@ -459,7 +754,8 @@ def _PlotHistogram(histogramFullPath, sectionNumber, minCutoff, maxCutoff, force
     if ImageRemoved or force_recreate or not os.path.exists(HistogramImageFullPath):
 #        pool = nornir_pools.GetGlobalMultithreadingPool()
         # pool.add_task(HistogramImageFullPath, plot.Histogram, histogramFullPath, HistogramImageFullPath, Title="Section %d Raw Data Pixel Intensity" % (sectionNumber), LinePosList=[minCutoff, maxCutoff])
-        plot.Histogram(histogramFullPath, HistogramImageFullPath, Title="Section %d Raw Data Pixel Intensity" % (sectionNumber), LinePosList=[minCutoff, maxCutoff])
+        with PlotLock:
+            plot.Histogram(histogramFullPath, HistogramImageFullPath, Title="Section %d Raw Data Pixel Intensity" % (sectionNumber), LinePosList=[minCutoff, maxCutoff])
 
 
 class NornirTileset():
@@ -777,83 +1073,172 @@ class IDoc():
         return numpy.mean([t.Mean for t in self.tiles])
 
     @classmethod
-    def Load(cls, idocfullPath, CameraBpp=None):
+    def Load(cls, idocfullPath, CameraBpp=None, UseCache=True):
         '''
         :param int CameraBpp: Forces the maximum value of tiles to not exceed the known bits-per-pixel capability of the camera, ignored if None
+        :param bool UseCache: Reuse the values parsed by an earlier call if the file size and modification time have not changed
         '''
         assert(os.path.exists(idocfullPath))
+        
+        parsed = None
+        if UseCache:
+            parsed = _GetCachedIDocValues(idocfullPath)
+        
+        if parsed is None:
+            # Stat before reading so a file replaced during the read is parsed again next time
+            stats = os.stat(idocfullPath)
+            with open(idocfullPath, 'r') as hIDoc:
+                idocText = hIDoc.read()
+                
+            parsed = ParseIDocValues(idocText)
+            
+            if UseCache:
+                _IDocCache[os.path.abspath(idocfullPath)] = (stats.st_size, stats.st_mtime_ns, parsed)
+        
+        (montageValues, tileValues) = parsed
+        
+        idocObj = IDoc()
+        for (attribute, value) in montageValues:
+            setattr(idocObj, attribute, _CopyIDocValue(value))
+        
+        for (imageFilename, values) in tileValues:
+            tileObj = IDocTileData(imageFilename)
+            for (attribute, value) in values:
+                setattr(tileObj, attribute, _CopyIDocValue(value))
+                
+            idocObj.tiles.append(tileObj)
+                
+        idocObj._SetCameraBpp(CameraBpp)
+        return idocObj
+
+
+# Types of the values SerialEM writes for common keys.  Values of other keys, or values
+# that do not match the expected type, are converted by trying int, then float.
+# Keys such as DateTime are listed as str so they skip the failed conversions.
+IDocValueTypes = {'ImageSeries': int,
+                  'Montage': int,
+                  'DataMode': int,
+                  'ImageSize': int,
+                  'Binning': int,
+                  'PieceCoordinates': int,
+                  'Magnification': int,
+                  'MagIndex': int,
+                  'SpotSize': int,
+                  'PixelSpacing': float,
+                  'TiltAngle': float,
+                  'StagePosition': float,
+                  'StageZ': float,
+                  'Intensity': float,
+                  'ExposureDose': float,
+                  'Defocus': float,
+                  'TargetDefocus': float,
+                  'ImageShift': float,
+                  'RotationAngle': float,
+                  'ExposureTime': float,
+                  'MinMaxMean': float,
+                  'DateTime': str}
+
+_IDocIntPattern = re.compile(r'^[-+]?\d+$')
+
+# Parsed idoc values keyed by path.  Each entry is (file size, modification time, parsed values)
+_IDocCache = {}
+
+
+def _ConvertIDocToken(token):
+    '''Convert a token to an int, then a float, returning the string if neither conversion succeeds'''
+    if _IDocIntPattern.match(token) is not None:
+        return int(token)
+    
+    try:
+        return float(token)
+    except ValueError:
+        return token
 
-        with open(idocfullPath, 'r') as hIDoc:
-            idocText = hIDoc.read()
-
-            idocObj = IDoc()
-
-            #imageStartIndicies = [m.start for m in re.finditer('\[Image', idocText)]
-            #NumImages = len(imageStartIndicies)
-
-            lines = idocText.split('\n')
-
-            tileObj = None  # Set to the last image name we've read in, if None we are reading montage properties
-
-            for iLine in range(0, len(lines)):
-                line = lines[iLine]
-                line = line.strip()
-                line = line.strip('[]')
-                parts = line.split('=')
-                if(len(parts) <= 1):
-                    continue
-
-                attribute = parts[0].strip()
-                # attribute = attribute.lower()
-
-                # If we find an image tag, create a new tiledata
-                if(attribute == 'Image'):
-                    imageFilename = parts[1].strip()
-                    tileObj = IDocTileData(imageFilename)
-                    idocObj.tiles.append(tileObj)
-                else:
-                    value = None
-                    if(len(parts) > 1):
-                        values = parts[1].split()
-
-                        vTemp = values[0].strip()
-                        if vTemp[0].isdigit() or vTemp[0] == '-':
-
-                            # Find out how many attributes we have.
-                            # Try to convert to ints, then to float
-                            ConvertedValues = []
-                            for v in values:
-                                v = v.strip()
-                                convVal = None
-                                
-                                try:
-                                    convVal = int(v)
-                                except ValueError:
-                                    try:
-                                        convVal = float(v)
-                                    except:
-                                        convVal = v
-                                        pass
-                                    pass
-                                                                    
-                                ConvertedValues.append(convVal)
-                                
-                            values = ConvertedValues
-                            if len(values) == 1:
-                                value = values[0]
-                            else:
-                                value = values
-
-                    if not value is None:
-                        if tileObj is None:
-                            setattr(idocObj, attribute, value)
-                            #idocObj.__dict__[attribute] = value
-                        else:
-                            setattr(tileObj, attribute, value) 
-                            
-            idocObj._SetCameraBpp(CameraBpp)
-            return idocObj
 
-        return None
+def _ConvertIDocTokenWithType(token, valueType):
+    '''Convert a token to the expected type.  Integer tokens of float keys remain ints, as they would without a type.'''
+    if valueType is float and '.' not in token and 'e' not in token and 'E' not in token:
+        return int(token)
+    
+    return valueType(token)
+
+
+def ParseIDocValues(idocText):
+    '''
+    Parse the text of an idoc file.
+    :return: A tuple of the montage (attribute, value) pairs and a list of (image filename, [(attribute, value)]) for each tile
+    '''
+    
+    montageValues = []
+    tileValues = []
+    values = montageValues  # The list we are adding to, changes to a tile's list when we find an image tag
+    
+    for line in idocText.split('\n'):
+        line = line.strip().strip('[]')
+        (attribute, sep, text) = line.partition('=')
+        if len(sep) == 0:
+            continue
+        
+        attribute = attribute.strip()
+        text = text.split('=', 1)[0]
+        
+        # If we find an image tag, create a new tiledata
+        if attribute == 'Image':
+            values = []
+            tileValues.append((text.strip(), values))
+            continue
+        
+        tokens = text.split()
+        if len(tokens) == 0:
+            continue
+        
+        # Values that do not start with a number are ignored
+        first = tokens[0][0]
+        if not (first.isdigit() or first == '-'):
+            continue
+        
+        converted = None
+        valueType = IDocValueTypes.get(attribute, None)
+        if valueType is str:
+            converted = tokens
+        elif valueType is int:
+            try:
+                converted = list(map(int, tokens))
+            except ValueError:
+                converted = None
+        elif valueType is not None:
+            try:
+                converted = [_ConvertIDocTokenWithType(t, valueType) for t in tokens]
+            except ValueError:
+                converted = None
+        
+        if converted is None:
+            converted = [_ConvertIDocToken(t) for t in tokens]
+        
+        if len(converted) == 1:
+            values.append((attribute, converted[0]))
+        else:
+            values.append((attribute, converted))
+        
+    return (montageValues, tileValues)
+
+
+def _CopyIDocValue(value):
+    '''Cached lists are copied so changes to a loaded IDoc do not alter the cache'''
+    if isinstance(value, list):
+        return list(value)
+    
+    return value
 
 
+def _GetCachedIDocValues(idocfullPath):
+    entry = _IDocCache.get(os.path.abspath(idocfullPath), None)
+    if entry is None:
+        return None
+    
+    (size, mtime, parsed) = entry
+    stats = os.stat(idocfullPath)
+    if stats.st_size != size or stats.st_mtime_ns != mtime:
+        return None
+    
+    return parsed
@@ -24,11 +24,13 @@ from nornir_shared.files import RemoveOutdatedFile
 import nornir_shared.plot as plot
 import logging
 import collections
+import functools
 import nornir_pools
 import numpy
 import nornir_buildmanager.importers.serialemlog as serialemlog
 import nornir_buildmanager.importers.shared as shared
 import nornir_buildmanager.importers.serialem_utils as serialem_utils
+from nornir_buildmanager.importers import archive, sectionscheduler, watch
 from pyglet.resource import file
 from . import GetFileNameForTileNumber
 
@@ -51,19 +53,51 @@ def Import(VolumeElement, ImportPath, extension=None, *args, **kwargs):
     if len(ContrastMap) == 0:
         nornir_buildmanager.importers.CreateDefaultHistogramCutoffFile(histogramFilename)
         
+    MaxConcurrentSections = kwargs.get('MaxConcurrentSections', 1)
+    InputFiles = kwargs.get('InputFiles', None)
+        
+    SectionImports = []
     DirList = files.RecurseSubdirectoriesGenerator(ImportPath, RequiredFiles="*." + extension, ExcludeNames=[], ExcludedDownsampleLevels=[])
     for path in DirList:
         prettyoutput.CurseString("MRCImport", "Importing *.{0} from {1}".format(extension, path))
         for file_fullpath in glob.glob(os.path.join(path, '*.{0}'.format(extension))):
-            yield from MRCImport.ToMosaic(VolumeElement,
-                                          file_fullpath,
-                                          FlipList=FlipList,
-                                          CameraBpp=CameraBpp,
-                                          ContrastMap=ContrastMap,
-                                          )
+            if not watch.IncludeInputFile(InputFiles, file_fullpath):
+                continue
+            
+            SectionImports.append((file_fullpath, functools.partial(MRCImport.ToMosaic,
+                                                                    VolumeElement,
+                                                                    file_fullpath,
+                                                                    FlipList=FlipList,
+                                                                    CameraBpp=CameraBpp,
+                                                                    ContrastMap=ContrastMap)))
+    
+    # Sections inside .tar and .zip archives are read from the archive without extracting them
+    if InputFiles is None:
+        for member in archive.FindArchivedInputs(ImportPath, extension):
+            SectionImports.append(('{0}:{1}'.format(member.ArchivePath, member.Name),
+                                   functools.partial(MRCImport.ToMosaic,
+                                                     VolumeElement,
+                                                     member,
+                                                     FlipList=FlipList,
+                                                     CameraBpp=CameraBpp,
+                                                     ContrastMap=ContrastMap)))
+    
+    yield from sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections)
     
     nornir_pools.WaitOnAllPools()
 
+def IsCaptureComplete(mrc_fullpath):
+    '''Used by watch mode.  An mrc capture is complete when the file holds every tile its header lists.'''
+    mrcfile = MRCFile.Load(mrc_fullpath)
+    try:
+        if mrcfile.num_tiles == 0:
+            return False
+        
+        return os.path.getsize(mrc_fullpath) >= mrcfile._get_image_offset(mrcfile.num_tiles)
+    finally:
+        mrcfile.close()
+
+
 class MRCImport(object):
     '''
     Imports an .MRC file into a volume
@@ -84,18 +118,26 @@ class MRCImport(object):
         logger = logging.getLogger(__name__ + '.' + str(cls.__name__) + "ToMosaic")
         prettyoutput.CurseString('Stage', "SerialEM to Mosaic " + str(mrc_fullpath))
         
-        mrc_fullpath = serialem_utils.GetPathWithoutSpaces(mrc_fullpath)
+        IsArchived = isinstance(mrc_fullpath, archive.ArchiveMember)
+        if IsArchived:
+            input_dir = None
+            section_filename = mrc_fullpath.Name
+        else:
+            mrc_fullpath = serialem_utils.GetPathWithoutSpaces(mrc_fullpath)
+            input_dir = os.path.dirname(mrc_fullpath)
+            section_filename = mrc_fullpath
         
         SectionNumber = 0
-        input_dir = os.path.dirname(mrc_fullpath)
         
         BlockObj = BlockNode.Create('TEM')
         [saveBlock, BlockObj] = VolumeObj.UpdateOrAddChild(BlockObj)
         if saveBlock:
             (yield VolumeObj)
         
-        mrcfile = MRCFile.Load(mrc_fullpath)
-        ExistingSectionInfo = shared.GetSectionInfo(mrc_fullpath)
+        with sectionscheduler.MetadataUnlocked():
+            mrcfile = MRCFile.Load(mrc_fullpath)
+            
+        ExistingSectionInfo = shared.GetSectionInfo(section_filename)
         SectionNumber = ExistingSectionInfo.number
         SectionPath = ('%' + nornir_buildmanager.templates.Current.SectionFormat) % ExistingSectionInfo.number
         SectionName = ('%' + nornir_buildmanager.templates.Current.SectionFormat) % ExistingSectionInfo.number
@@ -113,6 +155,12 @@ class MRCImport(object):
         if saveChannel:
             (yield sectionObj)
             
+        if IsArchived:
+            # Notes and logs are copied into the channel directory regardless, so copy them there from the archive and read them from the copies
+            with sectionscheduler.MetadataUnlocked():
+                archive.CopySidecarFiles(mrc_fullpath, ['*notes*.*', '*.log'], channelObj.FullPath)
+            input_dir = channelObj.FullPath
+            
         shared.TryAddNotes(channelObj, input_dir, logger)
         serialem_utils.TryAddLogs(channelObj, input_dir, logger)
         
@@ -137,7 +185,7 @@ class MRCImport(object):
         StageTransformFullPath = os.path.join(channelObj.FullPath, StageTransformFilename)
         
         # Check to make sure our stage mosaic file is valid
-        RemoveOutdatedFile(mrc_fullpath, StageTransformFullPath)
+        RemoveOutdatedFile(archive.ContainingFile(mrc_fullpath), StageTransformFullPath)
         
         (added_transform, transformObj) = channelObj.UpdateOrAddChildByAttrib(TransformNode.Create(Name=StageTransformName,
                                                                          Path=StageTransformFilename,
@@ -164,7 +212,8 @@ class MRCImport(object):
             (yield channelObj)
             
         min_max_gamma = cls.GetSectionContrastSettings(mrcfile, SectionNumber, ContrastMap, CameraBpp)
-        cls.ExportImages(mrc_fullpath, LevelObj.FullPath, img_ext=OutputImageExt, min_max_gamma=min_max_gamma)
+        cls.ExportImages(mrcfile, LevelObj.FullPath, img_ext=OutputImageExt, min_max_gamma=min_max_gamma)
+        mrcfile.close()
         
     def __init__(self, params):
         '''
@@ -175,15 +224,24 @@ class MRCImport(object):
     @classmethod
     def ExportImages(cls, mrcfile, output_dir, img_ext, min_max_gamma):
         
-        if isinstance(mrcfile, str):
+        if isinstance(mrcfile, (str, archive.ArchiveMember)):
             mrc_obj = MRCFile.Load(mrcfile)
+        else:
+            mrc_obj = mrcfile
         
         pool = nornir_pools.GetGlobalLocalMachinePool()
         
+        if mrc_obj.streamed:
+            cls.ExportStreamedImages(mrc_obj, output_dir, img_ext, min_max_gamma, pool)
+            return
+        
+        # Workers receive the path and open the file once with GetWorkerMRCFile
+        mrc_fullpath = mrc_obj.filename
+        
         for iTile in range(0, mrc_obj.num_tiles):
             pool.add_task(str(iTile),
                               cls.ExportImage,
-                              mrcfile,
+                              mrc_fullpath,
                               output_dir,
                               img_ext,
                               iTile,
@@ -191,38 +249,68 @@ class MRCImport(object):
             
             #cls.ExportImage(mrcfile, output_dir, img_ext, iTile, min_max_gamma)
             
+    @classmethod
+    def ExportStreamedImages(cls, mrc_obj, output_dir, img_ext, min_max_gamma, pool):
+        '''
+        Compressed archive members can only be read front to back, so tiles are read in order
+        by this process and the pixels are passed to the workers.  The number of tiles waiting
+        on workers is bounded so an entire section is never held in memory.
+        '''
+        
+        MaxQueuedTiles = 2 * (os.cpu_count() or 1)
+        queued = collections.deque()
+        pil_pixel_mode = mrc_obj.pil_pixel_mode if min_max_gamma is None else None
+        
+        for iTile in range(0, mrc_obj.num_tiles):
+            filename = GetFileNameForTileNumber(tile_number=iTile, ext=img_ext)
+            output_fullpath = os.path.join(output_dir, filename)
+            if nornir_shared.images.IsValidImage(output_fullpath):
+                continue
+            
+            while len(queued) >= MaxQueuedTiles:
+                queued.popleft().wait()
+            
+            queued.append(pool.add_task(str(iTile),
+                                        cls.SaveTile,
+                                        numpy.array(mrc_obj.get_tile_as_numpy(iTile)),
+                                        output_fullpath,
+                                        min_max_gamma,
+                                        pil_pixel_mode))
+            
+        while len(queued) > 0:
+            queued.popleft().wait()
+            
     @classmethod
     def ExportImage(cls, mrcfile, output_dir, img_ext, iTile, min_max_gamma=None):
 
-        if isinstance(mrcfile, str):
-            mrcfile = MRCFile.Load(mrcfile)
+        if isinstance(mrcfile, (str, archive.ArchiveMember)):
+            mrcfile = GetWorkerMRCFile(mrcfile)
      
         filename = GetFileNameForTileNumber(tile_number=iTile, ext=img_ext)  # Pillow does not support 16-bit PNG
         output_fullpath = os.path.join(output_dir, filename)
         if nornir_shared.images.IsValidImage(output_fullpath):
             return False
+        
+        pil_pixel_mode = mrcfile.pil_pixel_mode if min_max_gamma is None else None
+        return cls.SaveTile(mrcfile.get_tile_as_numpy(iTile), output_fullpath, min_max_gamma, pil_pixel_mode)
+    
+    @classmethod
+    def SaveTile(cls, img, output_fullpath, min_max_gamma=None, pil_pixel_mode=None):
+        '''
+        Write the pixels of a tile, as returned by MRCFile.get_tile_as_numpy, to an image file
+        '''
 
         if min_max_gamma is None:
-            im = mrcfile.get_tile_as_image(iTile)
+            im = PIL.Image.frombytes(data=img.tobytes(), mode=pil_pixel_mode, size=(img.shape[1], img.shape[0]))
+            im = im.convert(mode='I')
             im.save(output_fullpath,compress_level=1)
         else:
-            #This mess is here because we can't really trust the min/max pixel values reported in the MRC file for a lot of our old data
-            #t = mrcfile._repair_out_of_bounds_pixels(iTile, 14)
-            img = mrcfile.get_tile_as_numpy(iTile)
-            dt = img.dtype
             img = numpy.transpose(img)
-
-            #Quick correct out of bounds pixels
-            outliers = img > min_max_gamma.max
-            img = numpy.copy(img).astype(numpy.float32)
-            img[outliers] = img[outliers] / 2.0 
-            scale = numpy.iinfo(dt).max / min_max_gamma.max
-            if min_max_gamma.min > 0:
-                img = (img - min_max_gamma.min) * scale
+            
+            if cls.CanUseContrastLookupTable(img.dtype):
+                img = cls.ApplyContrastLookupTable(img, min_max_gamma)
             else:
-                img = img * scale
-
-            img = img.round().astype(dt)
+                img = cls.ApplyContrast(img, min_max_gamma)
 
             im = Image.fromarray(img).convert(mode='I')
             im.save(output_fullpath,compress_level=1)
@@ -232,6 +320,84 @@ class MRCImport(object):
 
         return True
 
+    @staticmethod
+    def ApplyContrast(img, min_max_gamma):
+        '''
+        Rescale the pixels of a tile to the full range of its dtype using floating point math
+        '''
+        #This mess is here because we can't really trust the min/max pixel values reported in the MRC file for a lot of our old data
+        #t = mrcfile._repair_out_of_bounds_pixels(iTile, 14)
+        dt = img.dtype
+        
+        #Quick correct out of bounds pixels
+        outliers = img > min_max_gamma.max
+        img = numpy.copy(img).astype(numpy.float32)
+        img[outliers] = img[outliers] / 2.0 
+        scale = numpy.iinfo(dt).max / min_max_gamma.max
+        if min_max_gamma.min > 0:
+            img = (img - min_max_gamma.min) * scale
+        else:
+            img = img * scale
+
+        return img.round().astype(dt)
+    
+    @staticmethod
+    def CanUseContrastLookupTable(dtype):
+        '''
+        :return: True if every value of the dtype can be mapped with a lookup table of reasonable size
+        '''
+        dtype = numpy.dtype(dtype)
+        return dtype.kind in 'ui' and dtype.itemsize <= 2
+    
+    @staticmethod
+    def GetContrastLookupTable(dtype, min_max_gamma):
+        '''
+        Return an array mapping every value of an 8 or 16-bit integer dtype to the value ApplyContrast
+        produces for it.  The most recently used tables are cached by the process.
+        Results that do not fit in the dtype are clipped to its range.
+        '''
+        dtype = numpy.dtype(dtype).newbyteorder('=')
+        key = (dtype.str, min_max_gamma)
+        lut = _ContrastLookupTables.pop(key, None)
+        if lut is not None:
+            _ContrastLookupTables[key] = lut
+            return lut
+        
+        unsigned_dtype = numpy.dtype('u{0}'.format(dtype.itemsize))
+        values = numpy.arange(1 << (8 * dtype.itemsize), dtype=numpy.int64).astype(unsigned_dtype).view(dtype)
+        
+        # Same float32 operations as ApplyContrast so both paths round identically
+        mapped = values.astype(numpy.float32)
+        outliers = mapped > min_max_gamma.max
+        mapped[outliers] = mapped[outliers] / 2.0
+        scale = numpy.iinfo(dtype).max / min_max_gamma.max
+        if min_max_gamma.min > 0:
+            mapped = (mapped - min_max_gamma.min) * scale
+        else:
+            mapped = mapped * scale
+        
+        dtype_info = numpy.iinfo(dtype)
+        lut = numpy.clip(numpy.round(mapped), dtype_info.min, dtype_info.max).astype(dtype)
+        
+        while len(_ContrastLookupTables) >= MaxContrastLookupTables:
+            _ContrastLookupTables.popitem(last=False)
+        
+        _ContrastLookupTables[key] = lut
+        return lut
+        
+    @classmethod
+    def ApplyContrastLookupTable(cls, img, min_max_gamma):
+        '''
+        Rescale the pixels of an 8 or 16-bit integer tile in a single pass with a lookup table.
+        Only the output tile is allocated, unless the tile's byte order does not match the system.
+        '''
+        if not img.dtype.isnative:
+            img = img.astype(img.dtype.newbyteorder('='))
+        
+        lut = cls.GetContrastLookupTable(img.dtype, min_max_gamma)
+        unsigned_dtype = numpy.dtype('u{0}'.format(img.dtype.itemsize))
+        return numpy.take(lut, img.view(unsigned_dtype))
+
     @classmethod
     def GetSectionContrastSettings(cls, mrcfile, SectionNumber, ContrastMap, CameraBpp):
         '''Clear and recreate the filters tile pyramid node if the filters contrast node does not match'''
@@ -268,6 +434,48 @@ class MRCImport(object):
         mosaic.TranslateToZeroOrigin()
         return mosaic
 
+
+# Contrast lookup tables built by this process, keyed by dtype and MinMaxGamma, least recently used first
+_ContrastLookupTables = collections.OrderedDict()
+
+# Number of contrast lookup tables each process keeps.  Sections usually share one contrast setting.
+MaxContrastLookupTables = 4
+
+# MRCFile objects opened by this process, keyed by path, least recently used first.
+# Each pool worker is a separate process, so every worker parses a header and maps the data once.
+_WorkerMRCFiles = collections.OrderedDict()
+
+# Number of MRCFile objects each process keeps open.  Workers export the tiles of one section at a time.
+MaxWorkerMRCFiles = 2
+
+
+def GetWorkerMRCFile(mrc_fullpath):
+    '''
+    Return an MRCFile for the path that is reused by every tile this process exports.
+    The file is loaded again if its size or modification time has changed.  Only the
+    most recently used files stay open, others are closed.
+    :param mrc_fullpath: Path to an .mrc file or an archive.ArchiveMember
+    '''
+    stats = os.stat(archive.ContainingFile(mrc_fullpath))
+    key = (stats.st_size, stats.st_mtime_ns)
+    
+    entry = _WorkerMRCFiles.pop(mrc_fullpath, None)
+    if entry is not None:
+        (cached_key, mrc_obj) = entry
+        if cached_key == key:
+            _WorkerMRCFiles[mrc_fullpath] = entry
+            return mrc_obj
+        
+        mrc_obj.close()
+    
+    while len(_WorkerMRCFiles) >= MaxWorkerMRCFiles:
+        (_, evicted_obj) = _WorkerMRCFiles.popitem(last=False)[1]
+        evicted_obj.close()
+    
+    mrc_obj = MRCFile.Load(mrc_fullpath)
+    _WorkerMRCFiles[mrc_fullpath] = (key, mrc_obj)
+    return mrc_obj
+
     
 class MRCFile(object):
     '''
@@ -290,14 +498,33 @@ class MRCFile(object):
     
     @classmethod
     def Load(cls, filename):
-        '''Read the header of an MRC file from disk and return an object for access'''
-         
-        mrc = open(filename, 'rb');
+        '''Read the header of an MRC file from disk and return an object for access
+        :param filename: Path to an .mrc file or an archive.ArchiveMember
+        '''
+        
+        data_offset = 0
+        streamed = False
+        if isinstance(filename, archive.ArchiveMember):
+            data_offset = archive.GetStoredDataOffset(filename)
+            if data_offset is None:
+                data_offset = 0
+                streamed = True
+                mrc = archive.OpenMember(filename)
+            else:
+                # Uncompressed members are read directly from the archive file
+                mrc = open(filename.ArchivePath, 'rb')
+                mrc.seek(data_offset)
+        else:
+            mrc = open(filename, 'rb');
         
         # The mrc file header is always 1024, mostly empty space
         Header = mrc.read(cls.HeaderLength);
         IsBigEndian = cls.IsBigEndian(Header)
         obj = MRCFile(mrc, IsBigEndian)
+        obj.filename = filename
+        obj.data_offset = data_offset
+        obj.streamed = streamed
+        obj._tiles_unavailable = streamed
           
         (obj.img_XDim, obj.img_YDim, obj.num_tiles, obj.img_pixel_mode) = struct.unpack(obj.EndianChar + 'IIII', Header[0x00:0x10])
         
@@ -437,13 +664,47 @@ class MRCFile(object):
         image_offset = first_image_offset + (image_byte_size * iTile)
         return image_offset
              
+    @property
+    def tiles(self):
+        '''
+        A read-only memory map over the image data with shape (num_tiles, XDim, YDim).
+        None if the data cannot be mapped, in which case tiles are read with seek/read.
+        '''
+        if self._tiles is None and not self._tiles_unavailable:
+            try:
+                dtype = numpy.dtype(self.pixel_dtype)
+                if dtype.itemsize != self.bytes_per_pixel:
+                    raise ValueError("Pixel mode {0} cannot be memory mapped".format(self.img_pixel_mode))
+                
+                self._tiles = numpy.memmap(archive.ContainingFile(self.filename), dtype=dtype, mode='r',
+                                           offset=self.data_offset + self._get_image_offset(0),
+                                           shape=(self.num_tiles, self.img_XDim, self.img_YDim))
+            except (ValueError, OSError) as e:
+                logging.getLogger(__name__ + '.MRCFile').warning("Unable to memory map {0}, reading tiles from file instead: {1}".format(self.filename, str(e)))
+                self._tiles_unavailable = True
+            
+        return self._tiles
+    
+    def close(self):
+        '''
+        Release the memory map and file handle
+        '''
+        self._tiles = None
+        if self.mrc is not None:
+            self.mrc.close()
+            self.mrc = None
+             
     def get_tile_as_bytes(self, iTile):
         '''
         Return bytes
         '''
+        tiles = self.tiles
+        if tiles is not None:
+            return tiles[iTile].tobytes()
+        
         image_offset = self._get_image_offset(iTile)
         
-        self.mrc.seek(image_offset)
+        self.mrc.seek(self.data_offset + image_offset)
         image_byte_length = self.image_length_in_bytes
         image_bytes = self.mrc.read(image_byte_length)
         while len(image_bytes) < image_byte_length:
@@ -478,7 +739,7 @@ class MRCFile(object):
         :param bytes old_values: The current values at the pixels to be corrected.  Function will raise an exception if the expected value doesn't match.  Useful in debugging and development to ensure the correct pixels are being updated 
         '''
         
-        tile_offset = self._get_image_offset(iTile)
+        tile_offset = self.data_offset + self._get_image_offset(iTile)
         for (i, iPixel) in enumerate(iPixels):
             error_offset = tile_offset + (self.bytes_per_pixel * iPixel)
             iValueOffset = i * self.bytes_per_pixel
@@ -502,6 +763,10 @@ class MRCFile(object):
         '''
         Return a numpy array
         '''
+        tiles = self.tiles
+        if tiles is not None:
+            return tiles[iTile]
+        
         image_bytes = self.get_tile_as_bytes(iTile)
         img = numpy.frombuffer(image_bytes, dtype=self.pixel_dtype, count=self.img_shape.prod()).reshape(self.img_shape)
         return img
@@ -516,7 +781,7 @@ class MRCFile(object):
         return im
           
     def ReadTileMeta(self, mrc, iTile):
-        mrc.seek(MRCFile.HeaderLength + (iTile * self.tile_header_size))
+        mrc.seek(self.data_offset + MRCFile.HeaderLength + (iTile * self.tile_header_size))
         TileHeader = mrc.read(self.tile_header_size) 
         while len(TileHeader) < self.tile_header_size:
             TileHeader = TileHeader + mrc.read(self.tile_header_size - len(TileHeader));
@@ -532,6 +797,9 @@ class MRCFile(object):
         
     def __init__(self, mrc, isBigEndian=False):
         self.mrc = mrc 
+        self.filename = None
+        self.data_offset = 0  # Offset of the mrc data in the file, non-zero when reading from an archive
+        self.streamed = False  # True if the file can only be read front to back, such as a compressed archive member
         self.IsBigEndian = isBigEndian  # True for big-endian
         
         self.img_XDim = None
@@ -557,6 +825,9 @@ class MRCFile(object):
         self.tile_header_flags = None
         
         self.tile_meta = []
+        
+        self._tiles = None  # Memory map over the image data, created on first use
+        self._tiles_unavailable = False
 
         
 class MRCTileHeaderFlags(enum.IntFlag):
@@ -32,6 +32,7 @@ Example:
 
 '''
 
+import functools
 import glob
 import logging
 import os
@@ -45,11 +46,14 @@ from nornir_buildmanager.importers import filenameparser, GetFlipList
 from nornir_buildmanager.operations.tile import VerifyTiles
 import nornir_imageregistration
 from nornir_imageregistration import image_stats
+import nornir_pools
+from PIL import Image
 from nornir_imageregistration.files import mosaicfile
 import nornir_shared.files
 from nornir_shared.images import *
 
 from .filenameparser import ParseFilename, mapping
+from . import sectionscheduler, watch
 import nornir_shared.prettyoutput as prettyoutput
 
 
@@ -60,14 +64,30 @@ def Import(VolumeElement, ImportPath, scaleValueInNm, extension=None, *args, **k
         extension = 'idoc'
 
 
+    MaxConcurrentSections = kwargs.pop('MaxConcurrentSections', 1)
+    InputFiles = kwargs.pop('InputFiles', None)
+
+    SectionImports = []
     DirList = nornir_shared.files.RecurseSubdirectoriesGenerator(ImportPath, RequiredFiles="*." + extension, ExcludeNames=[], ExcludedDownsampleLevels=[])
     for path in DirList:
         for idocFullPath in glob.glob(os.path.join(path, '*.' + extension)):
-            PMGImport.ToMosaic(VolumeElement, idocFullPath, scaleValueInNm, VolumeElement.FullPath, *args, **kwargs)
+            if not watch.IncludeInputFile(InputFiles, idocFullPath):
+                continue
+            
+            SectionImports.append((idocFullPath, functools.partial(_ImportPMGSection, VolumeElement, idocFullPath, scaleValueInNm, VolumeElement.FullPath, *args, **kwargs)))
+
+    for unused in sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections):
+        pass
 
     return VolumeElement
 
 
+def _ImportPMGSection(*args, **kwargs):
+    '''ToMosaic returns the section number and channel name, which are not meta-data to save'''
+    PMGImport.ToMosaic(*args, **kwargs)
+    return None
+
+
 DEBUG = False
 
 '''#PMG Files are expected to have this naming convention:
@@ -192,6 +212,10 @@ class PMGImport(object):
             raise Exception("No tiles found within PMG file")
     
         NumImages = len(Tiles)
+        
+        # Read tile sizes for the .mosaic file while the meta-data and output directories are prepared.
+        # ConvertImagesInDict opens each tile itself and does not take known sizes.
+        SizeTasks = ProbeImageSizes([os.path.join(PMGDir, inputTile) for inputTile in Tiles.keys()])
     
         # Create a filter and mosaic
         FilterName = 'Raw' + str(TargetBpp)
@@ -239,16 +263,47 @@ class PMGImport(object):
                 InputTileToOutputTile[InputTileFullPath] = OutputTileFullPath
     
             PngTiles[pngMosaicTile] = Tiles[inputTile]
-            (Height, Width) = nornir_imageregistration.GetImageSize(InputTileFullPath)
+            (Height, Width) = SizeTasks[InputTileFullPath].wait_return()
             imageSize.append((Width, Height))
     
-        nornir_imageregistration.ConvertImagesInDict(InputTileToOutputTile, Flip=False, OutputBpp=TargetBpp)
-    
-        if not os.path.exists(transformObj.FullPath):
-            mosaicfile.MosaicFile.Write(transformObj.FullPath, PngTiles, Flip=Flip, ImageSize=imageSize)
+        with sectionscheduler.MetadataUnlocked():
+            nornir_imageregistration.ConvertImagesInDict(InputTileToOutputTile, Flip=False, OutputBpp=TargetBpp)
+        
+            if not os.path.exists(transformObj.FullPath):
+                mosaicfile.MosaicFile.Write(transformObj.FullPath, PngTiles, Flip=Flip, ImageSize=imageSize)
     
         return [PMG.Section, ChannelName]
 
+def ProbeImageSizes(ImageFullPaths):
+    '''
+    Start reading the size of each image from its header on the global thread pool
+    :return: Dictionary mapping each path to a task returning (Height, Width)
+    '''
+    
+    pool = nornir_pools.GetGlobalThreadPool()
+    
+    SizeTasks = {}
+    for ImageFullPath in ImageFullPaths:
+        if ImageFullPath in SizeTasks:
+            continue
+        
+        SizeTasks[ImageFullPath] = pool.add_task(ImageFullPath, ReadImageSizeFromHeader, ImageFullPath)
+        
+    return SizeTasks
+
+
+def ReadImageSizeFromHeader(ImageFullPath):
+    '''
+    :return: (Height, Width) of the image.  Pillow reads only the header when opening a file.
+    '''
+    try:
+        with Image.open(ImageFullPath) as im:
+            (Width, Height) = im.size
+            return (Height, Width)
+    except IOError:
+        return nornir_imageregistration.GetImageSize(ImageFullPath)
+
+
 def ParsePMG(filename, TileOverlapPercent=None):
 
     if TileOverlapPercent is None:
@@ -7,6 +7,7 @@ Created on Apr 15, 2013
 '''Image files are expected to have this naming convention:
     Section#_Channel_Comments'''
 
+import functools
 import glob
 import logging
 import os
@@ -15,7 +16,7 @@ import sys
 
 from nornir_buildmanager import metadatautils
 from nornir_buildmanager.VolumeManagerETree import *
-from nornir_buildmanager.importers import filenameparser
+from nornir_buildmanager.importers import archive, filenameparser, sectionscheduler, watch
 import nornir_shared.files
 
 from .filenameparser import ParseFilename, mapping
@@ -42,12 +43,24 @@ def Import(VolumeElement, ImportPath, scaleValueInNm, extension=None, *args, **k
     if extension is None:
         extension = 'png'
 
+    MaxConcurrentSections = kwargs.pop('MaxConcurrentSections', 1)
+    InputFiles = kwargs.pop('InputFiles', None)
+
+    SectionImports = []
     DirList = nornir_shared.files.RecurseSubdirectoriesGenerator(ImportPath, RequiredFiles="*.%s" % extension)
     for path in DirList:
         for idocFullPath in glob.glob(os.path.join(path, '*.' + extension)):
-            result = SectionImage.ToMosaic(VolumeElement, idocFullPath, scaleValueInNm, VolumeElement.FullPath, *args, **kwargs)
-            if result is not None:
-                yield result
+            if not watch.IncludeInputFile(InputFiles, idocFullPath):
+                continue
+            
+            SectionImports.append((idocFullPath, functools.partial(SectionImage.ToMosaic, VolumeElement, idocFullPath, scaleValueInNm, VolumeElement.FullPath, *args, **kwargs)))
+
+    # Images inside .tar and .zip archives are copied into the volume straight from the archive
+    if InputFiles is None:
+        for member in archive.FindArchivedInputs(ImportPath, extension):
+            SectionImports.append(('{0}:{1}'.format(member.ArchivePath, member.Name), functools.partial(SectionImage.ToMosaic, VolumeElement, member, scaleValueInNm, VolumeElement.FullPath, *args, **kwargs)))
+
+    yield from sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections)
 
 
 class SectionImage(object):
@@ -80,6 +93,8 @@ class SectionImage(object):
 
         # Find the files with a .pmg extension
         filename = InputPath
+        if isinstance(InputPath, archive.ArchiveMember):
+            filename = InputPath.Name
  
         if 'histogram' in filename.lower():
             prettyoutput.Log("PNG importer ignoring probable histogram file: " + filename)
@@ -135,7 +150,11 @@ class SectionImage(object):
         os.makedirs(os.path.dirname(imageNode.FullPath), exist_ok=True)
 
         prettyoutput.Log("Copying file: " + imageNode.FullPath)
-        shutil.copy(filename, imageNode.FullPath)
+        with sectionscheduler.MetadataUnlocked():
+            if isinstance(InputPath, archive.ArchiveMember):
+                archive.CopyMember(InputPath, imageNode.FullPath)
+            else:
+                shutil.copy(filename, imageNode.FullPath)
 
         if addedBlock:
             return VolumeObj
@@ -0,0 +1,93 @@
+'''
+Created on Oct 19, 2026
+
+Imports several sections at once.
+
+Each section is imported by a callable that returns None, a meta-data node to save, or a generator
+of nodes to save, which covers the ToMosaic functions of every importer.  Sections run on a bounded
+thread pool and the nodes they produce are yielded to the pipeline as each section produces them.
+
+The volume meta-data is not thread safe, so section imports run while holding the lock in
+:py:mod:`nornir_buildmanager.metadatalock`.  Importers release the lock with :py:func:`MetadataUnlocked`
+around work that only reads and writes image files, such as decoding and converting tiles.  Those
+regions are where sections overlap.  When only one section is imported at a time the lock is never
+contended and imports behave exactly as they did before this module existed.
+'''
+
+import logging
+import queue
+import types
+
+import nornir_pools
+from nornir_buildmanager.metadatalock import MetadataLocked, MetadataUnlocked
+
+# Marks the end of a section in the queue of results
+_SectionComplete = object()
+
+
+class _SectionFailed(object):
+
+    def __init__(self, Name, Error):
+        self.Name = Name
+        self.Error = Error
+
+
+def _RunSectionImport(Name, SectionImport, Results):
+    '''Run a section import on a worker thread and queue the nodes it produces'''
+    try:
+        with MetadataLocked():
+            result = SectionImport()
+            if isinstance(result, types.GeneratorType):
+                for node in result:
+                    if not node is None:
+                        Results.put(node)
+            elif not result is None:
+                Results.put(result)
+    except Exception as e:
+        Results.put(_SectionFailed(Name, e))
+    finally:
+        Results.put(_SectionComplete)
+
+
+def ImportSections(SectionImports, MaxConcurrentSections=1):
+    '''
+    Run section imports and yield the meta-data nodes they produce.
+    :param list SectionImports: List of (Name, callable) tuples.  Each callable imports one section.
+    :param int MaxConcurrentSections: Maximum number of sections imported at once.  Sections are imported in order on the calling thread if less than two.
+    '''
+
+    if MaxConcurrentSections is None or MaxConcurrentSections < 2:
+        for (Name, SectionImport) in SectionImports:
+            result = SectionImport()
+            if isinstance(result, types.GeneratorType):
+                yield from result
+            elif not result is None:
+                yield result
+
+        return
+
+    Logger = logging.getLogger(__name__ + '.ImportSections')
+
+    Results = queue.Queue()
+    pool = nornir_pools.GetThreadPool('SectionImport', num_threads=MaxConcurrentSections)
+
+    NumRunning = 0
+    for (Name, SectionImport) in SectionImports:
+        pool.add_task(Name, _RunSectionImport, Name, SectionImport, Results)
+        NumRunning += 1
+
+    Failures = []
+    while NumRunning > 0:
+        result = Results.get()
+        if result is _SectionComplete:
+            NumRunning -= 1
+        elif isinstance(result, _SectionFailed):
+            Logger.error("Import of %s failed: %s" % (result.Name, str(result.Error)))
+            Failures.append(result)
+        else:
+            # Sections continue on other threads once we yield, so hold the lock while the node is saved
+            with MetadataLocked():
+                yield result
+
+    if len(Failures) > 0:
+        raise Failures[0].Error
@@ -7,11 +7,12 @@ Parses SerialEM log files and plots drift and settle times
 '''
 
 import sys
-import pickle
 import os
 import datetime
+import numpy
 import nornir_shared.files as files
 import nornir_shared.plot as plot
+from nornir_buildmanager.plotting import PlotLock
 
 
 class LogTileData(object):
@@ -81,14 +82,153 @@ class LogTileData(object):
         self.coordinates = None
 
 
+class LogTileColumns(object):
+    '''
+    The tile data of a log stored as NumPy arrays with one entry per tile, sorted by tile number.
+    Times, and coordinates, that were not logged are NaN.  The drift measurements of tile i are
+    drift_time[drift_offsets[i]:drift_offsets[i+1]] and drift_value[drift_offsets[i]:drift_offsets[i+1]].
+    '''
+
+    ArrayNames = ('number', 'start_time', 'end_time', 'stage_stop_time', 'coordinates',
+                  'drift_offsets', 'drift_time', 'drift_value', 'drift_units')
+
+    @staticmethod
+    def _TimeOrNaN(value):
+        if value is None:
+            return numpy.nan
+
+        return value
+
+    @classmethod
+    def FromTiles(cls, tiles):
+        '''
+        :param list tiles: LogTileData objects
+        '''
+        tiles = sorted(tiles, key=lambda t: t.number)
+
+        obj = LogTileColumns()
+        obj.number = numpy.asarray([t.number for t in tiles], dtype=numpy.int64)
+        obj.start_time = numpy.asarray([cls._TimeOrNaN(t.startTime) for t in tiles], dtype=numpy.float64)
+        obj.end_time = numpy.asarray([cls._TimeOrNaN(t.endTime) for t in tiles], dtype=numpy.float64)
+        obj.stage_stop_time = numpy.asarray([cls._TimeOrNaN(t.stageStopTime) for t in tiles], dtype=numpy.float64)
+        obj.coordinates = numpy.asarray([(numpy.nan, numpy.nan) if t.coordinates is None else t.coordinates for t in tiles], dtype=numpy.float64).reshape((len(tiles), 2))
+
+        obj.drift_offsets = numpy.zeros(len(tiles) + 1, dtype=numpy.int64)
+        obj.drift_offsets[1:] = numpy.cumsum([len(t.driftStamps) for t in tiles])
+
+        stamps = [s for t in tiles for s in t.driftStamps]
+        obj.drift_time = numpy.asarray([s[0] for s in stamps], dtype=numpy.float64)
+        obj.drift_value = numpy.asarray([s[1] for s in stamps], dtype=numpy.float64)
+        obj.drift_units = numpy.asarray(['' if t.driftUnits is None else t.driftUnits for t in tiles], dtype=numpy.str_)
+        return obj
+
+    @classmethod
+    def FromArrays(cls, arrays):
+        '''
+        :param dict arrays: Arrays keyed by the names in ArrayNames, such as a loaded .npz file
+        '''
+        obj = LogTileColumns()
+        for name in cls.ArrayNames:
+            setattr(obj, name, arrays[name])
+
+        return obj
+
+    def ToArrays(self):
+        return {name: getattr(self, name) for name in LogTileColumns.ArrayNames}
+
+    def ToTiles(self):
+        '''
+        :return: Dictionary mapping tile number to LogTileData
+        '''
+        tileData = {}
+        for i in range(0, len(self)):
+            t = LogTileData(self._FloatOrNone(self.start_time[i]))
+            t.endTime = self._FloatOrNone(self.end_time[i])
+            t.stageStopTime = self._FloatOrNone(self.stage_stop_time[i])
+            t.number = int(self.number[i])
+
+            if not numpy.isnan(self.coordinates[i, 0]):
+                t.coordinates = (int(self.coordinates[i, 0]), int(self.coordinates[i, 1]))
+
+            (start, end) = (self.drift_offsets[i], self.drift_offsets[i + 1])
+            t.driftStamps = list(zip(self.drift_time[start:end].tolist(), self.drift_value[start:end].tolist()))
+            if len(self.drift_units[i]) > 0:
+                t.driftUnits = str(self.drift_units[i])
+
+            tileData[t.number] = t
+
+        return tileData
+
+    @staticmethod
+    def _FloatOrNone(value):
+        if numpy.isnan(value):
+            return None
+
+        return float(value)
+
+    def __len__(self):
+        return self.number.shape[0]
+
+    @property
+    def num_drift_measurements(self):
+        return numpy.diff(self.drift_offsets)
+
+    @property
+    def drift(self):
+        '''The last drift measurement of each tile, NaN if the tile has no measurements'''
+        drift = numpy.full(len(self), numpy.nan)
+        has_drift = self.num_drift_measurements > 0
+        drift[has_drift] = self.drift_value[self.drift_offsets[1:][has_drift] - 1]
+        return drift
+
+    @property
+    def total_time(self):
+        return self.end_time - self.start_time
+
+    @property
+    def dwell_time(self):
+        return self.end_time - self.stage_stop_time
+
+    @property
+    def valid(self):
+        '''True for tiles with a dwell time and drift measurement, the tiles included in capture statistics'''
+        return numpy.logical_and(~numpy.isnan(self.dwell_time), self.num_drift_measurements > 0)
+
+    def DriftLines(self, mask):
+        '''
+        :param ndarray mask: Boolean mask of tiles to include
+        :return: List of (time, drift) arrays for each tile in the mask
+        '''
+        times = numpy.split(self.drift_time, self.drift_offsets[1:-1])
+        drifts = numpy.split(self.drift_value, self.drift_offsets[1:-1])
+        return [(times[i], drifts[i]) for i in numpy.flatnonzero(mask)]
+
+
 class SerialEMLog(object):
 
     @classmethod
     def __ObjVersion(cls):
-        '''Used for knowing when to ignore a pickled file'''
+        '''Used for knowing when to ignore a cached file'''
 
         # Version 2 fixes missing tile drift times for the first tile in a hemisphere
-        return 4
+        # Version 5 stores tile data as NumPy arrays
+        return 5
+
+    @property
+    def tileData(self):
+        '''Dictionary mapping tile number to LogTileData'''
+        if self._tileData is None:
+            self._tileData = self._columns.ToTiles()
+
+        return self._tileData
+
+    @property
+    def Columns(self):
+        '''The tile data as LogTileColumns'''
+        if self._columns is None:
+            self._columns = LogTileColumns.FromTiles(self._tileData.values())
+
+        return self._columns
 
     @property
     def TotalTime(self):
@@ -97,24 +237,26 @@ class SerialEMLog(object):
 
     @property
     def AverageTileTime(self):
-        if len(self.tileData) == 0:
+        if len(self.Columns) == 0:
             return None
         
         if self._avg_tile_time is None:
-            TotalTimes = [t.totalTime for t in self.tileData.values()]
-            total = sum(TotalTimes)
-            self._avg_tile_time = total / len(self.tileData)  
+            self._avg_tile_time = float(numpy.mean(self.Columns.total_time))
             
         return self._avg_tile_time
 
     @property
     def AverageTileDrift(self):
-        if len(self.tileData) == 0:
+        if len(self.Columns) == 0:
             return None
         
         if self._avg_tile_drift is None:
-            drift_time = [t.drift for t in self.tileData.values() if t is not None]
-            self._avg_tile_drift = sum(drift_time) / len(drift_time)
+            drift = self.Columns.drift
+            drift = drift[~numpy.isnan(drift)]
+            if len(drift) == 0:
+                return None
+            
+            self._avg_tile_drift = float(numpy.mean(drift))
     
         return self._avg_tile_drift
 
@@ -123,12 +265,9 @@ class SerialEMLog(object):
         '''Shortest time to capture a tile in seconds'''
 
         if self._fastestTime is None:
-            for t in list(self.tileData.values()):
-                if not (t.dwellTime is None or t.drift is None):
-                    if self._fastestTime is None:
-                        self._fastestTime = t.totalTime
-                    else:
-                        self._fastestTime = min(self._fastestTime, t.totalTime)
+            valid = self.Columns.valid
+            if numpy.any(valid):
+                self._fastestTime = float(numpy.min(self.Columns.total_time[valid]))
 
         return self._fastestTime
 
@@ -137,9 +276,9 @@ class SerialEMLog(object):
         '''Largest drift for a tile in seconds'''
         if self._maxdrift is None:
             self._maxdrift = 0
-            for t in list(self.tileData.values()):
-                if not (t.dwellTime is None or t.drift is None):
-                    self._maxdrift = max(self._maxdrift, t.driftStamps[-1][1])
+            valid = self.Columns.valid
+            if numpy.any(valid):
+                self._maxdrift = max(self._maxdrift, float(numpy.max(self.Columns.drift[valid])))
 
         return self._maxdrift
 
@@ -148,17 +287,16 @@ class SerialEMLog(object):
         '''Largest drift for a tile in seconds'''
         if self._mindrift is None:
             self._mindrift = self.MaxTileDrift + 1
-            for t in list(self.tileData.values()):
-                if not (t.dwellTime is None or t.drift is None):
-                    self._mindrift = min(self._mindrift, t.driftStamps[-1][1])
+            valid = self.Columns.valid
+            if numpy.any(valid):
+                self._mindrift = min(self._mindrift, float(numpy.min(self.Columns.drift[valid])))
 
         return self._mindrift
 
     @property
     def NumTiles(self): 
         if self._num_tiles is None: 
-            IsTile = [not (t.dwellTime is None or t.drift is None) for t in self.tileData.values()]
-            self._num_tiles = sum(IsTile)
+            self._num_tiles = int(numpy.count_nonzero(self.Columns.valid))
         
         return self._num_tiles
 
@@ -171,7 +309,8 @@ class SerialEMLog(object):
         return self._version
 
     def __init__(self):
-        self.tileData = {}  # The time required to capture each tile
+        self._tileData = {}  # The time required to capture each tile, built from _columns when loaded from the cache
+        self._columns = None  # LogTileColumns, built from _tileData on first use
         self._startup = None  # SerialEM program Startup time, if known
         self._version = None  # SerialEM version, if known
         self.PropertiesVersion = None  # Timestamp of properties file, if known
@@ -186,26 +325,38 @@ class SerialEMLog(object):
         self._maxdrift = None
         self._mindrift = None
 
-        self.__SerialEMLogVersion = SerialEMLog._SerialEMLog__ObjVersion()
+    # Attributes saved in the cache with the tile columns
+    _CachedAttributes = ('PropertiesVersion', '_startup', '_version', 'MontageStart', 'MontageEnd')
+
+    @classmethod
+    def __CachePath(cls, logfullPath):
+        return logfullPath + ".npz"
 
     @classmethod
-    def __PickleLoad(cls, logfullPath):
+    def __CacheLoad(cls, logfullPath):
 
         obj = None
-        picklePath = logfullPath + ".pickle"
+        cachePath = cls.__CachePath(logfullPath)
 
-        files.RemoveOutdatedFile(logfullPath, picklePath)
+        files.RemoveOutdatedFile(logfullPath, cachePath)
 
-        if os.path.exists(picklePath):
+        if os.path.exists(cachePath):
             try:
-                with open(picklePath, 'r') as filehandle:
-                    obj = pickle.load(filehandle)
-
-                    if obj.__SerialEMLogVersion != SerialEMLog._SerialEMLog__ObjVersion():
-                        raise Exception("Version mismatch in pickled file: " + picklePath)
+                with numpy.load(cachePath, allow_pickle=False) as arrays:
+                    if int(arrays['version']) != SerialEMLog._SerialEMLog__ObjVersion():
+                        raise Exception("Version mismatch in cached file: " + cachePath)
+
+                    obj = SerialEMLog()
+                    obj._tileData = None
+                    obj._columns = LogTileColumns.FromArrays({name: arrays[name] for name in LogTileColumns.ArrayNames})
+
+                    # Values that were None are saved as empty arrays
+                    for name in cls._CachedAttributes:
+                        value = arrays[name]
+                        setattr(obj, name, value.item() if value.size > 0 else None)
             except Exception:
                 try:
-                    os.remove(picklePath)
+                    os.remove(cachePath)
                 except Exception:
                     pass
 
@@ -213,16 +364,22 @@ class SerialEMLog(object):
 
         return obj
 
-    def __PickleSave(self, logfullPath):
+    def __CacheSave(self, logfullPath):
  
-        picklePath = logfullPath + ".pickle"
+        cachePath = SerialEMLog.__CachePath(logfullPath)
+
+        arrays = self.Columns.ToArrays()
+        arrays['version'] = numpy.asarray(SerialEMLog._SerialEMLog__ObjVersion())
+        for name in SerialEMLog._CachedAttributes:
+            value = getattr(self, name)
+            arrays[name] = numpy.asarray([] if value is None else value)
 
         try:
-            with open(picklePath, 'w') as filehandle:
-                pickle.dump(self, filehandle)
+            with open(cachePath, 'wb') as filehandle:
+                numpy.savez(filehandle, **arrays)
         except:
             try:
-                os.remove(picklePath)
+                os.remove(cachePath)
             except:
                 pass
 
@@ -253,7 +410,7 @@ class SerialEMLog(object):
         # Parsing these logs takes quite a while sometimes
 
         if usecache:
-            obj = cls.__PickleLoad(logfullPath)
+            obj = cls.__CacheLoad(logfullPath)
 
             if not obj is None:
                 return obj
@@ -378,7 +535,7 @@ class SerialEMLog(object):
             if Data.MontageEnd is None and not LastValidTimestamp is None:
                 Data.MontageEnd = LastValidTimestamp
 
-        Data.__PickleSave(logfullPath)
+        Data.__CacheSave(logfullPath)
         return Data
 
 
@@ -401,23 +558,13 @@ def PlotDriftSettleTime(DataSource, OutputImageFile):
 
     Data = __argToSerialEMLog(DataSource)
 
-    lines = []
-    maxdrift = 0
-    NumTiles = int(0)
-    for t in list(Data.tileData.values()):
-        if not (t.dwellTime is None or t.drift is None):
-            time = []
-            drift = []
-
-            for s in t.driftStamps:
-                time.append(s[0])
-                drift.append(s[1])
-
-            maxdrift = max(maxdrift, t.driftStamps[-1][1])
-            lines.append((time, drift))
-            NumTiles = NumTiles + 1
+    columns = Data.Columns
+    valid = columns.valid
+    lines = [(time.tolist(), drift.tolist()) for (time, drift) in columns.DriftLines(valid)]
+    maxdrift = Data.MaxTileDrift
 
-    plot.PolyLine(lines, Title="Stage settle time, max drift %g" % maxdrift, XAxisLabel='Dwell time (sec)', YAxisLabel="Drift (nm/sec)", OutputFilename=OutputImageFile)
+    with PlotLock:
+        plot.PolyLine(lines, Title="Stage settle time, max drift %g" % maxdrift, XAxisLabel='Dwell time (sec)', YAxisLabel="Drift (nm/sec)", OutputFilename=OutputImageFile)
 
     return
 
@@ -426,56 +573,24 @@ def PlotDriftGrid(DataSource, OutputImageFile):
 
     Data = __argToSerialEMLog(DataSource)
 
-    lines = []
-    maxdrift = -1
-    NumTiles = int(0)
-    fastestTime = float('inf')
-    colors = ['black', 'blue', 'green', 'yellow', 'orange', 'red', 'purple']
-
-    DriftGrid = []
-    c = []
-    for t in list(Data.tileData.values()):
-        if not (t.dwellTime is None or t.drift is None):
-            time = []
-            drift = []
-
-            for s in t.driftStamps:
-                time.append(s[0])
-                drift.append(s[1])
-
-            colorVal = 'black'
-            numPoints = len(t.driftStamps)
-            if  numPoints < len(colors):
-                colorVal = colors[numPoints]
-
-            c.append(colorVal)
-
-            DriftGrid.append((t.coordinates[0], t.coordinates[1], pow(t.dwellTime, 2)))
-            maxdrift = max(maxdrift, t.driftStamps[-1][1])
-            if fastestTime is None:
-                fastestTime = t.totalTime
-            else:
-                fastestTime = min(fastestTime, t.totalTime)
-
-            lines.append((time, drift))
-            NumTiles = NumTiles + 1
-
-#    print "Fastest Capture: %g" % fastestTime
-#
-
-    # PlotHistogram.PolyLinePlot(lines, Title="Stage settle time, max drift %g" % maxdrift, XAxisLabel='Dwell time (sec)', YAxisLabel="Drift (nm/sec)", OutputFilename=None)
-
-    x = []
-    y = []
-    s = []
-    for d in DriftGrid:
-        x.append(d[0])
-        y.append(d[1])
-        s.append(d[2])
+    colors = numpy.asarray(['black', 'blue', 'green', 'yellow', 'orange', 'red', 'purple'])
+
+    columns = Data.Columns
+    valid = columns.valid
+
+    # Color by the number of drift measurements, black if there were more measurements than colors
+    numPoints = columns.num_drift_measurements[valid]
+    c = numpy.where(numPoints < len(colors), colors[numpy.minimum(numPoints, len(colors) - 1)], 'black').tolist()
+
+    coordinates = columns.coordinates[valid]
+    x = coordinates[:, 0].tolist()
+    y = coordinates[:, 1].tolist()
+    s = numpy.power(columns.dwell_time[valid], 2).tolist()
 
     title = "Drift recorded at each capture position in mosaic\nradius = dwell time ^ 2, color = # of tries"
 
-    plot.Scatter(x, y, s, c=c, Title=title, XAxisLabel='X', YAxisLabel='Y', OutputFilename=OutputImageFile)
+    with PlotLock:
+        plot.Scatter(x, y, s, c=c, Title=title, XAxisLabel='X', YAxisLabel='Y', OutputFilename=OutputImageFile)
 
     return
 
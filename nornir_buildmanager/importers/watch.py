@@ -0,0 +1,184 @@
+'''
+Created on Oct 19, 2026
+
+Imports sections while they are being captured.
+
+The input directory is polled for capture files, such as .idoc or .mrc files.  A capture is
+considered complete once the capture file and the other files in its directory have not
+changed for a period of time and, if the importer module provides an ``IsCaptureComplete``
+function, that function agrees.  Completed captures are passed to the importer's ``Import``
+function through its ``InputFiles`` argument so only those sections are imported.
+A capture that changes after it was imported is imported again.
+
+Importers can write files into the section directory, such as histograms or caches.  The state
+of the directory is recorded after the import so those files do not cause the capture to be
+imported again.  Files an importer writes later, for example from a worker thread, are excluded
+by listing their patterns in a ``GeneratedFiles`` attribute of the importer module.
+'''
+
+import fnmatch
+import glob
+import importlib
+import logging
+import os
+import time
+
+import nornir_shared.files as files
+import nornir_shared.prettyoutput as prettyoutput
+
+
+def CaptureSignature(CaptureFullPath, IgnoredFiles=None):
+    '''
+    :param list IgnoredFiles: Filename patterns of files that are not part of the capture
+    :return: A tuple describing the size and modification time of the capture file and the files beside it
+    '''
+    if IgnoredFiles is None:
+        IgnoredFiles = ()
+
+    entries = []
+    with os.scandir(os.path.dirname(CaptureFullPath)) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+
+            if any([fnmatch.fnmatch(entry.name, pattern) for pattern in IgnoredFiles]):
+                continue
+
+            stats = entry.stat()
+            entries.append((entry.name, stats.st_size, stats.st_mtime_ns))
+
+    return tuple(sorted(entries))
+
+
+def FindCaptures(ImportPath, extension):
+    '''
+    :return: Full paths of the capture files in the import directory
+    '''
+    captures = []
+    DirList = files.RecurseSubdirectoriesGenerator(ImportPath, RequiredFiles="*." + extension, ExcludeNames=[], ExcludedDownsampleLevels=[])
+    for path in DirList:
+        captures.extend(glob.glob(os.path.join(path, '*.' + extension)))
+
+    return [os.path.abspath(c) for c in captures]
+
+
+class CaptureTracker(object):
+    '''Tracks capture files and reports those that stopped changing and have not been imported'''
+
+    def __init__(self, StableInterval, IsCaptureComplete=None, IgnoredFiles=None):
+        '''
+        :param float StableInterval: Seconds a capture must remain unchanged before it is considered complete
+        :param func IsCaptureComplete: Optional function returning True if a capture file describes a finished capture
+        :param list IgnoredFiles: Filename patterns of files beside the capture that do not change it
+        '''
+        self.StableInterval = StableInterval
+        self.IsCaptureComplete = IsCaptureComplete
+        self.IgnoredFiles = IgnoredFiles
+        self._observed = {}  # Capture path -> (signature, time the signature was first seen)
+        self._imported = {}  # Capture path -> signature that was imported
+
+    def Poll(self, CaptureFullPaths, now=None):
+        '''
+        :return: List of capture paths that are complete and have changed since they were last imported
+        '''
+        if now is None:
+            now = time.time()
+
+        ready = []
+        for capture in CaptureFullPaths:
+            try:
+                signature = CaptureSignature(capture, self.IgnoredFiles)
+            except OSError:
+                # Files can disappear while the acquisition software renames them
+                continue
+
+            (observed_signature, first_seen) = self._observed.get(capture, (None, None))
+            if observed_signature != signature:
+                self._observed[capture] = (signature, now)
+                continue
+
+            if now - first_seen < self.StableInterval:
+                continue
+
+            if self._imported.get(capture, None) == signature:
+                continue
+
+            if self.IsCaptureComplete is not None and not self.IsCaptureComplete(capture):
+                continue
+
+            ready.append(capture)
+
+        return ready
+
+    def MarkImported(self, CaptureFullPaths, now=None):
+        '''Record the captures as imported.  Call after the import so files the importer wrote are part of the recorded state.'''
+        if now is None:
+            now = time.time()
+
+        for capture in CaptureFullPaths:
+            try:
+                signature = CaptureSignature(capture, self.IgnoredFiles)
+            except OSError:
+                # Import it again once the files settle
+                continue
+
+            self._observed[capture] = (signature, now)
+            self._imported[capture] = signature
+
+
+def Watch(VolumeElement, ImportPath, Importer, extension, PollInterval=30, StableInterval=60, IdleTimeout=0, **kwargs):
+    '''
+    Poll the import directory and import captures as they complete.  Runs until no capture has completed
+    for IdleTimeout seconds, or until interrupted if IdleTimeout is zero.
+    :param str Importer: Module providing the Import function, such as nornir_buildmanager.importers.idoc
+    :param str extension: Extension of capture files
+    :param float PollInterval: Seconds between polls of the import directory
+    :param float StableInterval: Seconds a capture must remain unchanged before it is imported
+    :param float IdleTimeout: Seconds without a completed capture before watching stops.  Zero watches until interrupted.
+    '''
+
+    Logger = logging.getLogger(__name__ + '.Watch')
+
+    if not os.path.exists(ImportPath):
+        raise ValueError("Import Path does not exist: %s" % ImportPath)
+
+    ImporterModule = importlib.import_module(Importer)
+    tracker = CaptureTracker(StableInterval, getattr(ImporterModule, 'IsCaptureComplete', None), getattr(ImporterModule, 'GeneratedFiles', None))
+
+    last_import = time.time()
+    try:
+        while True:
+            ready = tracker.Poll(FindCaptures(ImportPath, extension))
+            if len(ready) > 0:
+                prettyoutput.Log("Importing %d completed captures" % len(ready))
+                Logger.info("Importing completed captures: %s" % ', '.join(ready))
+
+                result = ImporterModule.Import(VolumeElement, ImportPath, extension=extension, InputFiles=set(ready), **kwargs)
+                if result is not None:
+                    if isinstance(result, (list, tuple)) or hasattr(result, '__next__'):
+                        yield from result
+                    else:
+                        yield result
+
+                tracker.MarkImported(ready)
+
+                last_import = time.time()
+            elif IdleTimeout > 0 and time.time() - last_import > IdleTimeout:
+                prettyoutput.Log("No captures completed in %g seconds, watch ended" % IdleTimeout)
+                return
+
+            time.sleep(PollInterval)
+    except KeyboardInterrupt:
+        prettyoutput.Log("Watch interrupted")
+        return
+
+
+def IncludeInputFile(InputFiles, InputFileFullPath):
+    '''
+    :param set InputFiles: Absolute paths of the input files to import, or None to import every file
+    :return: True if the file should be imported
+    '''
+    if InputFiles is None:
+        return True
+
+    return os.path.abspath(InputFileFullPath) in InputFiles
@@ -0,0 +1,248 @@
+'''
+Created on Oct 19, 2026
+
+Lets an interrupted pipeline resume without repeating the work it completed.
+
+While a pipeline runs, an append-only journal in the volume directory records each completed
+``<PythonCall>`` and each element an ``<Iterate>`` finished, with a fingerprint of its inputs.  If
+the pipeline stops before it finishes, the journal is kept.  The next run of the same pipeline with
+the same arguments resumes from it:
+
+* An ``<Iterate>`` skips elements the journal lists as finished.  They are not validated and their
+  stages are not run.
+* A ``<PythonCall>`` the journal lists as completed for its element is not called.
+
+A journal entry is ignored when its fingerprint no longer matches.  The fingerprint covers the
+attributes of the element, but not its children or files, and the arguments of the stage, where
+meta-data elements are identified by their path in the volume.  Changes made outside the build
+to the meta-data below an element, or to its files, are not detected.  Run the pipeline with
+``-NoResume`` after such changes.
+
+Entries are written only after the meta-data changed by the work they record has been saved, so a
+resumed run never skips work whose results were lost.  Elements of an iteration in which a stage
+failed are not recorded.  A stage that queued external tools, see :py:mod:`toolscheduler`, is recorded
+only after their completion callbacks have run, and the iteration containing it is not recorded.  The
+journal is deleted when the pipeline finishes.
+'''
+
+import hashlib
+import json
+import os
+import threading
+
+from .executionplan import DescribeElement
+from .savequeue import IsInSubtree
+from .stagememo import IgnoredArguments, MemoAttributePrefix
+
+JournalFileName = 'PipelineJournal.jsonl'
+
+# Command line arguments that do not change the work a pipeline does
+_RunIgnoredArguments = ('debug', 'verbose', 'lowpriority', 'trace', 'serve', 'connect', 'shutdown', 'NoResume')
+
+def _DescribeAmongSiblings(elem, parent):
+    '''
+    :return: Description of the element.  If siblings share the description, such as elements of one tag without
+             a name or path, the element's position among them is appended, counting from 1 as XPath does.
+    '''
+    description = DescribeElement(elem)
+    if parent is None:
+        return description
+
+    matches = [sibling for sibling in parent.iterfind(elem.tag) if DescribeElement(sibling) == description]
+    if len(matches) < 2:
+        return description
+
+    for (i, sibling) in enumerate(matches):
+        if sibling is elem:
+            return '%s[%d]' % (description, i + 1)
+
+    return description
+
+
+def ElementID(elem):
+    '''
+    :return: Path identifying a meta-data element in the volume, the same in every run
+    '''
+    parts = []
+    while not elem is None:
+        parent = getattr(elem, 'Parent', None)
+        parts.append(_DescribeAmongSiblings(elem, parent))
+        elem = parent
+
+    return '/'.join(reversed(parts))
+
+
+def PipelineNodeID(PipelineNode):
+    '''
+    :return: Identifies an element of the pipeline by its tag and attributes
+    '''
+    CallSite = hashlib.sha1(repr(sorted(PipelineNode.attrib.items())).encode('utf-8')).hexdigest()[:8]
+    return PipelineNode.tag + '.' + PipelineNode.attrib.get('Function', PipelineNode.attrib.get('VariableName', '')) + '.' + CallSite
+
+
+def RunID(PipelineName, args):
+    '''
+    :param str PipelineName: Name of the pipeline
+    :param args: Parsed command line arguments
+    :return: Identifies a pipeline run by the pipeline and the arguments that change its work
+    '''
+    values = sorted([(key, repr(value)) for (key, value) in vars(args).items() if not key in _RunIgnoredArguments])
+    return PipelineName + '.' + hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
+def _DescribeValue(value):
+    if hasattr(value, 'attrib') and hasattr(value, 'tag'):
+        return ('Element', ElementID(value))
+    elif isinstance(value, dict):
+        return sorted([(repr(k), _DescribeValue(v)) for (k, v) in value.items()])
+    elif isinstance(value, (list, tuple)):
+        return [_DescribeValue(v) for v in value]
+
+    # Objects without a stable repr never match, so the work is repeated
+    return repr(value)
+
+
+def Fingerprint(VolumeElem, kwargs=None):
+    '''
+    :param VolumeElem: Element the work ran against
+    :param dict kwargs: Keyword arguments of the stage function, if the work is a stage
+    :return: Hex digest of the element's attributes and the stage's arguments
+    '''
+    digest = hashlib.sha1()
+    attribs = [(k, v) for (k, v) in VolumeElem.attrib.items() if not k.startswith(MemoAttributePrefix)]
+    digest.update(repr(sorted(attribs)).encode('utf-8'))
+
+    if not kwargs is None:
+        for key in sorted(kwargs.keys()):
+            if key in IgnoredArguments:
+                continue
+
+            digest.update(repr((key, _DescribeValue(kwargs[key]))).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+class RunJournal(object):
+    '''The journal of one pipeline run'''
+
+    def __init__(self, FullPath, RunID, Resume=True):
+        '''
+        :param str FullPath: Path of the journal file
+        :param str RunID: Identifies the run, see :py:func:`RunID`.  A journal left by a different run is discarded.
+        :param bool Resume: False to discard the journal of an interrupted run
+        '''
+        self.FullPath = FullPath
+        self.RunID = RunID
+
+        self._lock = threading.Lock()
+        self._Completed = {}  # (pipeline node id, element id) -> fingerprint
+        self._Pending = []  # (element, entry)
+        self._Failed = set()  # ids of elements below which a stage failed
+
+        if Resume:
+            self._Load()
+
+        self.Resumed = len(self._Completed) > 0
+        if not self.Resumed:
+            with open(self.FullPath, 'w') as hFile:
+                hFile.write(json.dumps({'Run': self.RunID}) + '\n')
+
+    def __len__(self):
+        return len(self._Completed)
+
+    def _Load(self):
+        if not os.path.exists(self.FullPath):
+            return
+
+        with open(self.FullPath, 'r') as hFile:
+            lines = hFile.readlines()
+
+        if len(lines) == 0:
+            return
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return
+
+        if header.get('Run', None) != self.RunID:
+            return
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line is incomplete if the run stopped while writing it
+                continue
+
+            self._Completed[(entry['Stage'], entry['Element'])] = entry['Fingerprint']
+
+    def IsComplete(self, PipelineNode, VolumeElem, kwargs=None):
+        '''
+        :return: True if the journal of the interrupted run records the work as completed and its inputs are unchanged
+        '''
+        if len(self._Completed) == 0:
+            return False
+
+        Recorded = self._Completed.get((PipelineNodeID(PipelineNode), ElementID(VolumeElem)), None)
+        if Recorded is None:
+            return False
+
+        return Recorded == Fingerprint(VolumeElem, kwargs)
+
+    def Add(self, PipelineNode, VolumeElem, kwargs=None):
+        '''Record completed work.  The entry is written by the next call to Write, which must follow saving the meta-data.'''
+        entry = {'Stage': PipelineNodeID(PipelineNode),
+                 'Element': ElementID(VolumeElem),
+                 'Fingerprint': Fingerprint(VolumeElem, kwargs)}
+
+        with self._lock:
+            self._Pending.append((VolumeElem, entry))
+
+    def MarkFailed(self, VolumeElem):
+        '''Record that a stage failed so the iterations containing the element are not recorded as finished'''
+        with self._lock:
+            while not VolumeElem is None:
+                self._Failed.add(id(VolumeElem))
+                VolumeElem = getattr(VolumeElem, 'Parent', None)
+
+    def HasFailed(self, VolumeElem):
+        '''
+        :return: True if a stage failed on the element or below it
+        '''
+        return id(VolumeElem) in self._Failed
+
+    def TakePending(self, Root=None):
+        '''
+        :param Root: Only take entries for the root and the elements below it.  None to take every entry.
+        :return: Entries added and not yet taken.  Take them before saving the meta-data and write them after.
+        '''
+        with self._lock:
+            if Root is None:
+                taken = self._Pending
+                self._Pending = []
+            else:
+                taken = [pending for pending in self._Pending if IsInSubtree(pending[0], Root)]
+                self._Pending = [pending for pending in self._Pending if not IsInSubtree(pending[0], Root)]
+
+            return [entry for (elem, entry) in taken]
+
+    def Write(self, entries):
+        '''Append entries to the journal file'''
+        if len(entries) == 0:
+            return
+
+        with self._lock:
+            with open(self.FullPath, 'a') as hFile:
+                for entry in entries:
+                    hFile.write(json.dumps(entry) + '\n')
+
+                hFile.flush()
+                os.fsync(hFile.fileno())
+
+    def Close(self, Finished):
+        '''
+        :param bool Finished: True if the pipeline finished, which deletes the journal
+        '''
+        if Finished and os.path.exists(self.FullPath):
+            os.remove(self.FullPath)
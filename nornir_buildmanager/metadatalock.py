@@ -0,0 +1,49 @@
+'''
+Created on Oct 19, 2026
+
+The lock on the volume meta-data.
+
+The volume meta-data is not thread safe.  Code that changes or saves it while other threads may be
+running, such as concurrent section imports or the pipeline manager saving nodes, holds the lock with
+:py:func:`MetadataLocked`.  Work that only reads and writes image files releases it with
+:py:func:`MetadataUnlocked` so other threads can use the meta-data meanwhile.
+'''
+
+import contextlib
+import threading
+
+_MetadataLock = threading.RLock()
+_ThreadState = threading.local()
+
+
+def _LockDepth():
+    return getattr(_ThreadState, 'depth', 0)
+
+
+@contextlib.contextmanager
+def MetadataLocked():
+    '''Hold the volume meta-data lock'''
+    _MetadataLock.acquire()
+    _ThreadState.depth = _LockDepth() + 1
+    try:
+        yield
+    finally:
+        _ThreadState.depth = _LockDepth() - 1
+        _MetadataLock.release()
+
+
+@contextlib.contextmanager
+def MetadataUnlocked():
+    '''Release the volume meta-data lock, if this thread holds it, for work that does not touch meta-data'''
+    depth = _LockDepth()
+    for i in range(0, depth):
+        _MetadataLock.release()
+
+    _ThreadState.depth = 0
+    try:
+        yield
+    finally:
+        for i in range(0, depth):
+            _MetadataLock.acquire()
+
+        _ThreadState.depth = depth
@@ -4,14 +4,17 @@ Created on Jun 22, 2012
 @author: Jamesan
 '''
 
+import collections
 import copy
+import functools
 import logging
 import math
+import multiprocessing
 import random
 import shutil
 import subprocess
 
-from nornir_buildmanager import VolumeManagerETree, VolumeManagerHelpers
+from nornir_buildmanager import VolumeManagerETree, VolumeManagerHelpers, toolscheduler
 from nornir_imageregistration.views import TransformWarpView
 from nornir_buildmanager.metadatautils import *
 from nornir_buildmanager.validation import transforms
@@ -26,6 +29,7 @@ import nornir_buildmanager.operations.helpers.stosgroupvolume as stosgroupvolume
 import nornir_imageregistration.stos_brute as stos_brute
 import nornir_pools
 import nornir_imageregistration
+import numpy as np
 
 
 class StomPreviewOutputInterceptor(ProgressOutputInterceptor):
@@ -896,26 +900,31 @@ def AssembleStosOverlays(Parameters, StosMapNode, GroupNode, Logger, **kwargs):
     
 
 def CalculateStosGroupWarpMeasurementImages(Parameters, StosMapNode, GroupNode,  Logger, **kwargs):
-    '''Executre ir-stom on a provided .stos file'''
+    '''Generate warp measurement images and histograms for each .stos file in a group.  Mappings are measured in parallel.
+
+    :param int MaxWorkers: Maximum number of mappings measured at once.  Defaults to the number of cores.
+    :param bool StatisticsOnly: Only calculate the warp histogram data, do not render warp images or histogram plots
+    '''
 
     maxReportedAngle = kwargs.get('MaxReportedAngle', None)
     RenderToSourceSpace = kwargs.get('RenderToSourceSpace', True)
-    
-    # oldDir = os.getcwd()
-    TransformXPathTemplate = "SectionMappings[@MappedSectionNumber='%(MappedSection)d']/Transform[@ControlSectionNumber='%(ControlSection)d']"
+    MaxWorkers = kwargs.get('MaxWorkers', None)
+    StatisticsOnly = kwargs.get('StatisticsOnly', False)
+
+    if MaxWorkers is None or MaxWorkers <= 0:
+        Pool = nornir_pools.GetGlobalMultithreadingPool()
+    else:
+        Pool = nornir_pools.GetMultithreadingPool("WarpMeasurements", num_threads=MaxWorkers)
 
     SaveRequired = False
     BlockNode = StosMapNode.FindParent('Block')
+
+    Tasks = []
  
     for MappingNode in StosMapNode.findall('Mapping'):
         MappedSectionList = MappingNode.Mapped
     
         for MappedSection in MappedSectionList:
-            # Find the inputTransformNode in the InputGroupNode
-            # TransformXPath = TransformXPathTemplate % {'MappedSection' : MappedSection,
-            #                                           'ControlSection' : MappingNode.Control}
-    
-            # StosTransformNode = GroupNode.find(TransformXPath)
             StosTransformNodes = GroupNode.TransformsForMapping(MappedSection, MappingNode.Control)
             if StosTransformNodes is None:
                 Logger.warn("No transform found for mapping: " + str(MappedSection) + " -> " + str(MappingNode.Control))
@@ -933,74 +942,88 @@ def CalculateStosGroupWarpMeasurementImages(Parameters, StosMapNode, GroupNode,
                 HistogramImageOutputFilename = 'warpHistogram_' + TransformBaseFilename + '.png'
     
                 WarpImageOutputFileFullPath = os.path.join(GroupNode.FullPath, WarpImageOutputFilename)
-                HistogramOutputFileFullPath = os.path.join(GroupNode.FullPath, HistogramOutputFilename) 
-       
-    
+
+                Title = str(MappedSection) + " -> " + str(MappingNode.Control)
+
                 # Create a node in the XML records
-                (created_warp, WarpImageNode) = GetOrCreateImageNodeHelper(SectionMappingNode, WarpImageOutputFileFullPath)
-                WarpImageNode.Type = 'WarpMetricImage_' + StosTransformNode.Type
-#                 (created_histogram_image, WarpHistogramImageNode) = GetOrCreateImageNodeHelper(SectionMappingNode, HistogramImageOutputFileFullPath, StosTransformNode)
-#                 WarpHistogramImageNode.Type = 'WarpHistogram_' + StosTransformNode.Type
+                WarpImageNode = None
+                if not StatisticsOnly:
+                    (created_warp, WarpImageNode) = GetOrCreateImageNodeHelper(SectionMappingNode, WarpImageOutputFileFullPath)
+                    WarpImageNode.Type = 'WarpMetricImage_' + StosTransformNode.Type
+
+                    if created_warp:
+                        WarpImageNode.SetTransform(StosTransformNode)
+                    else:
+                        if WarpImageNode.CleanIfInputTransformMismatched(StosTransformNode):
+                            files.RemoveOutdatedFile(StosTransformNode.FullPath, WarpImageNode.FullPath)
+
                 (created_histogram, WarpHistogramNode) = GetOrCreateHistogramNodeHelper(SectionMappingNode, HistogramOutputFilename, HistogramImageOutputFilename, StosTransformNode)
                 WarpHistogramNode.Type = 'WarpHistogram_' + StosTransformNode.Type
-                
-                if created_warp:
-                    WarpImageNode.SetTransform(StosTransformNode)
-                else:
-                    if WarpImageNode.CleanIfInputTransformMismatched(StosTransformNode):
-                        files.RemoveOutdatedFile(StosTransformNode.FullPath, WarpImageNode.FullPath)
-                        
-                      
-#                 if created_histogram_image:
-#                     WarpHistogramImageNode.SetTransform(StosTransformNode) 
-    
-                # Compare the .stos file creation date to the output
-                
-                #===========================================================
-                # if hasattr(OverlayImageNode, 'InputTransformChecksum'):
-                #     transforms.RemoveOnMismatch(OverlayImageNode, 'InputTransformChecksum', StosTransformNode.Checksum)
-                # if hasattr(DiffImageNode, 'InputTransformChecksum'):
-                #     transforms.RemoveOnMismatch(DiffImageNode, 'InputTransformChecksum', StosTransformNode.Checksum)
-                # if hasattr(WarpedImageNode, 'InputTransformChecksum'):
-                #     transforms.RemoveOnMismatch(WarpedImageNode, 'InputTransformChecksum', StosTransformNode.Checksum)
-                #===========================================================                   
-    
-                twarpView = None
-                
-                if not os.path.exists(WarpImageNode.FullPath):
-                    
-                    if twarpView is None:
-                        twarpView = TransformWarpView(StosTransformNode.FullPath)
-                    
-                    twarpView.GenerateWarpImage(outputfullpath=WarpImageNode.FullPath, RenderToSourceSpace=RenderToSourceSpace, title=str(MappedSection) + " -> " + str(MappingNode.Control), maxAngle=maxReportedAngle)
-                    WarpImageNode.SetTransform(StosTransformNode)
-                    SaveRequired = True
-                    
-                if not (os.path.exists(WarpHistogramNode.DataFullPath) and os.path.exists(WarpHistogramNode.ImageFullPath)):
-                
-                    if twarpView is None:
-                        twarpView = TransformWarpView(StosTransformNode.FullPath)
-                        
-                    h = twarpView.GenerateWarpHistogram(WarpHistogramNode.DataFullPath)
-                    h.Save(WarpHistogramNode.DataFullPath)
-                    
-                    plot.Histogram(h, WarpHistogramNode.ImageFullPath, Title=str(MappedSection) + " -> " + str(MappingNode.Control), xlabel='Angle Delta')
-                                                 
-                    WarpHistogramNode.SetTransform(StosTransformNode)
-                    # WarpHistogramImageNode.SetTransform(StosTransformNode) 
-                    SaveRequired = True
-    
-        # Figure out where our output should live...
-    
-        # try:
-            # shutil.rmtree('Temp')
-        # except:
-            # pass  
+
+                WarpImageFullPath = None
+                if not (WarpImageNode is None or os.path.exists(WarpImageNode.FullPath)):
+                    WarpImageFullPath = WarpImageNode.FullPath
+
+                HistogramDataFullPath = None
+                HistogramImageFullPath = None
+                if StatisticsOnly:
+                    if not os.path.exists(WarpHistogramNode.DataFullPath):
+                        HistogramDataFullPath = WarpHistogramNode.DataFullPath
+                elif not (os.path.exists(WarpHistogramNode.DataFullPath) and os.path.exists(WarpHistogramNode.ImageFullPath)):
+                    HistogramDataFullPath = WarpHistogramNode.DataFullPath
+                    HistogramImageFullPath = WarpHistogramNode.ImageFullPath
+
+                if WarpImageFullPath is None and HistogramDataFullPath is None:
+                    continue
+
+                task = Pool.add_task(Title, _GenerateWarpMeasurements, StosTransformNode.FullPath, Title,
+                                     WarpImageFullPath=WarpImageFullPath,
+                                     HistogramDataFullPath=HistogramDataFullPath,
+                                     HistogramImageFullPath=HistogramImageFullPath,
+                                     RenderToSourceSpace=RenderToSourceSpace,
+                                     maxAngle=maxReportedAngle)
+                task.StosTransformNode = StosTransformNode
+                task.WarpImageNode = WarpImageNode if WarpImageFullPath is not None else None
+                task.WarpHistogramNode = WarpHistogramNode if HistogramDataFullPath is not None else None
+                Tasks.append(task)
+
+    for task in Tasks:
+        try:
+            task.wait()
+        except Exception as e:
+            Logger.error("Could not measure warp for %s\n%s" % (task.name, str(e)))
+            continue
+
+        if not task.WarpImageNode is None:
+            task.WarpImageNode.SetTransform(task.StosTransformNode)
+
+        if not task.WarpHistogramNode is None:
+            task.WarpHistogramNode.SetTransform(task.StosTransformNode)
+
+        SaveRequired = True
 
     if SaveRequired:
         return BlockNode
     else:
         return GroupNode
+
+
+def _GenerateWarpMeasurements(StosFullPath, Title, WarpImageFullPath=None, HistogramDataFullPath=None, HistogramImageFullPath=None, RenderToSourceSpace=True, maxAngle=None):
+    '''Measure the warp of a single .stos file.  Outputs with a path of None are not generated.'''
+
+    twarpView = TransformWarpView(StosFullPath)
+
+    if not WarpImageFullPath is None:
+        twarpView.GenerateWarpImage(outputfullpath=WarpImageFullPath, RenderToSourceSpace=RenderToSourceSpace, title=Title, maxAngle=maxAngle)
+
+    if not HistogramDataFullPath is None:
+        h = twarpView.GenerateWarpHistogram(HistogramDataFullPath)
+        h.Save(HistogramDataFullPath)
+
+        if not HistogramImageFullPath is None:
+            plot.Histogram(h, HistogramImageFullPath, Title=Title, xlabel='Angle Delta')
+
+    return
     
 
 def SelectBestRegistrationChain(Parameters, InputGroupNode, InputStosMapNode, OutputStosMapName, Logger, **kwargs):
@@ -1377,10 +1400,18 @@ def __SelectAutomaticOrManualStosFilePath(AutomaticInputStosFullPath, ManualInpu
     return InputStosFullPath
 
 
-def StosGrid(Parameters, MappingNode, InputGroupNode, UseMasks, Downsample=32, ControlFilterPattern=None, MappedFilterPattern=None, OutputStosGroup=None, Type=None, **kwargs):
+def StosGrid(Parameters, MappingNode, InputGroupNode, UseMasks, Downsample=32, ControlFilterPattern=None, MappedFilterPattern=None, OutputStosGroup=None, Type=None, MaxConcurrentTools=1, MaxToolMemory=None, **kwargs):
+    '''
+    :param int MaxConcurrentTools: If greater than one ir-stos-grid is queued on the global tool scheduler and the meta-data is updated as each call completes
+    :param float MaxToolMemory: Estimated memory, in GB, all queued tools may use at once.  Zero for no limit.
+    '''
 
     Logger = logging.getLogger(__name__ + '.StosGrid')
 
+    scheduler = None
+    if MaxConcurrentTools is not None and MaxConcurrentTools > 1:
+        scheduler = toolscheduler.GetGlobalToolScheduler(MaxCores=MaxConcurrentTools, MaxMemoryGB=MaxToolMemory)
+
     BlockNode = InputGroupNode.FindParent('Block')
 
     if(OutputStosGroup is None):
@@ -1507,23 +1538,21 @@ def StosGrid(Parameters, MappingNode, InputGroupNode, UseMasks, Downsample=32, C
                     cmd = StosGridTemplate % {'OutputStosFullPath' : OutputStosFullPath,
                                                    'InputStosFullPath' : InputStosFullPath}
 
+                    if not scheduler is None:
+                        scheduler.Submit(cmd, cmd,
+                                         OnComplete=functools.partial(_OnStosGridComplete, OutputSectionMappingNode, stosNode, InputTransformNode, InputStosFullPath, InputStosFileChecksum, OutputStosFullPath, OutputFile, Logger),
+                                         Memory=toolscheduler.EstimateToolMemory([ControlImageNode.FullPath, MappedImageNode.FullPath]))
+
+                        for NodeToSave in scheduler.Poll():
+                            yield NodeToSave
+
+                        continue
+
                     prettyoutput.Log(cmd)
                     subprocess.call(cmd + " && exit", shell=True)
 
-                    if not os.path.exists(OutputStosFullPath):
-                        Logger.error("ir-stos-grid did not produce output for " + InputStosFullPath)
-                        OutputSectionMappingNode.remove(stosNode)
-                        stosNode = None
-                        yield OutputSectionMappingNode
-                        continue
-                    else:
-                        if not stosfile.StosFile.IsValid(OutputStosFullPath):
-                            os.remove(OutputStosFullPath)
-                            OutputSectionMappingNode.remove(stosNode)
-                            stosNode = None
-                            prettyoutput.Log("Transform generated by refine was unable to be loaded. Deleting.  Check input transform: " + OutputStosFullPath)
-                            yield OutputSectionMappingNode
-                            continue
+                    yield _OnStosGridComplete(OutputSectionMappingNode, stosNode, InputTransformNode, InputStosFullPath, InputStosFileChecksum, OutputStosFullPath, OutputFile, Logger)
+                    continue
                 else:
                     prettyoutput.Log("Copy manual override stos file to output: " + os.path.basename(ManualStosFileFullPath))
                     shutil.copy(ManualStosFileFullPath, OutputStosFullPath)
@@ -1541,6 +1570,33 @@ def StosGrid(Parameters, MappingNode, InputGroupNode, UseMasks, Downsample=32, C
                 yield OutputSectionMappingNode
                  
 
+def _OnStosGridComplete(OutputSectionMappingNode, stosNode, InputTransformNode, InputStosFullPath, InputStosFileChecksum, OutputStosFullPath, OutputFile, Logger, result=None):
+    '''Update the meta-data once ir-stos-grid has run.
+    :param ToolResult result: Exit status and output of ir-stos-grid when it was run by the tool scheduler
+    :return: Node to save
+    '''
+
+    if not result is None:
+        toolscheduler.RecordToolResult(stosNode, result)
+
+    if not os.path.exists(OutputStosFullPath):
+        Logger.error("ir-stos-grid did not produce output for " + InputStosFullPath)
+        OutputSectionMappingNode.remove(stosNode)
+        return OutputSectionMappingNode
+
+    if not stosfile.StosFile.IsValid(OutputStosFullPath):
+        os.remove(OutputStosFullPath)
+        OutputSectionMappingNode.remove(stosNode)
+        prettyoutput.Log("Transform generated by refine was unable to be loaded. Deleting.  Check input transform: " + OutputStosFullPath)
+        return OutputSectionMappingNode
+
+    stosNode.Path = OutputFile
+    stosNode.ResetChecksum()
+    stosNode.SetTransform(InputTransformNode)
+    stosNode.InputTransformChecksum = InputStosFileChecksum
+    return OutputSectionMappingNode
+
+
 def __StosMapToRegistrationTree(StosMapNode):
     '''Convert a collection of stos mappings into a tree.  The tree describes which transforms must be used to map points between sections'''
 
@@ -1600,12 +1656,13 @@ def TranslateVolumeToZeroOrigin(StosGroupNode, **kwargs):
     return SavedStosGroupNode
 
 
-def BuildSliceToVolumeTransforms(StosMapNode, StosGroupNode, OutputMap, OutputGroupName, Downsample, Enrich, Tolerance, **kwargs):
+def BuildSliceToVolumeTransforms(StosMapNode, StosGroupNode, OutputMap, OutputGroupName, Downsample, Enrich, Tolerance, InMemory=False, **kwargs):
     '''Build a slice-to-volume transform for each section referenced in the StosMap
 
     :param str OutputMap: Name of the StosMap to create, defaults to StosGroupNode name if None
     :param bool Enrich: True if additional control points should be added if the transformed centroids of delaunay triangles are too far from expected position
     :param float Tolerance: The maximum distance the transformed and actual centroids can be before an additional control point is added at the centroid
+    :param bool InMemory: Keep composed transforms in memory, compose independent subtrees of the registration tree in parallel and write the .stos files once at the end
     '''
 
     BlockNode = StosGroupNode.Parent
@@ -1640,6 +1697,12 @@ def BuildSliceToVolumeTransforms(StosMapNode, StosGroupNode, OutputMap, OutputGr
 
     if AddedStosMap:
         yield BlockNode
+
+    if InMemory:
+        for saveNode in SliceToVolumeFromRegistrationTreeInMemory(rt, InputGroupNode=InputStosGroupNode, OutputGroupNode=OutputGroupNode, EnrichTolerance=Tolerance):
+            yield saveNode
+
+        return
         
     for sectionNumber in rt.RootNodes:
         Node = rt.Nodes[sectionNumber]
@@ -1675,44 +1738,7 @@ def SliceToVolumeFromRegistrationTreeNode(rt, Node, InputGroupNode, OutputGroupN
         # In theory each iteration of this loop could be run in a seperate thread.  Useful when center is in center of volume.
         for MappedToControlTransform in MappedToControlTransforms:
 
-            ControlSectionNumber = None
-            ControlChannelName = None
-            ControlFilterName = None
-
-            if ControlToVolumeTransform is None:
-                ControlSectionNumber = MappedToControlTransform.ControlSectionNumber
-                ControlChannelName = MappedToControlTransform.ControlChannelName
-                ControlFilterName = MappedToControlTransform.ControlFilterName
-            else:
-                ControlSectionNumber = ControlToVolumeTransform.ControlSectionNumber
-                ControlChannelName = ControlToVolumeTransform.ControlChannelName
-                ControlFilterName = ControlToVolumeTransform.ControlFilterName
-
-            OutputTransform = OutputSectionMappingsNode.FindStosTransform(ControlSectionNumber=ControlSectionNumber,
-                                                                               ControlChannelName=ControlChannelName,
-                                                                               ControlFilterName=ControlFilterName,
-                                                                               MappedSectionNumber=MappedToControlTransform.MappedSectionNumber,
-                                                                               MappedChannelName=MappedToControlTransform.MappedChannelName,
-                                                                               MappedFilterName=MappedToControlTransform.MappedFilterName)
-
-            if OutputTransform is None:
-                OutputTransform = VolumeManagerETree.TransformNode(attrib=MappedToControlTransform.attrib)
-                OutputTransform.Name = str(mappedSectionNumber) + '-' + str(ControlSection)
-                OutputTransform.SetTransform(MappedToControlTransform)
-                OutputTransformAdded = OutputSectionMappingsNode.AddOrUpdateTransform(OutputTransform)
-                OutputTransform.Path = OutputTransform.Name + '.stos' #Path creates directory and the fullpath parameter is missing.  Needs to run after the transform is added                                
-
-                # Remove any residual transform file just in case
-                if os.path.exists(OutputTransform.FullPath):
-                    os.remove(OutputTransform.FullPath)
-
-            if not ControlToVolumeTransform is None:
-                OutputTransform.Path = str(mappedSectionNumber) + '-' + str(ControlToVolumeTransform.ControlSectionNumber) + '.stos'
-
-            if not OutputTransform.IsInputTransformMatched(MappedToControlTransform):
-                Logger.info(" %s: Removed outdated transform %s" % (logStr, OutputTransform.Path))
-                if os.path.exists(OutputTransform.FullPath):
-                    os.remove(OutputTransform.FullPath)
+            OutputTransform = _GetOrCreateSliceToVolumeTransform(OutputSectionMappingsNode, ControlSection, MappedToControlTransform, ControlToVolumeTransform, logStr)
 
             #===================================================================
             # if not hasattr(OutputTransform, 'InputTransformChecksum'):
@@ -1774,6 +1800,225 @@ def SliceToVolumeFromRegistrationTreeNode(rt, Node, InputGroupNode, OutputGroupN
                 yield retval
 
 
+def _GetOrCreateSliceToVolumeTransform(OutputSectionMappingsNode, ControlSection, MappedToControlTransform, ControlToVolumeTransform, logStr):
+    '''Find or create the output transform node for a mapped-to-control transform.  Removes the output
+       transform file if it was created from a different mapped-to-control transform.'''
+
+    Logger = logging.getLogger(__name__ + '.SliceToVolumeFromRegistrationTreeNode')
+
+    mappedSectionNumber = MappedToControlTransform.MappedSectionNumber
+
+    if ControlToVolumeTransform is None:
+        ControlSectionNumber = MappedToControlTransform.ControlSectionNumber
+        ControlChannelName = MappedToControlTransform.ControlChannelName
+        ControlFilterName = MappedToControlTransform.ControlFilterName
+    else:
+        ControlSectionNumber = ControlToVolumeTransform.ControlSectionNumber
+        ControlChannelName = ControlToVolumeTransform.ControlChannelName
+        ControlFilterName = ControlToVolumeTransform.ControlFilterName
+
+    OutputTransform = OutputSectionMappingsNode.FindStosTransform(ControlSectionNumber=ControlSectionNumber,
+                                                                       ControlChannelName=ControlChannelName,
+                                                                       ControlFilterName=ControlFilterName,
+                                                                       MappedSectionNumber=MappedToControlTransform.MappedSectionNumber,
+                                                                       MappedChannelName=MappedToControlTransform.MappedChannelName,
+                                                                       MappedFilterName=MappedToControlTransform.MappedFilterName)
+
+    if OutputTransform is None:
+        OutputTransform = VolumeManagerETree.TransformNode(attrib=MappedToControlTransform.attrib)
+        OutputTransform.Name = str(mappedSectionNumber) + '-' + str(ControlSection)
+        OutputTransform.SetTransform(MappedToControlTransform)
+        OutputSectionMappingsNode.AddOrUpdateTransform(OutputTransform)
+        OutputTransform.Path = OutputTransform.Name + '.stos' #Path creates directory and the fullpath parameter is missing.  Needs to run after the transform is added                                
+
+        # Remove any residual transform file just in case
+        if os.path.exists(OutputTransform.FullPath):
+            os.remove(OutputTransform.FullPath)
+
+    if not ControlToVolumeTransform is None:
+        OutputTransform.Path = str(mappedSectionNumber) + '-' + str(ControlToVolumeTransform.ControlSectionNumber) + '.stos'
+
+    if not OutputTransform.IsInputTransformMatched(MappedToControlTransform):
+        Logger.info(" %s: Removed outdated transform %s" % (logStr, OutputTransform.Path))
+        if os.path.exists(OutputTransform.FullPath):
+            os.remove(OutputTransform.FullPath)
+
+    return OutputTransform
+
+
+SliceToVolumeJob = collections.namedtuple('SliceToVolumeJob', ('Key', 'ParentKey', 'OutputTransform', 'MappedToControlTransform', 'ControlToVolumeTransform', 'Rebuild'))
+
+
+def SliceToVolumeFromRegistrationTreeInMemory(rt, InputGroupNode, OutputGroupNode, EnrichTolerance):
+    '''Build slice-to-volume transforms for every node in the registration tree.  Unlike
+       SliceToVolumeFromRegistrationTreeNode the composed transforms are kept in memory instead
+       of being saved and reloaded for each hop.  Subtrees that do not depend on each other are
+       composed in parallel and the .stos files are written once all compositions are complete.'''
+
+    Logger = logging.getLogger(__name__ + '.SliceToVolumeFromRegistrationTreeInMemory')
+
+    Plan = []
+    for sectionNumber in rt.RootNodes:
+        Node = rt.Nodes[sectionNumber]
+        _PlanSliceToVolumeTransforms(rt, Node, InputGroupNode, OutputGroupNode, Plan)
+
+    if len(Plan) == 0:
+        return
+
+    Subtrees = _SliceToVolumeSubtrees(Plan)
+
+    Pool = nornir_pools.GetGlobalMultithreadingPool()
+    tasks = []
+    for Jobs in Subtrees:
+        JobArgs = [(job.Key,
+                    job.ParentKey,
+                    job.MappedToControlTransform.FullPath,
+                    None if job.ControlToVolumeTransform is None else job.ControlToVolumeTransform.FullPath,
+                    job.Rebuild) for job in Jobs]
+        tasks.append(Pool.add_task("Slice-to-volume subtree %s" % Jobs[0].OutputTransform.Name, _ComposeSliceToVolumeSubtree, JobArgs, EnrichTolerance))
+
+    Composed = {}
+    for t in tasks:
+        Composed.update(t.wait_return())
+
+    # Plan is ordered parents first, so a parent's checksum is updated before its children are written
+    for job in Plan:
+        if not job.Rebuild:
+            continue
+
+        OutputTransform = job.OutputTransform
+        logStr = "%s <- %s" % (str(job.MappedToControlTransform.ControlSectionNumber), str(job.MappedToControlTransform.MappedSectionNumber))
+
+        if job.ControlToVolumeTransform is None:
+            Logger.info(" %s: Copy mapped to volume center stos transform %s" % (logStr, OutputTransform.Path))
+            shutil.copy(job.MappedToControlTransform.FullPath, OutputTransform.FullPath)
+            OutputTransform.ResetChecksum()
+            OutputTransform.SetTransform(job.MappedToControlTransform)
+            continue
+
+        MToVStos = Composed.get(job.Key, None)
+        if MToVStos is None:
+            # Probably an invalid transform, or a transform this one depends upon is invalid.  Skip it
+            Logger.warning(" %s: Could not compose transform" % (logStr))
+            OutputTransform.Clean()
+            continue
+
+        Logger.info(" %s: Saving composed transform" % (logStr))
+        MToVStos.Save(OutputTransform.FullPath)
+        OutputTransform.ControlToVolumeTransformChecksum = job.ControlToVolumeTransform.Checksum
+        OutputTransform.ResetChecksum()
+        OutputTransform.SetTransform(job.MappedToControlTransform)
+
+    yield OutputGroupNode
+
+
+def _PlanSliceToVolumeTransforms(rt, Node, InputGroupNode, OutputGroupNode, Plan, ParentJob=None):
+    '''Append a SliceToVolumeJob to Plan for each transform below Node in the registration tree.
+       Jobs are appended parent first.  Outdated output transform files are removed.'''
+
+    ControlSection = Node.SectionNumber
+    ControlToVolumeTransform = None if ParentJob is None else ParentJob.OutputTransform
+
+    Logger = logging.getLogger(__name__ + '.SliceToVolumeFromRegistrationTreeInMemory')
+
+    for MappedSectionNode in Node.Children:
+        mappedSectionNumber = MappedSectionNode.SectionNumber
+        mappedNode = rt.Nodes[mappedSectionNumber]
+
+        logStr = "%s <- %s" % (str(ControlSection), str(mappedSectionNumber))
+
+        (MappingAdded, OutputSectionMappingsNode) = OutputGroupNode.GetOrCreateSectionMapping(mappedSectionNumber)
+
+        MappedToControlTransforms = InputGroupNode.TransformsForMapping(mappedSectionNumber, ControlSection)
+
+        if MappedToControlTransforms is None or len(MappedToControlTransforms) == 0:
+            Logger.error(" %s : No transform found:" % (logStr))
+            continue
+
+        for MappedToControlTransform in MappedToControlTransforms:
+            OutputTransform = _GetOrCreateSliceToVolumeTransform(OutputSectionMappingsNode, ControlSection, MappedToControlTransform, ControlToVolumeTransform, logStr)
+
+            if not ControlToVolumeTransform is None:
+                OutputTransform.ControlSectionNumber = ControlToVolumeTransform.ControlSectionNumber
+                OutputTransform.ControlChannelName = ControlToVolumeTransform.ControlChannelName
+                OutputTransform.ControlFilterName = ControlToVolumeTransform.ControlFilterName
+
+                if ParentJob.Rebuild:
+                    # The control-to-volume transform will change, so this transform must be rebuilt
+                    if os.path.exists(OutputTransform.FullPath):
+                        os.remove(OutputTransform.FullPath)
+                elif hasattr(OutputTransform, "ControlToVolumeTransformChecksum"):
+                    if not OutputTransform.ControlToVolumeTransformChecksum == ControlToVolumeTransform.Checksum:
+                        Logger.info(" %s: ControlToVolumeTransformChecksum mismatch, removing" % (logStr))
+                        if os.path.exists(OutputTransform.FullPath):
+                            os.remove(OutputTransform.FullPath)
+                elif os.path.exists(OutputTransform.FullPath):
+                    os.remove(OutputTransform.FullPath)
+
+            Rebuild = not os.path.exists(OutputTransform.FullPath)
+            if not Rebuild:
+                Logger.info(" %s: is still valid" % (logStr))
+
+            job = SliceToVolumeJob(Key=len(Plan),
+                                   ParentKey=None if ParentJob is None else ParentJob.Key,
+                                   OutputTransform=OutputTransform,
+                                   MappedToControlTransform=MappedToControlTransform,
+                                   ControlToVolumeTransform=ControlToVolumeTransform,
+                                   Rebuild=Rebuild)
+            Plan.append(job)
+
+            _PlanSliceToVolumeTransforms(rt, mappedNode, InputGroupNode, OutputGroupNode, Plan, ParentJob=job)
+
+
+def _SliceToVolumeSubtrees(Plan):
+    '''Split a plan into lists of jobs that can be composed independently.  A new subtree starts
+       at every job whose control-to-volume transform is already on disk.'''
+
+    SubtreeForKey = {}
+    Subtrees = []
+    for job in Plan:
+        if job.ParentKey is None or not Plan[job.ParentKey].Rebuild:
+            SubtreeForKey[job.Key] = len(Subtrees)
+            Subtrees.append([])
+        else:
+            SubtreeForKey[job.Key] = SubtreeForKey[job.ParentKey]
+
+        Subtrees[SubtreeForKey[job.Key]].append(job)
+
+    return [Jobs for Jobs in Subtrees if any(job.Rebuild for job in Jobs)]
+
+
+def _ComposeSliceToVolumeSubtree(Jobs, EnrichTolerance):
+    '''Compose the transforms of one subtree in memory.
+    :param list Jobs: (Key, ParentKey, MappedToControlFullPath, ControlToVolumeFullPath, Rebuild) tuples, parents first
+    :return: Dictionary mapping job keys to composed StosFile objects, None if the transform could not be composed
+    '''
+
+    Composed = {}
+    for (Key, ParentKey, MappedToControlFullPath, ControlToVolumeFullPath, Rebuild) in Jobs:
+        if not Rebuild:
+            continue
+
+        if ParentKey is None:
+            Composed[Key] = stosfile.StosFile.Load(MappedToControlFullPath)
+            continue
+
+        if ParentKey in Composed:
+            ControlToVolume = Composed[ParentKey]
+            if ControlToVolume is None:
+                Composed[Key] = None
+                continue
+        else:
+            ControlToVolume = ControlToVolumeFullPath
+
+        try:
+            Composed[Key] = stosfile.AddStosTransforms(MappedToControlFullPath, ControlToVolume, EnrichTolerance=EnrichTolerance)
+        except ValueError:
+            Composed[Key] = None
+
+    return Composed
+
+
 def RegistrationTreeFromStosMapNode(StosMapNode):
     rt = registrationtree.RegistrationTree()
 
@@ -1999,8 +2244,95 @@ def _GetStosToMosaicTransform(StosTransformNode, TransformNode, OutputTransformN
     return (added, OutputTransformNode)
 
 
-def _ApplyStosToMosaicTransform(StosTransformNode, TransformNode, OutputTransformName, Logger, **kwargs):
+def _IsBatchComposable(TileTransform):
+    '''True if the tile transform is a mesh whose control points can be replaced directly.
+       Grid transforms must keep a full grid of points and other transforms have no control points.'''
+    return isinstance(TileTransform, triangulation.Triangulation) and not hasattr(TileTransform, 'gridWidth')
+
+
+def _ComposeTileTransformsBatch(StoVTransform, ImageToTransform):
+    '''Pass the control points of many tile transforms through a slice-to-volume transform.
+       The fixed points of all mesh tile transforms are transformed in a single vectorized call instead of one call per tile.
+       Other tile transforms are composed one at a time with triangulation.AddTransforms.
+    :param dict ImageToTransform: Maps image names to tile-to-section transforms
+    :return: Dictionary mapping image names to tile-to-volume transforms.  Tiles with no valid points are omitted.
+    '''
+
+    Output = {}
+    ImageNames = []
+    for (name, TileTransform) in ImageToTransform.items():
+        if _IsBatchComposable(TileTransform):
+            ImageNames.append(name)
+        else:
+            Output[name] = triangulation.AddTransforms(StoVTransform, TileTransform)
+
+    if len(ImageNames) == 0:
+        return Output
+
+    FixedPointsList = [ImageToTransform[name].FixedPoints for name in ImageNames]
+    AllVolumePoints = StoVTransform.Transform(np.vstack(FixedPointsList))
+
+    iStart = 0
+    for (name, FixedPoints) in zip(ImageNames, FixedPointsList):
+        iEnd = iStart + FixedPoints.shape[0]
+        VolumePoints = AllVolumePoints[iStart:iEnd, :]
+        iStart = iEnd
+
+        TileTransform = ImageToTransform[name]
+        WarpedPoints = TileTransform.WarpedPoints
+
+        # Drop points the slice-to-volume transform could not map
+        ValidPoints = np.all(np.isfinite(VolumePoints), axis=1)
+        if not np.all(ValidPoints):
+            VolumePoints = VolumePoints[ValidPoints, :]
+            WarpedPoints = WarpedPoints[ValidPoints, :]
+
+        if VolumePoints.shape[0] < 3:
+            continue
+
+        TileToVolume = copy.deepcopy(TileTransform)
+        TileToVolume.points = np.hstack((VolumePoints, WarpedPoints))
+        Output[name] = TileToVolume
+
+    return Output
+
+
+def _ComposeMosaicTransformBatch(StoVTransform, MosaicTransform, Logger):
+    '''Replace every tile transform in MosaicTransform with a tile-to-volume transform.  Tiles are split into
+       one chunk per core so the slice-to-volume transform is sent to each worker once instead of once per tile.'''
+
+    ImageNames = list(MosaicTransform.ImageToTransform.keys())
+    NumChunks = min(multiprocessing.cpu_count(), len(ImageNames))
+    if NumChunks == 0:
+        return
+
+    Pool = nornir_pools.GetLocalMachinePool()
+    Tasks = []
+    for iChunk in range(0, NumChunks):
+        ChunkImageToTransform = {name: MosaicTransform.ImageToTransform[name] for name in ImageNames[iChunk::NumChunks]}
+        task = Pool.add_task("Compose %d tiles" % len(ChunkImageToTransform), _ComposeTileTransformsBatch, StoVTransform, ChunkImageToTransform)
+        task.imagenames = list(ChunkImageToTransform.keys())
+        Tasks.append(task)
+
+    for task in Tasks:
+        try:
+            ComposedTransforms = task.wait_return()
+        except:
+            Logger.warn("Exception transforming tiles. Skipping %s" % ', '.join(task.imagenames))
+            ComposedTransforms = {}
+
+        for imagename in task.imagenames:
+            if imagename in ComposedTransforms:
+                MosaicTransform.ImageToTransform[imagename] = ComposedTransforms[imagename]
+            else:
+                Logger.warn("Could not transform tile. Skipping %s" % imagename)
+
+    return
+
+
+def _ApplyStosToMosaicTransform(StosTransformNode, TransformNode, OutputTransformName, Logger, BatchCompose=False, **kwargs):
     '''
+    :param bool BatchCompose: Compose all tile transforms of the section in chunks using one vectorized pass per chunk
     return: Transform node if there was an create/update.  None if no change
     '''
 
@@ -2056,7 +2388,9 @@ def _ApplyStosToMosaicTransform(StosTransformNode, TransformNode, OutputTransfor
         Tasks = []
          
         UsePool = True
-        if UsePool:
+        if BatchCompose:
+            _ComposeMosaicTransformBatch(StoVTransform, MosaicTransform, Logger)
+        elif UsePool:
             # This is a parallel operation, but the Python GIL is so slow using threads is slower.
             Pool = nornir_pools.GetLocalMachinePool()
     
@@ -9,6 +9,7 @@ import subprocess
 import sys
 
 from nornir_buildmanager import *
+from nornir_buildmanager import toolscheduler
 from nornir_buildmanager.VolumeManagerETree import *
 from nornir_buildmanager.validation import transforms
 from nornir_imageregistration.files import mosaicfile
@@ -62,6 +63,10 @@ def CleanNodeIfInvalid(node, **kwargs):
         return parent
     return None
 
+def WaitForExternalTools(**kwargs):
+    '''Wait for external tools queued on the global tool scheduler and return the nodes their completion updated'''
+    return toolscheduler.WaitOnGlobalToolScheduler()
+
 def RemoveDuplicateLinks(ParentNode, ChildNodeName, ChildAttrib=None, **kwargs):
     '''Find all child nodes with duplicate entries for the ChildAttrib and remove the duplicates'''
 
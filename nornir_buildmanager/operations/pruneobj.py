@@ -4,6 +4,7 @@ import math
 import os.path
 
 from nornir_buildmanager import VolumeManagerETree
+from nornir_buildmanager.plotting import PlotLock
 from nornir_buildmanager.validation import transforms
 from nornir_imageregistration.image_stats import Prune
 from nornir_imageregistration.files import mosaicfile
@@ -166,7 +167,8 @@ class PruneObj:
                     #pool = nornir_pools.GetMultithreadingPool("Histograms")
                     #pool.add_task("Create Histogram %s" % HistogramImageFile, plot.Histogram, HistogramXMLFile, HistogramImageFile, LinePosList=self.Tolerance, Title=Title) 
                 #else:
-                plot.Histogram(PruneObjInstance.HistogramXMLFileFullPath, HistogramImageNode.FullPath, LinePosList=PruneObjInstance.Tolerance, Title="Threshold " + str(Threshold))
+                with PlotLock:
+                    plot.Histogram(PruneObjInstance.HistogramXMLFileFullPath, HistogramImageNode.FullPath, LinePosList=PruneObjInstance.Tolerance, Title="Threshold " + str(Threshold))
                 
                 print("Done!")
         except Exception as E:
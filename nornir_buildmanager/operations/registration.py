@@ -4,12 +4,16 @@ Created on Jun 4, 2012
 @author: Jamesan
 '''
 
+import concurrent.futures
 import logging
+import multiprocessing
 import os
 import shutil
 import subprocess
+import threading
 
 from nornir_buildmanager import *
+from nornir_buildmanager import toolscheduler
 from nornir_buildmanager.validation import transforms
 import nornir_imageregistration 
 from nornir_shared import *
@@ -43,8 +47,13 @@ def TranslateTransform(Parameters, TransformNode, FilterNode,
                        max_relax_tension_cutoff=None,
                        first_pass_inter_tile_distance_scale=None,
                        inter_tile_distance_scale=None,
+                       IsolateTranslate=True,
                        Logger=None, **kwargs):
-    '''@ChannelNode'''
+    '''@ChannelNode
+    :param bool IsolateTranslate: Arrange the tiles in a child process shared by every section.  Memory used for tile overlaps
+                                  stays in the child and is reused by the next section, so the global pools do not need to be closed.
+                                  If False the tiles are arranged in this process and the pools are closed after each section.
+    '''
     OutputTransformName = kwargs.get('OutputTransform', 'Translated_' + TransformNode.Name)
     InputTransformNode = TransformNode
 
@@ -87,36 +96,94 @@ def TranslateTransform(Parameters, TransformNode, FilterNode,
             mfileObj.Save(tempMosaicFullPath)
             mosaicToLoadPath = tempMosaicFullPath
             
-        mosaicObj = nornir_imageregistration.Mosaic.LoadFromMosaicFile(mosaicToLoadPath)
-        firstpass_translated_mosaicObj = mosaicObj.ArrangeTilesWithTranslate(tiles_path=LevelNode.FullPath,
-                                                                             image_scale=1.0/RegistrationDownsample,
-                                                                             excess_scalar=excess_scalar,
-                                                                             min_overlap=min_overlap,
-                                                                             feature_score_threshold=feature_score_threshold,
-                                                                             min_translate_iterations=min_translate_iterations,
-                                                                             offset_acceptance_threshold=offset_acceptance_threshold,
-                                                                             max_relax_iterations=max_relax_iterations,
-                                                                             max_relax_tension_cutoff=max_relax_tension_cutoff,
-                                                                             first_pass_inter_tile_distance_scale=first_pass_inter_tile_distance_scale,
-                                                                             inter_tile_distance_scale=inter_tile_distance_scale)
-        
-        firstpass_translated_mosaicObj.SaveToMosaicFile(OutputTransformNode.FullPath)
+        arrange_kwargs = {'image_scale' : 1.0/RegistrationDownsample,
+                          'excess_scalar' : excess_scalar,
+                          'min_overlap' : min_overlap,
+                          'feature_score_threshold' : feature_score_threshold,
+                          'min_translate_iterations' : min_translate_iterations,
+                          'offset_acceptance_threshold' : offset_acceptance_threshold,
+                          'max_relax_iterations' : max_relax_iterations,
+                          'max_relax_tension_cutoff' : max_relax_tension_cutoff,
+                          'first_pass_inter_tile_distance_scale' : first_pass_inter_tile_distance_scale,
+                          'inter_tile_distance_scale' : inter_tile_distance_scale}
+
+        try:
+            if IsolateTranslate:
+                _RunInChildProcess(_ArrangeTilesWithTranslate,
+                                   args=(mosaicToLoadPath, OutputTransformNode.FullPath, LevelNode.FullPath),
+                                   kwargs=arrange_kwargs,
+                                   name="Translate " + OutputTransformNode.FullPath)
+            else:
+                _ArrangeTilesWithTranslate(mosaicToLoadPath, OutputTransformNode.FullPath, LevelNode.FullPath, **arrange_kwargs)
+        finally:
+            if os.path.exists(tempMosaicFullPath):
+                os.remove(tempMosaicFullPath)
 
         SaveRequired = SaveRequired or os.path.exists(OutputTransformNode.FullPath)
         
         print("%s -> %s" % (OutputTransformNode.FullPath, nornir_imageregistration.MosaicFile.LoadChecksum(OutputTransformNode.FullPath)))
-        
-        if os.path.exists(tempMosaicFullPath):
-            os.remove(tempMosaicFullPath)
-        
-        
  
     if SaveRequired:
-        nornir_pools.ClosePools() #A workaround to avoid running out of memory
+        if not IsolateTranslate:
+            nornir_pools.ClosePools() #A workaround to avoid running out of memory
         return TransformParentNode
     else:
         return None
 
+
+# The child process translating sections, created when the first section is translated
+_TranslateExecutor = None
+_TranslateExecutorLock = threading.Lock()
+
+
+def _GetTranslateExecutor():
+    '''
+    :return: The executor running translations in a single long-lived child process.
+    The child is spawned rather than forked.  A forked child would inherit the nornir_pools singletons of this
+    process without their worker threads, and could wait forever on them.  Unlike a multiprocessing.Pool the
+    child is not a daemon, so the function may create its own worker processes.
+    '''
+    global _TranslateExecutor
+
+    with _TranslateExecutorLock:
+        if _TranslateExecutor is None:
+            _TranslateExecutor = concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+
+        return _TranslateExecutor
+
+
+def _DiscardTranslateExecutor(executor):
+    '''Shut down an executor whose child process died, so the next translation starts a new child'''
+    global _TranslateExecutor
+
+    with _TranslateExecutorLock:
+        if _TranslateExecutor is executor:
+            _TranslateExecutor = None
+
+    executor.shutdown(wait=False)
+
+
+def _RunInChildProcess(target, args=(), kwargs=None, name=None):
+    '''Run a function in the translation child process and wait for it to finish.  The child, its imports and its
+       pools are reused by every call.  Calls made while another is running wait for the child.
+    :param func target: Module level function to run
+    :return: The value returned by the function
+    :raises RuntimeError: If the child process exits before the function returns
+    '''
+    executor = _GetTranslateExecutor()
+    try:
+        return executor.submit(target, *args, **({} if kwargs is None else kwargs)).result()
+    except concurrent.futures.process.BrokenProcessPool as e:
+        _DiscardTranslateExecutor(executor)
+        raise RuntimeError("%s: child process exited unexpectedly" % name) from e
+
+
+def _ArrangeTilesWithTranslate(InputMosaicFullPath, OutputMosaicFullPath, TilesPath, **kwargs):
+    '''Arrange the tiles of a .mosaic file and save the result.  Runs in a child process when TranslateTransform isolates translation.'''
+    mosaicObj = nornir_imageregistration.Mosaic.LoadFromMosaicFile(InputMosaicFullPath)
+    translated_mosaicObj = mosaicObj.ArrangeTilesWithTranslate(tiles_path=TilesPath, **kwargs)
+    translated_mosaicObj.SaveToMosaicFile(OutputMosaicFullPath)
+
 # 
 # def TranslateTransform_IrTools(Parameters, TransformNode, FilterNode, RegistrationDownsample, Logger, **kwargs):
 #     '''@ChannelNode'''
@@ -202,8 +269,11 @@ def TranslateTransform(Parameters, TransformNode, FilterNode,
 #     else:
 #         return None
 
-def GridTransform(Parameters, TransformNode, FilterNode, RegistrationDownsample, Logger, **kwargs):
-    '''@ChannelNode'''
+def GridTransform(Parameters, TransformNode, FilterNode, RegistrationDownsample, Logger, MaxConcurrentTools=1, MaxToolMemory=None, **kwargs):
+    '''@ChannelNode
+    :param int MaxConcurrentTools: If greater than one ir-refine-grid is queued on the global tool scheduler and the output transform is added once the tool completes
+    :param float MaxToolMemory: Estimated memory, in GB, all queued tools may use at once.  Zero for no limit.
+    '''
     Iterations = Parameters.get('it', 10)
     Cell = Parameters.get('Cell', None)
     MeshWidth = Parameters.get('MeshWidth', 6)
@@ -257,6 +327,23 @@ def GridTransform(Parameters, TransformNode, FilterNode, RegistrationDownsample,
     if not os.path.exists(OutputTransformNode.FullPath):
         CmdLineTemplate = "ir-refine-grid -load %(InputMosaic)s -save %(OutputMosaic)s -image_dir %(ImageDir)s " + ThresholdString + ItString + CellString + MeshString + SpacingString
         cmd = CmdLineTemplate % {'InputMosaic' : InputTransformNode.FullPath, 'OutputMosaic' : OutputTransformNode.FullPath, 'ImageDir' : LevelNode.FullPath}
+
+        if MaxConcurrentTools is not None and MaxConcurrentTools > 1:
+            # The output node is only added to the channel once the tool completes so later stages do not find a transform without a file
+            TransformParentNode.remove(OutputTransformNode)
+            OutputTransformNode.cmd = cmd
+
+            scheduler = toolscheduler.GetGlobalToolScheduler(MaxCores=MaxConcurrentTools, MaxMemoryGB=MaxToolMemory)
+            scheduler.Submit(cmd, cmd,
+                             OnComplete=lambda result: _OnGridTransformComplete(TransformParentNode, OutputTransformNode, Logger, result),
+                             Memory=toolscheduler.EstimateToolMemory(LevelNode.FullPath))
+
+            NodesToSave = scheduler.Poll()
+            if added_level:
+                NodesToSave.append(TransformParentNode)
+
+            return NodesToSave
+
         prettyoutput.CurseString('Cmd', cmd)
         NewP = subprocess.Popen(cmd + " && exit", shell=True, stdout=subprocess.PIPE)
         output = ProcessOutputInterceptor.Intercept(ProgressOutputInterceptor(NewP))
@@ -274,6 +361,21 @@ def GridTransform(Parameters, TransformNode, FilterNode, RegistrationDownsample,
     else:
         return None
 
+def _OnGridTransformComplete(TransformParentNode, OutputTransformNode, Logger, result):
+    '''Add the output of a queued ir-refine-grid call to the meta-data'''
+
+    toolscheduler.RecordToolResult(OutputTransformNode, result)
+
+    if not os.path.exists(OutputTransformNode.FullPath):
+        Logger.error("ir-refine-grid did not produce output for %s\n%s" % (OutputTransformNode.FullPath, result.Output))
+        return None
+
+    TransformNodeToZeroOrigin(OutputTransformNode)
+    OutputTransformNode.ResetChecksum()
+    TransformParentNode.UpdateOrAddChildByAttrib(OutputTransformNode, 'Path')
+    return TransformParentNode
+
+
 def CompressTransforms(Parameters, TransformNode, **kwargs):
     '''Rewrite the provided transform node to represent the same data with less text
        This will change the checksum of the transform, so it may cause portions of the 
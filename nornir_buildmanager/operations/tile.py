@@ -18,7 +18,9 @@ from PIL import Image
 
 import nornir_imageregistration
 from nornir_buildmanager.exceptions import NornirUserException
+from nornir_buildmanager.plotting import PlotLock
 import nornir_buildmanager.templates 
+from nornir_buildmanager.subtreesnapshot import OnlyChangesOwnElement
 from nornir_buildmanager.validation import transforms, image
 from nornir_imageregistration.files import mosaicfile
 from nornir_imageregistration.mosaic import Mosaic
@@ -583,6 +585,7 @@ def _ClearInvalidHistogramElements(filterObj, checksum):
     return (HistogramElementRemoved, HistogramElement)
 
 
+@OnlyChangesOwnElement
 def AutolevelTiles(Parameters, InputFilter, Downsample=1, TransformNode=None, OutputFilterName=None, **kwargs):
     '''Create a new filter using the histogram of the input filter
        @ChannelNode'''
@@ -819,6 +822,7 @@ def InvertFilter(Parameters, InputFilterNode, OutputFilterName, **kwargs):
     return 
 
 
+@OnlyChangesOwnElement
 def HistogramFilter(Parameters, FilterNode, Downsample, TransformNode, **kwargs):
     '''Construct the intensity histogram for a filter
        @FilterNode'''
@@ -968,7 +972,8 @@ def GenerateHistogramImage(HistogramElement, MinValue, MaxValue, Gamma, LineColo
             # pool = nornir_pools.GetThreadPool("Histograms")
             # pool.add_task("Create Histogram %s" % DataNode.FullPath, nornir_shared.plot.Histogram, DataNode.FullPath, HistogramImage.FullPath, MinCutoffPercent, MaxCutoffPercent, LinePosList=LinePositions, LineColorList=LineColors, Title=TitleStr)
         # else:
-        nornir_shared.plot.Histogram(DataNode.FullPath, HistogramImage.FullPath, MinCutoffPercent, MaxCutoffPercent, LinePosList=LinePositions, LineColorList=LineColors, Title=TitleStr)
+        with PlotLock:
+            nornir_shared.plot.Histogram(DataNode.FullPath, HistogramImage.FullPath, MinCutoffPercent, MaxCutoffPercent, LinePosList=LinePositions, LineColorList=LineColors, Title=TitleStr)
 
         HistogramImage.MinIntensityCutoff = str(MinValue)
         HistogramImage.MaxIntensityCutoff = str(MaxValue)
@@ -1607,6 +1612,7 @@ def BuildImagePyramid(ImageSetNode, Levels=None, Interlace=True, **kwargs):
     return None
 
 
+@OnlyChangesOwnElement
 def BuildTilePyramids(PyramidNode=None, Levels=None, **kwargs):
     ''' @PyramidNode
         Build the image pyramid for the specified path.  We expect the "001" level of the pyramid to be pre-populated'''
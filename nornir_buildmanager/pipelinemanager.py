@@ -4,15 +4,16 @@ Created on Apr 2, 2012
 '''
 
 import collections
+import collections.abc
 import copy
 import logging
 import os
 import re
 import sys
+import threading
 import traceback
 import platform
 from xml.etree import ElementTree
-from nornir_buildmanager import VolumeManagerETree
 
 from .pipeline_exceptions import *
 
@@ -22,9 +23,22 @@ import nornir_shared.reflection
 from inspect import isgenerator
 
 from . import argparsexml
+from . import executionplan
+from . import journal
+from . import metadatalock
+from . import savequeue
+from . import stagememo
+from . import stagescheduler
+from . import stagetrace
+from . import subtreesnapshot
+from . import toolscheduler
 import nornir_shared.prettyoutput as prettyoutput
 
 
+# Attributes of pipeline elements read by the pipeline manager that are not passed to stage functions
+ReservedStageAttributes = stagescheduler.StageResourceAttributes + stagememo.MemoAttributes
+
+
 # import xml.etree
 class ArgumentSet():
     '''Collection of arguments from each source'''
@@ -52,6 +66,15 @@ class ArgumentSet():
         self._Variables = {}
         self.PipelineName = PipelineName
 
+    def Copy(self):
+        '''A copy whose dictionaries can be changed without affecting this ArgumentSet'''
+        c = ArgumentSet(self.PipelineName)
+        c._Arguments.update(self._Arguments)
+        c._Attribs.update(self._Attribs)
+        c._Parameters.update(self._Parameters)
+        c._Variables.update(self._Variables)
+        return c
+
     def SubstituteStringVariables(self, xpath):
         '''Replace all instances of # in a string with the variable names'''
 
@@ -151,6 +174,9 @@ class ArgumentSet():
            entry for the attribute'''
 
         for key in Node.attrib:
+            if key in ReservedStageAttributes:
+                continue
+
             if key in self.Attribs:
                 raise PipelineError(PipelineNode=Node, message="%s attribute already present in arguments.  Remove duplicate use from pipelines.xml" % key)
             val = Node.attrib[key]
@@ -296,6 +322,26 @@ class PipelineManager(object):
         self.defaultArgs = dict()
         self.PipelineRoot = pipelinesRoot
 
+        # True while the stage scheduler runs the stages of an iteration
+        self._SchedulingStages = False
+        self._ReloadAfterStages = False
+
+        # The element whose scheduled stages the current thread runs
+        self._ScheduledElement = threading.local()
+
+        # ExecutionPlan recording the stages a dry run reaches, None when the pipeline runs
+        self.Plan = None
+
+        # Meta-data changed by stages but not yet saved, created when the pipeline runs
+        self.SaveQueue = None
+
+        # RunJournal of the work completed, None for a dry run
+        self.Journal = None
+
+        # id of an element -> memoized stages that ran against it, whose keys are recorded when its iteration finishes
+        self._PendingMemoKeys = collections.defaultdict(list)
+        self._MemoLock = threading.Lock()
+
         if 'Description' in pipelineData.attrib:
             self._description = pipelineData.attrib['Description']
 
@@ -411,12 +457,16 @@ class PipelineManager(object):
 
 
     @classmethod
-    def RunPipeline(cls, PipelineXmlFile, PipelineName, args):
+    def RunPipeline(cls, PipelineXmlFile, PipelineName, args, VolumeTree=None):
+        '''
+        :param VolumeTree: A volume loaded by an earlier pipeline, reused instead of loading the volume again if it is for args.volumepath
+        :return: The volume after the pipeline has run
+        '''
 
         # PipelineData = Pipelines.CreateFromDOM(XMLDoc)
         Pipeline = cls.Load(PipelineXmlFile, PipelineName)
 
-        Pipeline.Execute(args)
+        return Pipeline.Execute(args, VolumeTree=VolumeTree)
 
 
     def GetArgParser(self, parser=None, IncludeGlobals=True):
@@ -475,10 +525,12 @@ class PipelineManager(object):
 
     IndentLevel = 0
 
-    def Execute(self, args):
+    def Execute(self, args, VolumeTree=None):
         '''This executes the loaded pipeline on the specified volume of data.
            parser is an instance of the argparser class which should be 
-           extended with any pipeline specific arguments args are the parameters from the command line'''
+           extended with any pipeline specific arguments args are the parameters from the command line
+           :param VolumeTree: A volume loaded by an earlier pipeline, reused instead of loading the volume again if it is for args.volumepath
+           :return: The volume after the pipeline has run'''
 
         # DOM = self.PipelineData.toDOM()
         # PipelineElement = DOM.firstChild
@@ -494,8 +546,17 @@ class PipelineManager(object):
 
         ArgSet.AddParameters(PipelineElement)
 
+        # VolumeManagerETree imports nornir_imageregistration, so it is imported when a pipeline runs instead of when the command line is parsed
+        from nornir_buildmanager import VolumeManagerETree
+
+        DryRun = getattr(args, 'DryRun', False)
+        self.Plan = executionplan.ExecutionPlan() if DryRun else None
+
         # Load the Volume.XML file in the output directory
-        self.VolumeTree = VolumeManagerETree.VolumeManager.Load(args.volumepath, Create=True)
+        if not VolumeTree is None and PipelineManager.IsVolumeFor(VolumeTree, args.volumepath):
+            self.VolumeTree = VolumeTree
+        else:
+            self.VolumeTree = VolumeManagerETree.VolumeManager.Load(args.volumepath, Create=not DryRun)
 
         if(self.VolumeTree is None):
             PipelineManager.logger.critical("Could not load or create volume.xml " + args.outputpath)
@@ -504,10 +565,39 @@ class PipelineManager(object):
 
         # dargs = copy.deepcopy(defaultDargs)
 
-        self.ExecuteChildPipelines(ArgSet, self.VolumeTree, PipelineElement)
+        self.SaveQueue = savequeue.SaveQueue(PipelineManager._SaveLocked,
+                                             MaxNodes=ArgSet.Arguments.get('MaxUnsavedNodes', savequeue.DefaultMaxNodes),
+                                             MaxSeconds=ArgSet.Arguments.get('MaxUnsavedSeconds', savequeue.DefaultMaxSeconds))
+
+        if not DryRun:
+            PipelineName = PipelineElement.attrib.get('Name', '')
+            self.Journal = journal.RunJournal(os.path.join(args.volumepath, journal.JournalFileName),
+                                              journal.RunID(PipelineName, args),
+                                              Resume=not ArgSet.Arguments.get('NoResume', False))
+            if self.Journal.Resumed:
+                prettyoutput.Log("Resuming %s, skipping %d completed stages and iterations" % (PipelineName, len(self.Journal)))
+
+        Finished = False
+        try:
+            self.ExecuteChildPipelines(ArgSet, self.VolumeTree, PipelineElement)
+            Finished = True
+        finally:
+            self._FlushSaves()
+            if not self.Journal is None:
+                self.Journal.Close(Finished)
         
         nornir_pools.WaitOnAllPools()
 
+        if not self.Plan is None:
+            prettyoutput.Log(self.Plan.Report())
+
+        return self.VolumeTree
+
+    @classmethod
+    def IsVolumeFor(cls, VolumeTree, volumepath):
+        '''True if the loaded volume is the volume at volumepath'''
+        return os.path.abspath(VolumeTree.attrib.get('Path', '')) == os.path.abspath(volumepath)
+
     def ExecuteChildPipelines(self, ArgSet, VolumeElem, PipelineNode):
         '''Run all of the child pipeline elements on the volume element'''
 
@@ -518,32 +608,15 @@ class PipelineManager(object):
         try:
             self.AddPipelineNodeVariable(PipelineNode, VolumeElem, ArgSet)
 
-            for ChildNode in PipelineNode:
-                try:
-                    prettyoutput.IncreaseIndent()
-                    self.ProcessStageElement(VolumeElem, ChildNode, ArgSet)
-                    PipelinesRun += 1
-                except PipelineSelectFailed as e:
-                    if ArgSet.Arguments["debug"]:
-                        PipelineManager.logger.info(str(e))
-                    PipelineManager.logger.info("Select statement did not match.  Skipping to next iteration\n")
+            ChildNodes = list(PipelineNode)
+            for (iChild, ChildNode) in enumerate(ChildNodes):
+                if not self.RunStage(VolumeElem, ChildNode, ArgSet):
+                    if not self.Plan is None and ChildNode.tag in ('Select', 'Iterate') and self.Plan.IsPending(VolumeElem):
+                        # The nodes may not exist until an earlier stage runs, so the rest of the iteration would run after it
+                        self.Plan.AddDeferredStages(ChildNodes[iChild:], VolumeElem)
                     break
-                except PipelineSearchFailed as e:
-                    PipelineManager.logger.debug(str(e))
-                    PipelineManager.logger.info("Search statement did not match.  Skipping to next iteration\n")
-                    break
-                except PipelineListIntersectionFailed as e:
-                    PipelineManager.logger.info("Node attribute was not in the list of desired values.  Skipping to next iteration.\n" + e.message)
-                    break
-                except PipelineRegExSearchFailed as e:
-                    PipelineManager.logger.info("Regular expression did not match.  Skipping to next iteration.\n" + str(e.attribValue))
-                    break
-                except PipelineError as e:
-                    PipelineManager.logger.error(str(e))
-                    PipelineManager.logger.error("Unexpected error, exiting pipeline")
-                    sys.exit()
-                finally:
-                    prettyoutput.DecreaseIndent()
+
+                PipelinesRun += 1
 
         finally:
             self.RemovePipelineNodeVariable(ArgSet, PipelineNode)
@@ -551,6 +624,35 @@ class PipelineManager(object):
         # To prevent later calls from being able to access variables from earlier steps be sure to remove the variable from the dargs
         return PipelinesRun
 
+    def RunStage(self, VolumeElem, ChildNode, ArgSet):
+        '''Run one child element of a pipeline or iteration.
+           :return: False if the remaining children of the iteration should be skipped'''
+        try:
+            prettyoutput.IncreaseIndent()
+            self.ProcessStageElement(VolumeElem, ChildNode, ArgSet)
+            return True
+        except PipelineSelectFailed as e:
+            if ArgSet.Arguments["debug"]:
+                PipelineManager.logger.info(str(e))
+            PipelineManager.logger.info("Select statement did not match.  Skipping to next iteration\n")
+            return False
+        except PipelineSearchFailed as e:
+            PipelineManager.logger.debug(str(e))
+            PipelineManager.logger.info("Search statement did not match.  Skipping to next iteration\n")
+            return False
+        except PipelineListIntersectionFailed as e:
+            PipelineManager.logger.info("Node attribute was not in the list of desired values.  Skipping to next iteration.\n" + e.message)
+            return False
+        except PipelineRegExSearchFailed as e:
+            PipelineManager.logger.info("Regular expression did not match.  Skipping to next iteration.\n" + str(e.attribValue))
+            return False
+        except PipelineError as e:
+            PipelineManager.logger.error(str(e))
+            PipelineManager.logger.error("Unexpected error, exiting pipeline")
+            sys.exit()
+        finally:
+            prettyoutput.DecreaseIndent()
+
     def ProcessStageElement(self, VolumeElem, PipelineNode, ArgSet=None):
 
         outStr = PipelineManager.ToElementString(PipelineNode)
@@ -661,11 +763,16 @@ class PipelineManager(object):
         SelectedVolumeElem = None
         while SelectedVolumeElem is None:
 
-            SelectedVolumeElem = RootForSearch.find(xpath)
+            if self.Plan is None:
+                SelectedVolumeElem = RootForSearch.find(xpath)
+            else:
+                SelectedVolumeElem = self._PlanSelect(RootForSearch, xpath)
+
             if(SelectedVolumeElem is None):
                 raise PipelineSelectFailed(PipelineNode=PipelineNode, VolumeElem=RootForSearch, xpath=xpath)
 
             #Containers will be tested at load time.  The load linked element code checks containers
+            from nornir_buildmanager import VolumeManagerETree
             if not isinstance(SelectedVolumeElem, VolumeManagerETree.XContainerElementWrapper):
                 (IsValid, Reason) = SelectedVolumeElem.IsValid()
                 if not IsValid:
@@ -675,12 +782,37 @@ class PipelineManager(object):
                             break
                         
                     SelectedVolumeElem.Clean(Reason)
-                    PipelineManager._SaveNodes(SelectedVolumeElem.Parent)
+                    self._SaveNodes(SelectedVolumeElem.Parent)
                     SelectedVolumeElem = None
 
         if not SelectedVolumeElem is None:
             self.AddPipelineNodeVariable(PipelineNode, SelectedVolumeElem, ArgSet)
 
+    def _PlanSelect(self, RootForSearch, xpath):
+        '''Find the element a <Select> would use without cleaning the invalid elements before it
+           :return: The first valid or locked matching element, or None'''
+        from nornir_buildmanager import VolumeManagerETree
+        for SelectedVolumeElem in RootForSearch.findall(xpath):
+            if isinstance(SelectedVolumeElem, VolumeManagerETree.XContainerElementWrapper):
+                return SelectedVolumeElem
+
+            (IsValid, Reason) = SelectedVolumeElem.IsValid()
+            if IsValid or ('Locked' in SelectedVolumeElem.attrib and SelectedVolumeElem.Locked):
+                return SelectedVolumeElem
+
+            self.Plan.AddCleaned(SelectedVolumeElem, Reason)
+
+        return None
+
+    def _PlanIsInvalid(self, VolumeElem):
+        '''The dry run counterpart of CleanIfInvalid, records the element instead of cleaning it
+           :return: True if a build would clean the element'''
+        (IsValid, Reason) = VolumeElem.IsValid()
+        if not IsValid:
+            self.Plan.AddCleaned(VolumeElem, Reason)
+
+        return not IsValid
+
     def ProcessIterateNode(self, ArgSet, VolumeElem, PipelineNode):
 
         xpath = PipelineManager.__extractXPathFromNode(PipelineNode, ArgSet)
@@ -694,27 +826,238 @@ class PipelineManager(object):
         CopiedArgSet = copy.copy(ArgSet)
 
         NumProcessed = 0
+        if self._UseStageScheduler(PipelineNode, ArgSet):
+            NumProcessed = self._ScheduleIterate(CopiedArgSet, VolumeElemIter, PipelineNode)
+        else:
+            for VolumeElemChild in VolumeElemIter:
+                if self._IsJournaled(PipelineNode, VolumeElemChild):
+                    NumProcessed += 1
+                    continue
+
+                if not self.Plan is None:
+                    if self._PlanIsInvalid(VolumeElemChild):
+                        continue
+                elif VolumeElemChild.CleanIfInvalid():
+                    self._SaveNodes(VolumeElemChild.Parent)
+                    continue
+
+                with stagetrace.Record(PipelineNode.attrib.get('VariableName', PipelineNode.tag), 'Iterate', VolumeElemChild):
+                    try:
+                        NumProcessed += self.ExecuteChildPipelines(CopiedArgSet, VolumeElemChild, PipelineNode)
+                        self._JournalIteration(PipelineNode, VolumeElemChild)
+                    finally:
+                        self._RecordMemoKeys(VolumeElemChild)
+                        self._FlushSaves()
+
+        if(NumProcessed == 0):
+            raise PipelineSearchFailed(PipelineNode=PipelineNode, VolumeElem=RootForSearch, xpath=xpath)
+
+    def _UseStageScheduler(self, PipelineNode, ArgSet):
+        '''True if the iteration opted in to concurrent stages and we are not already inside a scheduled iteration'''
+        if PipelineNode.attrib.get('Concurrent', 'False') != 'True' or not self.Plan is None:
+            return False
+
+        MaxConcurrentStages = ArgSet.Arguments.get('MaxConcurrentStages', 1)
+        if MaxConcurrentStages is None or MaxConcurrentStages < 2:
+            return False
+
+        return not self._SchedulingStages
+
+    def _ScheduleIterate(self, ArgSet, VolumeElemIter, PipelineNode):
+        '''Run the stages of an iteration for every element through the stage scheduler
+           :return: Number of stages that ran'''
+
+        ElementArgSets = []
+        NumSkipped = 0
         for VolumeElemChild in VolumeElemIter:
+            if self._IsJournaled(PipelineNode, VolumeElemChild):
+                NumSkipped += 1
+                continue
+
             if VolumeElemChild.CleanIfInvalid():
-                PipelineManager._SaveNodes(VolumeElemChild.Parent)
+                self._SaveNodes(VolumeElemChild.Parent)
                 continue
 
-            NumProcessed += self.ExecuteChildPipelines(CopiedArgSet, VolumeElemChild, PipelineNode)
+            ElementArgSet = ArgSet.Copy()
+            self.AddPipelineNodeVariable(PipelineNode, VolumeElemChild, ElementArgSet)
+            ElementArgSets.append((VolumeElemChild, ElementArgSet))
 
-        if(NumProcessed == 0):
-            raise PipelineSearchFailed(PipelineNode=PipelineNode, VolumeElem=RootForSearch, xpath=xpath)
+        scheduler = stagescheduler.StageScheduler(MaxCores=ArgSet.Arguments.get('MaxConcurrentStages', None),
+                                                  MaxMemoryGB=ArgSet.Arguments.get('MaxStageMemory', None),
+                                                  MaxIO=ArgSet.Arguments.get('MaxConcurrentIO', None))
 
-    @classmethod
-    def _SaveNodes(cls, NodesToSave):
-        if not NodesToSave is None:
-            if isinstance(NodesToSave, collections.Iterable) or isgenerator(NodesToSave):
-                for node in NodesToSave:
-                    if node is None:
-                        continue 
-                    
-                    VolumeManagerETree.VolumeManager.Save(node)
+        Roots = stagescheduler.CompileIterate(PipelineNode, ElementArgSets)
+
+        self._SchedulingStages = True
+        self._ReloadAfterStages = False
+        try:
+            return NumSkipped + scheduler.Run(Roots, lambda task: self._RunScheduledTask(PipelineNode, task))
+        finally:
+            self._SchedulingStages = False
+            if self._ReloadAfterStages:
+                self._ReloadAfterStages = False
+                self._DiscardSaves()
+                self._ReloadVolume()
             else:
-                VolumeManagerETree.VolumeManager.Save(NodesToSave)
+                self._FlushSaves()
+
+    def _RunScheduledTask(self, IterateNode, task):
+        Continue = False
+        Ran = False
+        self._ScheduledElement.Element = task.Element
+        try:
+            Continue = self.RunStage(task.Element, task.StageNode, task.ArgSet)
+            Ran = True
+            return Continue
+        finally:
+            try:
+                if not Continue or task.Next is None:
+                    # The iteration for the element is over
+                    self._RecordMemoKeys(task.Element)
+                    if Ran:
+                        self._JournalIteration(IterateNode, task.Element)
+
+                    self._FlushSaves()
+            finally:
+                self._ScheduledElement.Element = None
+
+    def _IsJournaled(self, IterateNode, VolumeElem):
+        '''True if an interrupted run of the pipeline finished the iteration for the element'''
+        if self.Journal is None or not self.Journal.IsComplete(IterateNode, VolumeElem):
+            return False
+
+        PipelineManager.logger.info("Completed by an earlier run, skipping " + VolumeElem.ToElementString())
+        return True
+
+    def _JournalIteration(self, IterateNode, VolumeElem):
+        if not self.Journal is None and not self.Journal.HasFailed(VolumeElem):
+            self.Journal.Add(IterateNode, VolumeElem)
+
+    def _JournalAfterTools(self, PipelineNode, VolumeElem, kwargs, Jobs):
+        '''Journal a stage once the completion callbacks of the external tools it queued have run.
+           The stage is not memoized, and the iterations containing its element, which finish before
+           the tools, are not journaled.  A resumed run repeats the stage if the tools did not finish.'''
+        if self.Journal is None:
+            return
+
+        self.Journal.MarkFailed(VolumeElem)
+
+        lock = threading.Lock()
+        Remaining = set([id(job) for job in Jobs])
+
+        def OnToolComplete(job):
+            if not job.Succeeded:
+                return
+
+            with lock:
+                Remaining.discard(id(job))
+                if len(Remaining) > 0:
+                    return
+
+            self.Journal.Add(PipelineNode, VolumeElem, kwargs)
+
+        for job in Jobs:
+            job.WhenComplete(OnToolComplete)
+
+    def _QueueMemoKey(self, VolumeElem, PipelineNode, FunctionName, kwargs):
+        '''Record the memo key of a stage when the iteration for its element finishes, so the outputs of later stages in the iteration are part of the key'''
+        # The parameters are shared with the ArgumentSet, which clears them after the call
+        kwargs = dict(kwargs)
+        kwargs['Parameters'] = dict(kwargs['Parameters'])
+
+        with self._MemoLock:
+            self._PendingMemoKeys[id(VolumeElem)].append((PipelineNode, FunctionName, kwargs))
+
+        if VolumeElem is self.VolumeTree:
+            self._RecordMemoKeys(VolumeElem)
+
+    def _RecordMemoKeys(self, VolumeElem):
+        '''Record the memo keys of the stages that ran against the element'''
+        with self._MemoLock:
+            Pending = self._PendingMemoKeys.pop(id(VolumeElem), [])
+
+        for (PipelineNode, FunctionName, kwargs) in Pending:
+            stagememo.Record(VolumeElem, PipelineNode, stagememo.ComputeKey(FunctionName, kwargs, VolumeElem))
+
+        if len(Pending) > 0:
+            self._SaveNodes([VolumeElem])
+
+    def _RollBack(self, Snapshot, NumSaves):
+        '''Undo the changes a failed stage made to the meta-data below its element
+           :param int NumSaves: SaveQueue.NumSaves when the stage started'''
+        with metadatalock.MetadataLocked():
+            Discarded = Snapshot.Restore()
+
+        if self.SaveQueue is None:
+            return
+
+        for elem in Discarded:
+            self.SaveQueue.Discard(elem)
+
+        if self.SaveQueue.NumSaves != NumSaves:
+            # Part of the failed stage's work may have been saved, so save the restored meta-data over it
+            self._SaveNodes([Snapshot.Root])
+
+    def _DiscardSaves(self):
+        '''Forget the queued meta-data and the work it records before the volume is reloaded'''
+        if not self.SaveQueue is None:
+            self.SaveQueue.Clear()
+
+        if not self.Journal is None:
+            self.Journal.TakePending()
+
+    def _ReloadVolume(self):
+        from nornir_buildmanager import VolumeManagerETree
+        self.VolumeTree = VolumeManagerETree.VolumeManager.Load(self.VolumeTree.attrib["Path"], UseCache=False)
+
+    @classmethod
+    def _SaveLocked(cls, node):
+        from nornir_buildmanager import VolumeManagerETree
+
+        # Stages for different elements may run at once, so saves are serialized
+        with metadatalock.MetadataLocked():
+            VolumeManagerETree.VolumeManager.Save(node)
+
+    def _SaveNodes(self, NodesToSave):
+        '''Queue the nodes a stage changed to be saved at the next flush.  Generators are iterated here, so the
+           work of stages that yield nodes is done by this call.'''
+        if NodesToSave is None:
+            return
+
+        if self.SaveQueue is None:
+            self.SaveQueue = savequeue.SaveQueue(PipelineManager._SaveLocked)
+
+        # Stages scheduled for other elements may be changing the meta-data a threshold flush would save
+        CheckThresholds = getattr(self._ScheduledElement, 'Element', None) is None
+
+        if isinstance(NodesToSave, collections.abc.Iterable) or isgenerator(NodesToSave):
+            for node in NodesToSave:
+                self.SaveQueue.Add(node, CheckThresholds)
+        else:
+            self.SaveQueue.Add(NodesToSave, CheckThresholds)
+
+    def _FlushSaves(self):
+        '''Save the queued meta-data, then journal the work whose results it holds.
+           Within the stages scheduled for an element only the meta-data below the element is saved and journaled.'''
+
+        if self._ReloadAfterStages:
+            # A failed stage may have changed any of the queued meta-data, so nothing is saved before the reload
+            return
+
+        Root = getattr(self._ScheduledElement, 'Element', None)
+
+        if not Root is None and not self.SaveQueue is None and self.SaveQueue.HasDirtyAncestor(Root):
+            # Part of the element's work may be in a container above it, which is saved after every scheduled element finishes
+            entries = []
+        else:
+            # Entries added while saving may describe nodes this flush misses, so they wait for the next flush
+            entries = self.Journal.TakePending(Root) if not self.Journal is None else []
+
+        if not self.SaveQueue is None:
+            self.SaveQueue.Flush(Root)
+
+        if not self.Journal is None:
+            self.Journal.Write(entries)
 
     def ProcessPythonCall(self, ArgSet, VolumeElem, PipelineNode):
         # Try to find a stage for the element we encounter in the pipeline.
@@ -763,31 +1106,85 @@ class PipelineManager(object):
 
                 NodesToSave = None
 
-                if not ArgSet.Arguments["debug"]:
-                    try:
-                        NodesToSave = stageFunc(**kwargs)
-                    except:
-                        errorStr = '\n' + '-' * 60 + '\n'
-                        errorStr = errorStr + str(PipelineModule) + '.' + str(PipelineFunction) + " Exception\n"
-                        errorStr = errorStr + '-' * 60 + '\n'
-                        errorStr = errorStr + traceback.format_exc()
-                        errorStr = errorStr + '-' * 60 + '\n'
-                        PipelineManager.logger.error(errorStr)
-                        # prettyoutput.LogErr(errorStr)
-
-                        self.VolumeTree = VolumeManagerETree.VolumeManager.Load(self.VolumeTree.attrib["Path"], UseCache=False)
-                        return
+                Memoize = stagememo.IsMemoized(PipelineNode)
+                FunctionName = str(PipelineModule) + '.' + str(PipelineFunction)
+                Unchanged = False
+                if Memoize and not ArgSet.Arguments.get('NoMemoize', False):
+                    Unchanged = stagememo.IsCurrent(VolumeElem, PipelineNode, stagememo.ComputeKey(FunctionName, kwargs, VolumeElem))
+
+                if not self.Plan is None:
+                    self.PlanPythonCall(VolumeElem, PipelineFunction, kwargs, Unchanged)
+                    return
+
+                if Unchanged:
+                    PipelineManager.logger.info("Inputs unchanged, skipping " + FunctionName)
+                    return
+
+                if not self.Journal is None and self.Journal.IsComplete(PipelineNode, VolumeElem, kwargs):
+                    PipelineManager.logger.info("Completed by an earlier run, skipping " + FunctionName)
+                    return
+
+                # Stages that yield nodes do their work as the nodes are saved, so the save is part of the span
+                with stagetrace.Record(PipelineFunction, 'Stage', VolumeElem):
+                    if not ArgSet.Arguments["debug"]:
+                        # Stages run against the volume itself, or that may change meta-data outside their element, are recovered by reloading the volume
+                        Snapshot = None
+                        if not VolumeElem is self.VolumeTree and subtreesnapshot.CanRestore(stageFunc):
+                            Snapshot = subtreesnapshot.SubtreeSnapshot(VolumeElem)
+                        elif not self._SchedulingStages:
+                            # Save the work of earlier stages so a reload only discards the changes of this stage
+                            self._FlushSaves()
+
+                        NumSaves = self.SaveQueue.NumSaves if not self.SaveQueue is None else 0
+
+                        try:
+                            with toolscheduler.RecordSubmissions() as SubmittedTools:
+                                NodesToSave = stageFunc(**kwargs)
+                                self._SaveNodes(NodesToSave)
+                        except:
+                            errorStr = '\n' + '-' * 60 + '\n'
+                            errorStr = errorStr + str(PipelineModule) + '.' + str(PipelineFunction) + " Exception\n"
+                            errorStr = errorStr + '-' * 60 + '\n'
+                            errorStr = errorStr + traceback.format_exc()
+                            errorStr = errorStr + '-' * 60 + '\n'
+                            PipelineManager.logger.error(errorStr)
+                            # prettyoutput.LogErr(errorStr)
+
+                            if not self.Journal is None:
+                                self.Journal.MarkFailed(VolumeElem)
+
+                            if not Snapshot is None:
+                                self._RollBack(Snapshot, NumSaves)
+                            elif self._SchedulingStages:
+                                # Stages for other elements are still using the volume, reload once they finish
+                                self._ReloadAfterStages = True
+                            else:
+                                self._DiscardSaves()
+                                self._ReloadVolume()
+                            return
                          
                         
-                else:
-                    # In debug mode we do not want to catch any exceptions
-                    # stage functions can return None,True, or False to indicate they did work.
-                    # if they return false we do not need to run the expensive save operation
-                    print(str(PipelineModule) + '.' + str(PipelineFunction))
+                    else:
+                        # In debug mode we do not want to catch any exceptions
+                        # stage functions can return None,True, or False to indicate they did work.
+                        # if they return false we do not need to run the expensive save operation
+                        print(str(PipelineModule) + '.' + str(PipelineFunction))
                     
-                    NodesToSave = stageFunc(**kwargs)
+                        with toolscheduler.RecordSubmissions() as SubmittedTools:
+                            NodesToSave = stageFunc(**kwargs)
+                            self._SaveNodes(NodesToSave)
+
+                # The outputs of external tools the stage queued are added by their completion callbacks
+                OutstandingTools = [job for job in SubmittedTools if not job.Completed]
+                if len(OutstandingTools) > 0:
+                    self._JournalAfterTools(PipelineNode, VolumeElem, kwargs, OutstandingTools)
+                    return
+
+                if Memoize:
+                    self._QueueMemoKey(VolumeElem, PipelineNode, FunctionName, kwargs)
 
-                PipelineManager._SaveNodes(NodesToSave)
+                if not self.Journal is None:
+                    self.Journal.Add(PipelineNode, VolumeElem, kwargs)
 
             finally:
                 ArgSet.ClearAttributes()
@@ -798,6 +1195,17 @@ class PipelineManager(object):
 #           PipelineManager.RemoveParameters(dargs, PipelineNode)
 #           PipelineManager.RemoveAttributes(dargs, PipelineNode)
 
+    def PlanPythonCall(self, VolumeElem, FunctionName, kwargs, Unchanged):
+        '''Add a stage the dry run reached to the plan instead of calling it'''
+        if Unchanged:
+            Status = 'Unchanged'
+        elif self.Plan.IsPending(VolumeElem):
+            Status = 'Run after'
+        else:
+            Status = 'Run'
+
+        self.Plan.AddStage(FunctionName, VolumeElem, Status, self.Plan.EstimateInputSize(kwargs, VolumeElem))
+
     def AddPipelineNodeVariable(self, PipelineNode, VolumeElem, ArgSet):
         '''Adds a variable to our dictionary passed to functions'''
         if 'VariableName' in PipelineNode.attrib:
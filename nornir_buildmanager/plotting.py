@@ -0,0 +1,13 @@
+'''
+Created on Oct 19, 2026
+
+Shared state for code that draws with :py:mod:`nornir_shared.plot`.
+
+pyplot keeps global state and is not thread safe.  Stages that run concurrently, see
+:py:mod:`stagescheduler`, hold :py:data:`PlotLock` while they draw.
+'''
+
+import threading
+
+# Held while drawing with pyplot
+PlotLock = threading.Lock()
@@ -0,0 +1,181 @@
+'''
+Created on Oct 19, 2026
+
+Coalesces saves of volume meta-data.
+
+Stage functions that yield nodes, for example one per tile or pyramid level, used to write a
+VolumeData.xml file for every node they yielded.  A :py:class:`SaveQueue` instead records which
+containers are dirty and writes each once when it is flushed.  The pipeline manager flushes:
+
+* When an element of an ``<Iterate>`` finishes
+* Before a stage that is recovered by reloading the volume runs, see :py:mod:`subtreesnapshot`
+* When the pipeline finishes or stops with an exception
+* When the number of nodes added or the time since the oldest unsaved change reaches a threshold
+
+When the stage scheduler runs the stages of several elements at once, other threads change the
+meta-data of the elements that are still running.  Saving sorts and indexes the children of a
+container, so only the containers below an element whose stages are finished are flushed, and nodes
+added by running stages never trigger a threshold flush.  See :py:meth:`SaveQueue.Flush`.
+
+Saving a container also saves the containers below it, so a dirty container below another dirty
+container is not saved separately.  Containers are saved deepest first.  A build interrupted between
+flushes loses at most the meta-data changed since the last flush.  Every VolumeData.xml file on disk
+is still a complete save of its container, and stages whose meta-data was lost run again.
+'''
+
+import collections
+import threading
+import time
+
+# Defaults for the flush thresholds
+DefaultMaxNodes = 64
+DefaultMaxSeconds = 30.0
+
+
+def SavedElement(node):
+    '''
+    :return: The container element whose VolumeData.xml file records the node
+    '''
+    while not hasattr(node, 'Save') and not getattr(node, 'Parent', None) is None:
+        node = node.Parent
+
+    return node
+
+
+def IsInSubtree(node, Root):
+    '''
+    :return: True if the node is the root or one of its descendants
+    '''
+    while not node is None:
+        if node is Root:
+            return True
+
+        node = getattr(node, 'Parent', None)
+
+    return False
+
+
+def _Depth(node):
+    depth = 0
+    parent = getattr(node, 'Parent', None)
+    while not parent is None:
+        depth += 1
+        parent = getattr(parent, 'Parent', None)
+
+    return depth
+
+
+class SaveQueue(object):
+    '''Containers with unsaved changes'''
+
+    def __init__(self, SaveFunc, MaxNodes=None, MaxSeconds=None):
+        '''
+        :param func SaveFunc: Called with each container to save
+        :param int MaxNodes: Flush after this many nodes are added.  None or zero to only flush when Flush is called.
+        :param float MaxSeconds: Flush when a node is added this long after the oldest unsaved change.  None or zero to only flush when Flush is called.
+        '''
+        self.SaveFunc = SaveFunc
+        self.MaxNodes = None if MaxNodes is None or MaxNodes <= 0 else MaxNodes
+        self.MaxSeconds = None if MaxSeconds is None or MaxSeconds <= 0 else MaxSeconds
+
+        self._lock = threading.RLock()
+        self._dirty = collections.OrderedDict()  # id of container -> container
+        self._NumAdded = 0
+        self._OldestChange = None
+        self.NumSaves = 0
+
+    def __len__(self):
+        return len(self._dirty)
+
+    def Add(self, node, CheckThresholds=True):
+        '''Record that the node changed and flush if a threshold is reached
+           :param bool CheckThresholds: False if the node is changed by stages still running for other elements, which must not be flushed'''
+        if node is None:
+            return
+
+        container = SavedElement(node)
+        with self._lock:
+            self._dirty[id(container)] = container
+            self._NumAdded += 1
+            if self._OldestChange is None:
+                self._OldestChange = time.monotonic()
+
+            if CheckThresholds and self._ThresholdReached():
+                self.Flush()
+
+    def Discard(self, container):
+        '''Forget unsaved changes to a container that is no longer part of the volume'''
+        with self._lock:
+            self._dirty.pop(id(container), None)
+
+    def Clear(self):
+        '''Forget every unsaved change, before the volume is reloaded'''
+        with self._lock:
+            self._dirty.clear()
+            self._NumAdded = 0
+            self._OldestChange = None
+
+    def _ThresholdReached(self):
+        if not self.MaxNodes is None and self._NumAdded >= self.MaxNodes:
+            return True
+
+        if not self.MaxSeconds is None and time.monotonic() - self._OldestChange >= self.MaxSeconds:
+            return True
+
+        return False
+
+    def HasDirtyAncestor(self, node):
+        '''
+        :return: True if a container above the node has unsaved changes
+        '''
+        with self._lock:
+            parent = getattr(node, 'Parent', None)
+            while not parent is None:
+                if id(parent) in self._dirty:
+                    return True
+
+                parent = getattr(parent, 'Parent', None)
+
+            return False
+
+    def Flush(self, Root=None):
+        '''Save the dirty containers
+           :param Root: Only save dirty containers that are the root or below it.  None to save every dirty container.
+           :return: Number of containers saved'''
+        with self._lock:
+            if Root is None:
+                dirty = list(self._dirty.values())
+                self._dirty.clear()
+            else:
+                dirty = [container for container in self._dirty.values() if IsInSubtree(container, Root)]
+                for container in dirty:
+                    del self._dirty[id(container)]
+
+            if len(self._dirty) == 0:
+                self._NumAdded = 0
+                self._OldestChange = None
+
+            DirtyIDs = set([id(container) for container in dirty])
+            ToSave = []
+            for container in dirty:
+                parent = getattr(container, 'Parent', None)
+                while not parent is None and not id(parent) in DirtyIDs:
+                    parent = getattr(parent, 'Parent', None)
+
+                # A dirty ancestor saves this container
+                if parent is None:
+                    ToSave.append(container)
+
+            ToSave.sort(key=_Depth, reverse=True)
+
+            for (i, container) in enumerate(ToSave):
+                try:
+                    self.SaveFunc(container)
+                except:
+                    # Keep what was not saved so a later flush can try again
+                    for unsaved in ToSave[i:]:
+                        self._dirty[id(unsaved)] = unsaved
+                    raise
+
+            self.NumSaves += len(ToSave)
+            return len(ToSave)
@@ -0,0 +1,165 @@
+'''
+Created on Oct 19, 2026
+
+Skips pipeline stages whose inputs have not changed since they last ran.
+
+A ``<PythonCall>`` opts in with ``Memoize="True"``.  Its key is a SHA-256 digest of the stage
+function's name and the arguments it is called with.  Arguments that are volume meta-data elements
+contribute a fingerprint of their subtree instead of their identity:
+
+* The tag, attributes and text of every element in the subtree
+* The size and modification time of the file each element in the subtree refers to, if any.  For a
+  directory, such as a pyramid level, those of each file in it, so a tile rewritten in place changes
+  the key.  Subdirectories only contribute their own size and modification time.
+
+Ancestors of the element the stage runs against, such as the section variable of an enclosing
+``<Iterate>``, only contribute their own attributes and not their subtree or files.  Otherwise work done by other stages elsewhere
+in the section would invalidate the key.
+
+The key is recorded on the element the stage ran against, the element selected by the enclosing
+``<Iterate>`` or the volume.  It is computed when the iteration for that element finishes, after the
+later stages of the iteration have run, or as soon as the stage finishes if it ran against the volume.
+The outputs the stage and the later stages add below its inputs are therefore part of the recorded key.
+On the next run an unchanged volume produces the same key before the stage is called, so the call is
+skipped.  Any change to the inputs or outputs, such as a new argument value, a replaced transform or a
+deleted image directory, changes the key and the stage runs again.  Stages of an enclosing iteration
+that run after the iteration finishes and change the inputs also change the key, so the stage runs
+once more before it is skipped.
+
+Keys are stored in attributes named by :py:func:`MemoAttributeName`, which are excluded from fingerprints.
+'''
+
+import hashlib
+import os
+
+from xml.etree import ElementTree
+
+# Prefix of the attributes recording stage keys on meta-data elements
+MemoAttributePrefix = 'StageKey.'
+
+# Attributes controlling memoization.  They are not passed to stage functions.
+MemoAttributes = ('Memoize',)
+
+# Keyword arguments describing where the stage runs rather than what it computes
+IgnoredArguments = ('Logger', 'VolumeNode', 'VolumeElement')
+
+
+def IsMemoized(PipelineNode):
+    '''
+    :return: True if the <PythonCall> opted in to memoization
+    '''
+    return PipelineNode.attrib.get('Memoize', 'False') == 'True'
+
+
+def MemoAttributeName(PipelineNode):
+    '''
+    :return: Attribute name for the key of a <PythonCall>.  Calls of one function from different places in a pipeline use different names.
+    '''
+    CallSite = hashlib.sha1(repr(sorted(PipelineNode.attrib.items())).encode('utf-8')).hexdigest()[:8]
+    return MemoAttributePrefix + PipelineNode.attrib.get('Function', PipelineNode.tag) + '.' + CallSite
+
+
+def _IsElement(value):
+    return isinstance(value, ElementTree.Element)
+
+
+def _StatStamp(stats):
+    return (stats.st_size, stats.st_mtime_ns)
+
+
+def _PathStamp(elem):
+    '''Size and modification time of the file an element refers to, or of each file in the directory it refers to'''
+    if not 'Path' in elem.attrib:
+        return None
+
+    try:
+        fullpath = elem.FullPath
+    except Exception:
+        return None
+
+    try:
+        if not os.path.isdir(fullpath):
+            return _StatStamp(os.stat(fullpath))
+
+        with os.scandir(fullpath) as it:
+            return sorted([(entry.name, _StatStamp(entry.stat())) for entry in it])
+    except OSError:
+        return 'Missing'
+
+
+def AncestorIDs(elem):
+    '''
+    :return: Set of the ids of the element's ancestors in the meta-data
+    '''
+    ancestors = set()
+    parent = getattr(elem, 'Parent', None)
+    while not parent is None:
+        ancestors.add(id(parent))
+        parent = getattr(parent, 'Parent', None)
+
+    return ancestors
+
+
+def _UpdateWithElement(digest, elem, Ancestors):
+    IsAncestor = id(elem) in Ancestors
+    nodes = [elem] if IsAncestor else elem.iter()
+
+    for node in nodes:
+        attribs = [(k, v) for (k, v) in node.attrib.items() if not k.startswith(MemoAttributePrefix)]
+        text = '' if node.text is None else node.text.strip()
+        digest.update(repr((node.tag, sorted(attribs), text)).encode('utf-8'))
+
+        if not IsAncestor:
+            digest.update(repr(_PathStamp(node)).encode('utf-8'))
+
+
+def _UpdateWithValue(digest, value, Ancestors):
+    if _IsElement(value):
+        digest.update(b'Element')
+        _UpdateWithElement(digest, value, Ancestors)
+    elif isinstance(value, dict):
+        digest.update(b'dict')
+        for key in sorted(value.keys(), key=str):
+            digest.update(repr(key).encode('utf-8'))
+            _UpdateWithValue(digest, value[key], Ancestors)
+    elif isinstance(value, (list, tuple)):
+        digest.update(type(value).__name__.encode('utf-8'))
+        for item in value:
+            _UpdateWithValue(digest, item, Ancestors)
+    else:
+        # Objects without a stable repr produce a different key every run and are never skipped
+        digest.update(repr(value).encode('utf-8'))
+
+
+def ComputeKey(FunctionName, kwargs, VolumeElem=None):
+    '''
+    :param str FunctionName: Fully qualified name of the stage function
+    :param dict kwargs: Keyword arguments the stage function is called with
+    :param VolumeElem: Element the stage runs against.  Only the attributes of its ancestors are included.
+    :return: Hex digest identifying the call and the current state of its inputs
+    '''
+    Ancestors = set() if VolumeElem is None else AncestorIDs(VolumeElem)
+
+    digest = hashlib.sha256()
+    digest.update(FunctionName.encode('utf-8'))
+
+    for key in sorted(kwargs.keys()):
+        if key in IgnoredArguments:
+            continue
+
+        digest.update(key.encode('utf-8'))
+        _UpdateWithValue(digest, kwargs[key], Ancestors)
+
+    return digest.hexdigest()
+
+
+def IsCurrent(VolumeElem, PipelineNode, Key):
+    '''
+    :return: True if the key recorded for the call on the element matches
+    '''
+    return VolumeElem.attrib.get(MemoAttributeName(PipelineNode), None) == Key
+
+
+def Record(VolumeElem, PipelineNode, Key):
+    '''Record the key for the call on the element'''
+    VolumeElem.attrib[MemoAttributeName(PipelineNode)] = Key
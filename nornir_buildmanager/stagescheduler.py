@@ -0,0 +1,225 @@
+'''
+Created on Oct 19, 2026
+
+Runs the stages of an ``<Iterate>`` pipeline element for several volume elements at once.
+
+An ``<Iterate>`` is compiled into a dependency graph with one task for every (stage, element) pair,
+where the stages are the child elements of the ``<Iterate>``.  The stages for one element depend on
+each other and run in pipeline order.  Different elements, usually sections, are independent, so
+pyramid building for one section can overlap pruning of the next.  When a stage skips the rest of an
+iteration, for example because a ``<Select>`` matched nothing, the element's remaining tasks are dropped.
+
+Each task declares the resources it needs with optional attributes on its stage element:
+
+* ``Cores``: Number of cores the stage keeps busy, 1 by default
+* ``MemoryGB``: Estimated peak memory, 0 by default
+* ``IO``: 1 if the stage is limited by disk reads and writes, 0 by default
+
+A stage such as a nested ``<Iterate>`` that declares nothing uses the largest values declared by its
+descendants.  ``<Select>`` and ``<Require...>`` elements use no resources.  Tasks start in section and
+stage order as the core, memory and I/O budgets allow.  A task is always allowed to start if nothing
+else is running, so a task larger than the budget still runs, alone.
+
+Stages run concurrently must only change the meta-data below their own element.  An ``<Iterate>``
+opts in with ``Concurrent="True"``; others always run in order.  pyplot is not thread safe, so code
+that plots holds :py:data:`nornir_buildmanager.plotting.PlotLock` while it draws.
+'''
+
+import collections
+import logging
+import multiprocessing
+import threading
+
+# Attributes describing the resources a stage uses.  They are not passed to stage functions.
+StageResourceAttributes = ('Cores', 'MemoryGB', 'IO')
+
+StageResources = collections.namedtuple('StageResources', ('Cores', 'MemoryGB', 'IO'))
+
+DefaultStageResources = StageResources(1, 0, 0)
+
+# Stages that only evaluate the meta-data
+_NoResources = StageResources(0, 0, 0)
+_TestStageTags = ('Select', 'RequireMatch', 'RequireSetMembership', 'Arguments')
+
+
+def _DeclaredResources(StageNode):
+    '''
+    :return: StageResources declared by attributes on the stage, or None if nothing is declared
+    '''
+    if not any([name in StageNode.attrib for name in StageResourceAttributes]):
+        return None
+
+    return StageResources(int(StageNode.attrib.get('Cores', DefaultStageResources.Cores)),
+                          float(StageNode.attrib.get('MemoryGB', DefaultStageResources.MemoryGB)),
+                          int(StageNode.attrib.get('IO', DefaultStageResources.IO)))
+
+
+def GetStageResources(StageNode):
+    '''
+    :return: StageResources needed to run the stage element
+    '''
+    declared = _DeclaredResources(StageNode)
+    if not declared is None:
+        return declared
+
+    if StageNode.tag in _TestStageTags:
+        return _NoResources
+
+    if StageNode.tag == 'PythonCall':
+        return DefaultStageResources
+
+    ChildResources = [GetStageResources(child) for child in StageNode if not child.tag in _TestStageTags]
+    if len(ChildResources) == 0:
+        return DefaultStageResources
+
+    return StageResources(max([r.Cores for r in ChildResources]),
+                          max([r.MemoryGB for r in ChildResources]),
+                          max([r.IO for r in ChildResources]))
+
+
+class StageTask(object):
+    '''Runs one stage of an <Iterate> for one element'''
+
+    def __init__(self, ElementIndex, StageIndex, Element, StageNode, ArgSet, Resources):
+        self.ElementIndex = ElementIndex
+        self.StageIndex = StageIndex
+        self.Element = Element
+        self.StageNode = StageNode
+        self.ArgSet = ArgSet
+        self.Resources = Resources
+        self.Next = None  # The task that depends on this task
+
+    @property
+    def Priority(self):
+        return (self.ElementIndex, self.StageIndex)
+
+    def __str__(self):
+        return "%s #%d stage %d" % (self.StageNode.tag, self.ElementIndex, self.StageIndex)
+
+
+def CompileIterate(IterateNode, ElementArgSets):
+    '''
+    Build the dependency graph for an <Iterate> element.
+    :param IterateNode: The <Iterate> pipeline element
+    :param list ElementArgSets: (element, ArgumentSet) for each element the <Iterate> selected.  Each element must have its own ArgumentSet.
+    :return: List of the first task for each element.  Later tasks are reached through StageTask.Next.
+    '''
+    Stages = [(iStage, StageNode, GetStageResources(StageNode)) for (iStage, StageNode) in enumerate(IterateNode)]
+
+    Roots = []
+    for (iElement, (Element, ArgSet)) in enumerate(ElementArgSets):
+        Previous = None
+        for (iStage, StageNode, Resources) in Stages:
+            task = StageTask(iElement, iStage, Element, StageNode, ArgSet, Resources)
+            if Previous is None:
+                Roots.append(task)
+            else:
+                Previous.Next = task
+
+            Previous = task
+
+    return Roots
+
+
+class StageScheduler(object):
+    '''Runs a dependency graph of stage tasks within core, memory and I/O budgets'''
+
+    logger = logging.getLogger(__name__ + '.StageScheduler')
+
+    def __init__(self, MaxCores=None, MaxMemoryGB=None, MaxIO=None):
+        '''
+        :param int MaxCores: Maximum number of cores used by running stages.  Defaults to the number of cores.
+        :param float MaxMemoryGB: Maximum estimated memory used by running stages.  None or zero for no limit.
+        :param int MaxIO: Maximum number of I/O bound stages running at once.  None or zero for no limit.
+        '''
+        self.MaxCores = multiprocessing.cpu_count() if MaxCores is None or MaxCores < 1 else MaxCores
+        self.MaxMemoryGB = None if MaxMemoryGB is None or MaxMemoryGB <= 0 else MaxMemoryGB
+        self.MaxIO = None if MaxIO is None or MaxIO <= 0 else MaxIO
+
+        self._lock = threading.Condition()
+        self._ready = []
+        self._num_running = 0
+        self._used = StageResources(0, 0, 0)
+
+    def _CanStart(self, task):
+        '''Must be called with the lock held'''
+        if self._num_running == 0:
+            return True
+
+        if self._used.Cores + task.Resources.Cores > self.MaxCores:
+            return False
+
+        if not self.MaxMemoryGB is None and self._used.MemoryGB + task.Resources.MemoryGB > self.MaxMemoryGB:
+            return False
+
+        if not self.MaxIO is None and self._used.IO + task.Resources.IO > self.MaxIO:
+            return False
+
+        return True
+
+    def _Reserve(self, resources, sign):
+        self._used = StageResources(self._used.Cores + sign * resources.Cores,
+                                    self._used.MemoryGB + sign * resources.MemoryGB,
+                                    self._used.IO + sign * resources.IO)
+
+    def Run(self, Roots, RunTask):
+        '''
+        Run every task in the graph and wait for them to finish.
+        :param list Roots: Tasks with no dependencies
+        :param func RunTask: Called with each task on a worker thread.  Returns False to drop the element's remaining tasks.
+        :return: Number of tasks that ran and did not drop their successors
+        '''
+        self._ready = sorted(Roots, key=lambda t: t.Priority)
+        NumCompleted = 0
+        Failures = []
+
+        def Worker(task):
+            nonlocal NumCompleted
+            Continue = False
+            try:
+                Continue = RunTask(task)
+            except BaseException as e:
+                StageScheduler.logger.error("%s failed: %s" % (str(task), str(e)))
+                Failures.append(e)
+
+            with self._lock:
+                self._num_running -= 1
+                self._Reserve(task.Resources, -1)
+                if Continue:
+                    NumCompleted += 1
+                    if not task.Next is None:
+                        self._ready.append(task.Next)
+                        self._ready.sort(key=lambda t: t.Priority)
+
+                self._lock.notify_all()
+
+        with self._lock:
+            while True:
+                # Once a stage fails no new tasks start, the pipeline stops after the running tasks finish
+                if len(Failures) > 0:
+                    self._ready = []
+
+                if len(self._ready) == 0 and self._num_running == 0:
+                    break
+
+                started = False
+                for task in list(self._ready):
+                    if not self._CanStart(task):
+                        continue
+
+                    self._ready.remove(task)
+                    self._num_running += 1
+                    self._Reserve(task.Resources, 1)
+
+                    t = threading.Thread(target=Worker, args=(task,), name=str(task))
+                    t.daemon = True
+                    t.start()
+                    started = True
+
+                if not started:
+                    self._lock.wait()
+
+        if len(Failures) > 0:
+            raise Failures[0]
+
+        return NumCompleted
@@ -0,0 +1,227 @@
+'''
+Created on Oct 19, 2026
+
+Records the wall time, CPU time, memory and I/O used by each pipeline stage.
+
+A trace is started with :py:func:`Begin`.  While it is active, the pipeline manager records one span
+for every ``<PythonCall>`` it runs, for every element of a sequential ``<Iterate>``, and for every
+pipeline.  The trace can be written in the Chrome trace event format, which ``chrome://tracing`` and
+Perfetto display as a timeline, and summarized as a table of the stages taking the most time.
+
+Each span records:
+
+* ``Wall``: Elapsed seconds
+* ``CPU``: CPU seconds used by the process and by the tools it ran that finished during the span
+* ``PeakRSS``: Largest resident memory of the process seen during the span, in bytes
+* ``ReadBytes``, ``WriteBytes``: Bytes the process read from and wrote to disk
+
+CPU, memory and I/O are measured for the whole process.  Stages running at once under the stage
+scheduler share them, so their spans overlap.  Peak memory is the larger of the resident memory at
+the start and end of the span, unless the process reached a new high-water mark during the span.
+Memory and I/O require psutil.  Without it memory falls back to the high-water mark reported by the
+resource module and I/O is not recorded.
+'''
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from .executionplan import DescribeElement, FormatBytes, SectionNumber
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Files written to the volume directory when a build is traced
+TraceFileName = 'Trace.json'
+SummaryFileName = 'TraceSummary.txt'
+
+StageSpan = collections.namedtuple('StageSpan', ('Name', 'Category', 'Element', 'Section', 'ThreadID',
+                                                 'Start', 'Wall', 'CPU', 'PeakRSS', 'ReadBytes', 'WriteBytes'))
+
+_Sample = collections.namedtuple('_Sample', ('Time', 'CPU', 'RSS', 'HighWater', 'ReadBytes', 'WriteBytes'))
+
+# The trace recording spans, None when tracing is off
+_ActiveTrace = None
+
+
+def _HighWaterMark(process):
+    '''Largest resident memory of the process since it started, in bytes, or None if unknown'''
+    if not process is None and hasattr(process.memory_info(), 'peak_wset'):
+        return process.memory_info().peak_wset
+
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes except on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _IOCounters(process):
+    if process is None:
+        return (None, None)
+
+    try:
+        counters = process.io_counters()
+        return (counters.read_bytes, counters.write_bytes)
+    except (AttributeError, NotImplementedError, psutil.Error):
+        return (None, None)
+
+
+def _Difference(after, before):
+    if after is None or before is None:
+        return None
+
+    return after - before
+
+
+class StageTrace(object):
+    '''Spans recorded while a trace is active'''
+
+    def __init__(self):
+        self.Spans = []
+        self._lock = threading.Lock()
+        self._process = None if psutil is None else psutil.Process()
+        self._Origin = time.perf_counter()
+
+    def _Sample(self):
+        times = os.times()
+        (ReadBytes, WriteBytes) = _IOCounters(self._process)
+        return _Sample(time.perf_counter() - self._Origin,
+                       times.user + times.system + times.children_user + times.children_system,
+                       None if self._process is None else self._process.memory_info().rss,
+                       _HighWaterMark(self._process),
+                       ReadBytes,
+                       WriteBytes)
+
+    @classmethod
+    def _PeakRSS(cls, before, after):
+        values = [v for v in (before.RSS, after.RSS) if not v is None]
+        if not after.HighWater is None and (before.HighWater is None or after.HighWater > before.HighWater):
+            values.append(after.HighWater)
+
+        return max(values) if len(values) > 0 else None
+
+    @contextlib.contextmanager
+    def Record(self, Name, Category, Element=None):
+        '''
+        Record a span for the body of a with statement
+        :param str Name: Name of the stage
+        :param str Category: Kind of span, such as Stage, Iterate or Pipeline
+        :param Element: The meta-data element the stage runs against
+        '''
+        before = self._Sample()
+        try:
+            yield
+        finally:
+            after = self._Sample()
+            span = StageSpan(Name, Category,
+                             None if Element is None else DescribeElement(Element),
+                             None if Element is None else SectionNumber(Element),
+                             threading.get_ident(),
+                             before.Time,
+                             after.Time - before.Time,
+                             after.CPU - before.CPU,
+                             StageTrace._PeakRSS(before, after),
+                             _Difference(after.ReadBytes, before.ReadBytes),
+                             _Difference(after.WriteBytes, before.WriteBytes))
+
+            with self._lock:
+                self.Spans.append(span)
+
+    def ChromeTraceEvents(self):
+        '''
+        :return: The spans as a Chrome trace event format document
+        '''
+        pid = os.getpid()
+        events = []
+        for span in self.Spans:
+            args = collections.OrderedDict()
+            for field in ('Element', 'Section', 'CPU', 'PeakRSS', 'ReadBytes', 'WriteBytes'):
+                value = getattr(span, field)
+                if not value is None:
+                    args[field] = value
+
+            events.append({'name': span.Name,
+                           'cat': span.Category,
+                           'ph': 'X',
+                           'ts': span.Start * 1e6,
+                           'dur': span.Wall * 1e6,
+                           'pid': pid,
+                           'tid': span.ThreadID,
+                           'args': args})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def WriteChromeTrace(self, FullPath):
+        with open(FullPath, 'w') as OutputFile:
+            json.dump(self.ChromeTraceEvents(), OutputFile)
+
+    def Summary(self):
+        '''
+        :return: A table of the total time, CPU, memory and I/O of each stage, slowest first
+        '''
+        Totals = collections.OrderedDict()
+        for span in self.Spans:
+            key = (span.Category, span.Name)
+            if not key in Totals:
+                Totals[key] = {'Calls': 0, 'Wall': 0.0, 'MaxWall': 0.0, 'CPU': 0.0, 'PeakRSS': None, 'ReadBytes': None, 'WriteBytes': None}
+
+            total = Totals[key]
+            total['Calls'] += 1
+            total['Wall'] += span.Wall
+            total['MaxWall'] = max(total['MaxWall'], span.Wall)
+            total['CPU'] += span.CPU
+            if not span.PeakRSS is None:
+                total['PeakRSS'] = span.PeakRSS if total['PeakRSS'] is None else max(total['PeakRSS'], span.PeakRSS)
+            for field in ('ReadBytes', 'WriteBytes'):
+                if not getattr(span, field) is None:
+                    total[field] = (total[field] or 0) + getattr(span, field)
+
+        def Bytes(value):
+            return '-' if value is None else FormatBytes(value)
+
+        lines = ['%-9s %-40s %6s %10s %10s %10s %10s %10s %10s' % ('Category', 'Name', 'Calls', 'Wall (s)', 'Max (s)', 'CPU (s)', 'Peak RSS', 'Read', 'Written')]
+        for ((Category, Name), total) in sorted(Totals.items(), key=lambda item: item[1]['Wall'], reverse=True):
+            lines.append('%-9s %-40s %6d %10.2f %10.2f %10.2f %10s %10s %10s' % (Category, Name, total['Calls'], total['Wall'], total['MaxWall'], total['CPU'],
+                                                                                Bytes(total['PeakRSS']), Bytes(total['ReadBytes']), Bytes(total['WriteBytes'])))
+
+        return '\n'.join(lines)
+
+
+def Begin():
+    '''Start recording spans
+       :return: The new StageTrace'''
+    global _ActiveTrace
+    _ActiveTrace = StageTrace()
+    return _ActiveTrace
+
+
+def End():
+    '''Stop recording spans
+       :return: The StageTrace that was active, or None'''
+    global _ActiveTrace
+    Trace = _ActiveTrace
+    _ActiveTrace = None
+    return Trace
+
+
+def Record(Name, Category, Element=None):
+    '''
+    Record a span in the active trace for the body of a with statement.  Does nothing when no trace is active.
+    '''
+    if _ActiveTrace is None:
+        return contextlib.nullcontext()
+
+    return _ActiveTrace.Record(Name, Category, Element)
@@ -0,0 +1,66 @@
+'''
+Created on Oct 19, 2026
+
+Restores the meta-data below an element after a stage fails.
+
+Before a stage runs against the element of an ``<Iterate>``, usually a section, a
+:py:class:`SubtreeSnapshot` records the attributes, text, children and parent of every element
+loaded below it.  If the stage raises, :py:meth:`SubtreeSnapshot.Restore` puts them back.  Elements
+the stage added are dropped and elements it removed are returned to their parents.  Elements keep
+their identity, so variables referring to them from enclosing pipeline elements remain valid.
+
+Taking and restoring a snapshot costs time proportional to the size of the subtree, and nothing is
+read from disk.  A snapshot can only undo a stage that changes nothing but the meta-data below its own
+element, so stage functions opt in with the :py:func:`OnlyChangesOwnElement` decorator.  Other stages,
+such as those iterating over the mappings of a StosMap while adding transforms to a StosGroup, are
+recovered by reloading the volume.
+'''
+
+_NoParent = object()
+
+
+def OnlyChangesOwnElement(stageFunc):
+    '''Decorator declaring that a stage function only changes the meta-data below the element it runs against'''
+    stageFunc.OnlyChangesOwnElement = True
+    return stageFunc
+
+
+def CanRestore(stageFunc):
+    '''
+    :return: True if a failure of the stage function can be undone by restoring a snapshot of its element
+    '''
+    return getattr(stageFunc, 'OnlyChangesOwnElement', False)
+
+
+class SubtreeSnapshot(object):
+    '''State of the elements below a meta-data element'''
+
+    def __init__(self, Root):
+        '''
+        :param Root: The element whose subtree is recorded
+        '''
+        self.Root = Root
+        self._State = [(elem, dict(elem.attrib), elem.text, elem.tail, list(elem), getattr(elem, 'Parent', _NoParent)) for elem in Root.iter()]
+
+    def __len__(self):
+        return len(self._State)
+
+    def Restore(self):
+        '''
+        Return the subtree to its state when the snapshot was taken
+        :return: List of the elements the snapshot did not contain, which are no longer in the subtree
+        '''
+        Recorded = set([id(state[0]) for state in self._State])
+        Discarded = [elem for elem in self.Root.iter() if not id(elem) in Recorded]
+
+        for (elem, attrib, text, tail, children, parent) in self._State:
+            elem.attrib.clear()
+            elem.attrib.update(attrib)
+            elem.text = text
+            elem.tail = tail
+            elem[:] = children
+
+            if not parent is _NoParent:
+                elem.Parent = parent
+
+        return Discarded
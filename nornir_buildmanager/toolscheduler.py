@@ -0,0 +1,329 @@
+'''
+Created on Oct 19, 2026
+
+Runs external command line tools, such as ir-refine-grid and ir-stos-grid, for several sections at once.
+
+The number of tools running at once is limited by a core count and an estimate of the memory each tool
+requires.  Completion callbacks are never invoked from the threads waiting on the tools.  They are invoked
+from the thread calling :py:meth:`ExternalToolScheduler.Poll` or :py:meth:`ExternalToolScheduler.Wait`, so
+callbacks may safely edit volume meta-data.
+
+A stage that submits a tool usually returns before the tool finishes.  The pipeline manager records the
+tools each stage submitted with :py:func:`RecordSubmissions` and does not journal or memoize the stage
+until their completion callbacks have run.
+'''
+
+import collections
+import contextlib
+import logging
+import multiprocessing
+import os
+import subprocess
+import threading
+
+import nornir_shared.prettyoutput as prettyoutput
+
+ToolResult = collections.namedtuple('ToolResult', ('Name', 'Cmd', 'ReturnCode', 'Output'))
+
+#Rough ratio of memory used by ir-tools to the size of the image files it loads
+DefaultMemoryScale = 8
+
+#Number of lines of tool output recorded in the meta-data
+OutputLinesRecorded = 10
+
+
+class _ToolJob(object):
+
+    def __init__(self, Name, Cmd, OnComplete, Cores, Memory):
+        self.Name = Name
+        self.Cmd = Cmd
+        self.OnComplete = OnComplete
+        self.Cores = Cores
+        self.Memory = Memory
+
+        self._lock = threading.Lock()
+        self._AfterComplete = []
+        self.Completed = False
+        self.Succeeded = False
+
+    def WhenComplete(self, func):
+        '''Call func with the job after its completion callback has run, immediately if it already has'''
+        with self._lock:
+            if not self.Completed:
+                self._AfterComplete.append(func)
+                return
+
+        func(self)
+
+    def _Complete(self, Succeeded):
+        with self._lock:
+            self.Completed = True
+            self.Succeeded = Succeeded
+            AfterComplete = self._AfterComplete
+            self._AfterComplete = []
+
+        for func in AfterComplete:
+            func(self)
+
+
+# Lists of the jobs submitted by each thread, see RecordSubmissions
+_Submissions = threading.local()
+
+
+@contextlib.contextmanager
+def RecordSubmissions():
+    '''Record the tools submitted by the calling thread.
+    :return: List the jobs submitted within the with statement are appended to
+    '''
+    previous = getattr(_Submissions, 'Jobs', None)
+    jobs = []
+    _Submissions.Jobs = jobs
+    try:
+        yield jobs
+    finally:
+        _Submissions.Jobs = previous
+
+
+class ExternalToolScheduler(object):
+    '''Runs shell commands concurrently within a core and memory budget'''
+
+    logger = logging.getLogger(__name__ + '.ExternalToolScheduler')
+
+    def __init__(self, MaxCores=None, MaxMemory=None):
+        '''
+        :param int MaxCores: Maximum number of cores used by running tools.  Defaults to the number of cores.
+        :param int MaxMemory: Maximum estimated memory, in bytes, used by running tools.  None for no limit.
+        '''
+        self._lock = threading.Condition()
+        self._pending = collections.deque()
+        self._completed = collections.deque()
+        self._running = 0
+        self._committed_memory = 0
+
+        self.MaxCores = MaxCores
+        self.MaxMemory = MaxMemory
+
+    @property
+    def MaxCores(self):
+        return self._max_cores
+
+    @MaxCores.setter
+    def MaxCores(self, value):
+        if value is None or value < 1:
+            value = multiprocessing.cpu_count()
+
+        self._max_cores = int(value)
+
+    @property
+    def MaxMemory(self):
+        return self._max_memory
+
+    @MaxMemory.setter
+    def MaxMemory(self, value):
+        if not value is None and value <= 0:
+            value = None
+
+        self._max_memory = value
+
+    @property
+    def Outstanding(self):
+        '''Number of tools that are queued, running, or waiting for their completion callback'''
+        with self._lock:
+            return len(self._pending) + self._running + len(self._completed)
+
+    def Submit(self, Name, Cmd, OnComplete=None, Cores=1, Memory=0):
+        '''Queue a shell command.
+        :param str Name: Name used in log messages
+        :param str Cmd: Shell command to run
+        :param func OnComplete: Called with a ToolResult when the tool finishes.  Return values other than None are returned from Poll and Wait.
+        :param int Cores: Number of cores the tool uses
+        :param int Memory: Estimated memory, in bytes, the tool uses
+        '''
+
+        job = _ToolJob(Name, Cmd, OnComplete, Cores, Memory)
+
+        jobs = getattr(_Submissions, 'Jobs', None)
+        if not jobs is None:
+            jobs.append(job)
+
+        with self._lock:
+            self._pending.append(job)
+            self._Dispatch()
+
+    def _CanStart(self, job):
+        '''Must be called with the lock held.  A tool is always allowed to start if nothing else is running.'''
+        if self._running == 0:
+            return True
+
+        if self._running + job.Cores > self.MaxCores:
+            return False
+
+        if not self.MaxMemory is None and self._committed_memory + job.Memory > self.MaxMemory:
+            return False
+
+        if job.Memory > 0 and job.Memory > _AvailableMemory():
+            return False
+
+        return True
+
+    def _Dispatch(self):
+        '''Must be called with the lock held'''
+        while len(self._pending) > 0:
+            job = self._pending[0]
+            if not self._CanStart(job):
+                return
+
+            self._pending.popleft()
+            self._running += job.Cores
+            self._committed_memory += job.Memory
+
+            t = threading.Thread(target=self._Run, args=(job,), name=job.Name)
+            t.daemon = True
+            t.start()
+
+    def _Run(self, job):
+        prettyoutput.Log(job.Cmd)
+
+        try:
+            proc = subprocess.Popen(job.Cmd + " && exit", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            (output, unused) = proc.communicate()
+            result = ToolResult(job.Name, job.Cmd, proc.returncode, output.decode('utf-8', errors='replace'))
+        except Exception as e:
+            result = ToolResult(job.Name, job.Cmd, -1, str(e))
+
+        if result.ReturnCode != 0:
+            ExternalToolScheduler.logger.error("%s returned %d\n%s" % (job.Cmd, result.ReturnCode, result.Output))
+
+        with self._lock:
+            self._running -= job.Cores
+            self._committed_memory -= job.Memory
+            self._completed.append((job, result))
+            self._Dispatch()
+            self._lock.notify_all()
+
+    def _InvokeCallbacks(self, finished):
+        ReturnValues = []
+        for (job, result) in finished:
+            if job.OnComplete is None:
+                job._Complete(result.ReturnCode == 0)
+                continue
+
+            try:
+                retval = job.OnComplete(result)
+            except Exception as e:
+                ExternalToolScheduler.logger.error("Completion callback failed for %s\n%s" % (job.Name, str(e)))
+                job._Complete(False)
+                continue
+
+            job._Complete(result.ReturnCode == 0)
+
+            if not retval is None:
+                ReturnValues.append(retval)
+
+        return ReturnValues
+
+    def Poll(self):
+        '''Invoke the completion callbacks of any tools that have finished.
+        :return: List of values returned by the callbacks
+        '''
+        with self._lock:
+            finished = list(self._completed)
+            self._completed.clear()
+
+        return self._InvokeCallbacks(finished)
+
+    def Wait(self):
+        '''Wait for every queued tool to finish and invoke the completion callbacks as each tool completes.
+        :return: List of values returned by the callbacks
+        '''
+
+        ReturnValues = []
+        while True:
+            with self._lock:
+                while len(self._completed) == 0 and (self._running > 0 or len(self._pending) > 0):
+                    self._lock.wait()
+
+                if len(self._completed) == 0:
+                    return ReturnValues
+
+                finished = list(self._completed)
+                self._completed.clear()
+
+            ReturnValues.extend(self._InvokeCallbacks(finished))
+
+
+def _AvailableMemory():
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return float('inf')
+
+
+def RecordToolResult(node, result):
+    '''Record the exit status and the last lines of output from a tool on a meta-data node'''
+    node.attrib['ToolReturnCode'] = '%d' % result.ReturnCode
+
+    lines = [line for line in result.Output.splitlines() if len(line.strip()) > 0]
+    node.attrib['ToolOutput'] = '\n'.join(lines[-OutputLinesRecorded:])
+
+
+def EstimateToolMemory(paths, scale=None):
+    '''Estimate the memory a tool needs from the size of the files it loads.
+    :param list paths: Files or directories of files loaded by the tool
+    :param float scale: Ratio of memory used to file size, defaults to DefaultMemoryScale
+    :return: Estimated memory in bytes
+    '''
+
+    if scale is None:
+        scale = DefaultMemoryScale
+
+    if isinstance(paths, str):
+        paths = [paths]
+
+    total = 0
+    for path in paths:
+        if path is None:
+            continue
+
+        if os.path.isdir(path):
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+
+    return int(total * scale)
+
+
+__GlobalToolScheduler = None
+
+
+def GetGlobalToolScheduler(MaxCores=None, MaxMemoryGB=None):
+    '''Return the scheduler shared by all stages.  Limits that are passed replace the current limits.
+    :param int MaxCores: Maximum number of cores used by running tools
+    :param float MaxMemoryGB: Maximum estimated memory, in gigabytes, used by running tools.  Zero for no limit.
+    '''
+    global __GlobalToolScheduler
+
+    if __GlobalToolScheduler is None:
+        __GlobalToolScheduler = ExternalToolScheduler()
+
+    if not MaxCores is None:
+        __GlobalToolScheduler.MaxCores = MaxCores
+
+    if not MaxMemoryGB is None:
+        __GlobalToolScheduler.MaxMemory = int(MaxMemoryGB * (1 << 30)) if MaxMemoryGB > 0 else None
+
+    return __GlobalToolScheduler
+
+
+def WaitOnGlobalToolScheduler():
+    '''Wait for all tools queued on the global scheduler.
+    :return: List of values returned by the completion callbacks
+    '''
+    if __GlobalToolScheduler is None:
+        return []
+
+    return __GlobalToolScheduler.Wait()
@@ -0,0 +1,27 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+from xml.etree import ElementTree
+
+
+class Node(ElementTree.Element):
+    '''Minimal stand-in for the meta-data element wrappers, which know their parent and full path'''
+
+    # Directory the Path of an element without a parent is relative to
+    Root = None
+
+    def __init__(self, tag, Parent=None, **attrib):
+        super(Node, self).__init__(tag, attrib)
+        self.Parent = Parent
+        if not Parent is None:
+            Parent.append(self)
+
+    @property
+    def FullPath(self):
+        path = self.attrib['Path']
+        if self.Parent is None:
+            return os.path.join(Node.Root, path)
+
+        return os.path.join(self.Parent.FullPath, path)
@@ -5,12 +5,19 @@ Created on Apr 25, 2013
 '''
 import glob
 import unittest
+import unittest.mock
 
+import nornir_pools
 from nornir_buildmanager.operations.block import *
+from nornir_buildmanager.operations.block import _ComposeTileTransformsBatch, _IsBatchComposable, \
+    _PlanSliceToVolumeTransforms, _SliceToVolumeSubtrees
+from nornir_imageregistration.transforms import registrationtree
+from PIL import Image
 from test.pipeline.setup_pipeline import VerifyVolume, VolumeEntry, \
     CopySetupTestBase, EmptyVolumeTestBase
 
 import test.pipeline.test_sectionimage as test_sectionimage
+import test.testbase
 
 
 def FetchStosTransform(test, VolumeObj, groupName, ControlSection, MappedSection):
@@ -49,6 +56,266 @@ def FetchStosTransform(test, VolumeObj, groupName, ControlSection, MappedSection
 #         self.assertIsNotNone(TransformNode, "Stos pipeline did not complete")
 
 
+class ComposeTileTransformsBatchTest(unittest.TestCase):
+    '''The batch composition used by MosaicToVolume -Batch must match composing each tile with triangulation.AddTransforms'''
+
+    def setUp(self):
+        # A slice-to-volume transform that stretches and shifts the section
+        self.StoVTransform = triangulation.Triangulation(np.array([[0, 0, 0, 0],
+                                                                   [0, 220, 0, 200],
+                                                                   [210, 0, 200, 0],
+                                                                   [210, 220, 200, 200],
+                                                                   [105, 110, 100, 100]], dtype=np.float64))
+
+        self.ImageToTransform = {}
+        for (i, (Y, X)) in enumerate(((0, 0), (0, 90), (90, 0), (90, 90))):
+            self.ImageToTransform['%03d.png' % i] = triangulation.Triangulation(np.array([[Y, X, 0, 0],
+                                                                                           [Y, X + 100, 0, 100],
+                                                                                           [Y + 100, X, 100, 0],
+                                                                                           [Y + 100, X + 100, 100, 100]], dtype=np.float64))
+
+        self.TestPoints = np.array([[10, 10], [50, 50], [90, 20], [25, 75]], dtype=np.float64)
+
+    def CheckMatchesPerTile(self, ImageToTransform):
+        Batch = _ComposeTileTransformsBatch(self.StoVTransform, copy.deepcopy(ImageToTransform))
+        self.assertEqual(sorted(Batch.keys()), sorted(ImageToTransform.keys()))
+
+        for (name, TileTransform) in ImageToTransform.items():
+            PerTile = triangulation.AddTransforms(self.StoVTransform, copy.deepcopy(TileTransform))
+            np.testing.assert_allclose(Batch[name].Transform(self.TestPoints), PerTile.Transform(self.TestPoints), rtol=1e-6, atol=1e-6,
+                                       err_msg="Batch composition of %s does not match triangulation.AddTransforms" % name)
+
+    def testMeshTransforms(self):
+        self.CheckMatchesPerTile(self.ImageToTransform)
+
+    def testGridTransformsUseLibraryComposition(self):
+        GridTransform = self.ImageToTransform['000.png']
+        GridTransform.gridWidth = 2
+        GridTransform.gridHeight = 2
+        self.assertFalse(_IsBatchComposable(GridTransform))
+
+        self.CheckMatchesPerTile(self.ImageToTransform)
+
+
+class _FakeWarpView(object):
+    '''Writes placeholder outputs in place of measuring a .stos file'''
+
+    def __init__(self, StosFullPath):
+        self.StosFullPath = StosFullPath
+
+    def GenerateWarpImage(self, outputfullpath, **kwargs):
+        with open(outputfullpath, 'w') as f:
+            f.write(self.StosFullPath)
+
+    def GenerateWarpHistogram(self, HistogramDataFullPath):
+        h = unittest.mock.Mock()
+        h.Save.side_effect = lambda path: open(path, 'w').close()
+        return h
+
+
+class WarpMeasurementsTest(test.testbase.TestBase):
+    '''CalculateStosGroupWarpMeasurementImages measures each mapping of a group on a multithreading pool'''
+
+    NumMappings = 4
+
+    def setUp(self):
+        super(WarpMeasurementsTest, self).setUp()
+
+        self.BlockNode = unittest.mock.Mock()
+        self.StosMapNode = unittest.mock.Mock()
+        self.StosMapNode.FindParent.return_value = self.BlockNode
+
+        Mappings = []
+        self.TransformNodes = {}
+        for Mapped in range(2, 2 + self.NumMappings):
+            MappingNode = unittest.mock.Mock(Control=Mapped - 1, Mapped=[Mapped])
+            Mappings.append(MappingNode)
+
+            StosPath = '%d-%d.stos' % (Mapped, Mapped - 1)
+            with open(os.path.join(self.TestOutputPath, StosPath), 'w') as f:
+                f.write(StosPath)
+
+            self.TransformNodes[Mapped] = unittest.mock.Mock(Path=StosPath, Type='Grid',
+                                                             FullPath=os.path.join(self.TestOutputPath, StosPath))
+
+        self.StosMapNode.findall.return_value = Mappings
+
+        self.GroupNode = unittest.mock.Mock(FullPath=self.TestOutputPath)
+        self.GroupNode.TransformsForMapping.side_effect = lambda Mapped, Control: [self.TransformNodes[Mapped]]
+
+    def _CreateImageNode(self, ParentNode, OutputImageName, InputTransformNode=None):
+        return (True, unittest.mock.Mock(FullPath=OutputImageName))
+
+    def _CreateHistogramNode(self, ParentNode, DataPath, ImagePath, InputTransformNode=None):
+        return (True, unittest.mock.Mock(DataFullPath=os.path.join(self.TestOutputPath, DataPath),
+                                         ImageFullPath=os.path.join(self.TestOutputPath, ImagePath)))
+
+    def Measure(self, **kwargs):
+        with unittest.mock.patch('nornir_buildmanager.operations.block.TransformWarpView', _FakeWarpView), \
+             unittest.mock.patch('nornir_buildmanager.operations.block.GetOrCreateImageNodeHelper', side_effect=self._CreateImageNode) as CreateImage, \
+             unittest.mock.patch('nornir_buildmanager.operations.block.GetOrCreateHistogramNodeHelper', side_effect=self._CreateHistogramNode), \
+             unittest.mock.patch('nornir_buildmanager.operations.block.plot.Histogram', side_effect=lambda h, path, **kw: open(path, 'w').close()) as PlotHistogram, \
+             unittest.mock.patch('nornir_pools.GetMultithreadingPool', wraps=nornir_pools.GetMultithreadingPool) as GetPool, \
+             unittest.mock.patch('nornir_pools.GetGlobalMultithreadingPool', wraps=nornir_pools.GetGlobalMultithreadingPool) as GetGlobalPool:
+            Output = CalculateStosGroupWarpMeasurementImages(None, self.StosMapNode, self.GroupNode, unittest.mock.Mock(), **kwargs)
+
+        self.assertIs(Output, self.BlockNode, "Measuring mappings should save the block")
+        return (CreateImage, PlotHistogram, GetPool, GetGlobalPool)
+
+    def Outputs(self, Prefix, ext):
+        return sorted(glob.glob(os.path.join(self.TestOutputPath, Prefix + '*.' + ext)))
+
+    def testStatisticsOnly(self):
+        (CreateImage, PlotHistogram, GetPool, GetGlobalPool) = self.Measure(StatisticsOnly=True, MaxWorkers=2)
+
+        GetPool.assert_called_once_with("WarpMeasurements", num_threads=2)
+        GetGlobalPool.assert_not_called()
+
+        self.assertEqual(len(self.Outputs('warpHistogram_', 'xml')), self.NumMappings)
+        self.assertEqual(self.Outputs('warp_', 'png'), [], "No warp images should be rendered for statistics")
+        self.assertEqual(self.Outputs('warpHistogram_', 'png'), [], "No histogram plots should be rendered for statistics")
+        CreateImage.assert_not_called()
+        PlotHistogram.assert_not_called()
+
+    def testAllOutputs(self):
+        (CreateImage, PlotHistogram, GetPool, GetGlobalPool) = self.Measure()
+
+        GetPool.assert_not_called()
+        GetGlobalPool.assert_called_once_with()
+
+        self.assertEqual(len(self.Outputs('warpHistogram_', 'xml')), self.NumMappings)
+        self.assertEqual(len(self.Outputs('warp_', 'png')), self.NumMappings)
+        self.assertEqual(len(self.Outputs('warpHistogram_', 'png')), self.NumMappings)
+        self.assertEqual(PlotHistogram.call_count, self.NumMappings)
+
+
+class SliceToVolumeInMemoryTest(test.testbase.TestBase):
+    '''The in-memory slice-to-volume composition must write the same .stos files as the serial composition'''
+
+    # (Control, Mapped, translation) for each registration, section 3 is the center of the volume
+    Registrations = ((3, 2, (4, 2)),
+                     (2, 1, (-3, 5)),
+                     (3, 4, (1, -6)),
+                     (4, 5, (7, 3)),
+                     (5, 6, (-2, -2)))
+
+    def setUp(self):
+        super(SliceToVolumeInMemoryTest, self).setUp()
+
+        self.ImageDir = os.path.join(self.TestOutputPath, 'Images')
+        os.makedirs(self.ImageDir, exist_ok=True)
+        for section in range(1, 7):
+            Image.new('L', (64, 48)).save(self.ImagePath(section))
+
+        VolumeObj = VolumeManagerETree.VolumeManager.Load(os.path.join(self.TestOutputPath, 'Volume'), Create=True, UseCache=False)
+        (added, self.BlockNode) = VolumeObj.UpdateOrAddChild(VolumeManagerETree.BlockNode.Create('TEM'))
+
+        (added, self.InputGroupNode) = self.BlockNode.GetOrCreateStosGroup('Input16', 16)
+        self.InputGroupNode.CreateDirectories()
+
+        self.rt = registrationtree.RegistrationTree()
+        self.InputTransforms = {}
+        for (Control, Mapped, Offset) in self.Registrations:
+            self.rt.AddPair(Control, Mapped)
+
+            (added, SectionMappingsNode) = self.InputGroupNode.GetOrCreateSectionMapping(Mapped)
+            TransformNode = VolumeManagerETree.TransformNode.Create(str(Control), 'Grid', '%d-%d.stos' % (Mapped, Control),
+                                                                  {'ControlSectionNumber': str(Control),
+                                                                   'MappedSectionNumber': str(Mapped),
+                                                                   'ControlChannelName': 'TEM',
+                                                                   'ControlFilterName': 'Leveled',
+                                                                   'MappedChannelName': 'TEM',
+                                                                   'MappedFilterName': 'Leveled'})
+            SectionMappingsNode.append(TransformNode)
+            self.InputTransforms[Mapped] = TransformNode
+            self.WriteInputTransform(Mapped, Offset)
+
+    def ImagePath(self, section):
+        return os.path.join(self.ImageDir, '%d.png' % section)
+
+    def WriteInputTransform(self, Mapped, Offset):
+        TransformNode = self.InputTransforms[Mapped]
+        alignment = nornir_imageregistration.AlignmentRecord(peak=Offset, weight=1.0, angle=0.0)
+        alignment.ToStos(self.ImagePath(TransformNode.ControlSectionNumber), self.ImagePath(Mapped), PixelSpacing=16).Save(TransformNode.FullPath)
+        TransformNode.ResetChecksum()
+
+    def BuildSerial(self, GroupName):
+        (added, OutputGroupNode) = self.BlockNode.GetOrCreateStosGroup(GroupName, 16)
+        OutputGroupNode.CreateDirectories()
+        for sectionNumber in self.rt.RootNodes:
+            list(SliceToVolumeFromRegistrationTreeNode(self.rt, self.rt.Nodes[sectionNumber], self.InputGroupNode, OutputGroupNode, EnrichTolerance=None))
+
+        return OutputGroupNode
+
+    def BuildInMemory(self, GroupName):
+        (added, OutputGroupNode) = self.BlockNode.GetOrCreateStosGroup(GroupName, 16)
+        OutputGroupNode.CreateDirectories()
+        list(SliceToVolumeFromRegistrationTreeInMemory(self.rt, self.InputGroupNode, OutputGroupNode, EnrichTolerance=None))
+        return OutputGroupNode
+
+    def PlanInMemory(self, OutputGroupNode):
+        Plan = []
+        for sectionNumber in self.rt.RootNodes:
+            _PlanSliceToVolumeTransforms(self.rt, self.rt.Nodes[sectionNumber], self.InputGroupNode, OutputGroupNode, Plan)
+
+        return Plan
+
+    def OutputTransforms(self, OutputGroupNode):
+        Transforms = {}
+        for (Control, Mapped, Offset) in self.Registrations:
+            TransformNodes = OutputGroupNode.GetSectionMapping(Mapped).Transforms
+            self.assertEqual(len(TransformNodes), 1)
+            Transforms[Mapped] = TransformNodes[0]
+
+        return Transforms
+
+    def AssertOutputsMatch(self, SerialGroupNode, InMemoryGroupNode):
+        Serial = self.OutputTransforms(SerialGroupNode)
+        InMemory = self.OutputTransforms(InMemoryGroupNode)
+
+        for Mapped in Serial.keys():
+            self.assertTrue(os.path.exists(InMemory[Mapped].FullPath))
+            self.assertEqual(InMemory[Mapped].Path, Serial[Mapped].Path)
+            self.assertEqual(InMemory[Mapped].ControlSectionNumber, 3, "Slice-to-volume transforms should map to the center section")
+            self.assertEqual(InMemory[Mapped].ControlSectionNumber, Serial[Mapped].ControlSectionNumber)
+            self.assertEqual(InMemory[Mapped].InputTransformChecksum, Serial[Mapped].InputTransformChecksum)
+            self.assertEqual(InMemory[Mapped].Checksum, Serial[Mapped].Checksum,
+                             "In-memory composition of %d differs from the serial composition" % Mapped)
+            self.assertEqual(stosfile.StosFile.LoadChecksum(InMemory[Mapped].FullPath), Serial[Mapped].Checksum)
+
+            if Mapped in (2, 4):
+                self.assertFalse(hasattr(InMemory[Mapped], 'ControlToVolumeTransformChecksum'))
+            else:
+                self.assertEqual(InMemory[Mapped].ControlToVolumeTransformChecksum, Serial[Mapped].ControlToVolumeTransformChecksum)
+
+        return InMemory
+
+    def test_MatchesSerial(self):
+        self.AssertOutputsMatch(self.BuildSerial('Serial16'), self.BuildInMemory('InMemory16'))
+
+    def test_PartialRebuild(self):
+        self.BuildSerial('Serial16')
+        InMemoryGroupNode = self.BuildInMemory('InMemory16')
+
+        Before = {Mapped: (t.Checksum, os.stat(t.FullPath).st_mtime_ns) for (Mapped, t) in self.OutputTransforms(InMemoryGroupNode).items()}
+
+        # Only the subtree of sections 4, 5 and 6 depends upon the changed registration
+        self.WriteInputTransform(4, (9, -1))
+        Plan = self.PlanInMemory(InMemoryGroupNode)
+        self.assertEqual({job.MappedToControlTransform.MappedSectionNumber: job.Rebuild for job in Plan},
+                         {1: False, 2: False, 4: True, 5: True, 6: True})
+        self.assertEqual([[job.MappedToControlTransform.MappedSectionNumber for job in Jobs] for Jobs in _SliceToVolumeSubtrees(Plan)], [[4, 5, 6]])
+
+        InMemory = self.AssertOutputsMatch(self.BuildSerial('Serial16'), self.BuildInMemory('InMemory16'))
+
+        for Mapped in (1, 2):
+            self.assertEqual((InMemory[Mapped].Checksum, os.stat(InMemory[Mapped].FullPath).st_mtime_ns), Before[Mapped],
+                             "Section %d does not depend upon the changed registration and should not be rewritten" % Mapped)
+
+        for Mapped in (4, 5, 6):
+            self.assertNotEqual(InMemory[Mapped].Checksum, Before[Mapped][0], "Section %d should be rebuilt" % Mapped)
+
+
 class SliceToSliceRegistrationBruteOnlyTest(test_sectionimage.ImportLMImages):
 
     @property
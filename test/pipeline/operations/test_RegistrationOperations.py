@@ -0,0 +1,34 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import unittest
+
+from nornir_buildmanager.operations import registration
+
+
+class RunInChildProcessTest(unittest.TestCase):
+    '''TranslateTransform arranges tiles in a child process shared by every section'''
+
+    def testChildIsReused(self):
+        first = registration._RunInChildProcess(os.getpid, name="Succeeds")
+        self.assertNotEqual(first, os.getpid())
+        self.assertEqual(registration._RunInChildProcess(os.getpid, name="Succeeds"), first, "Sections should share one child process")
+
+    def testFailedChildRaises(self):
+        with self.assertRaises(RuntimeError) as context:
+            registration._RunInChildProcess(os._exit, args=(3,), name="Fails")
+
+        self.assertIn("Fails", str(context.exception))
+
+        self.assertNotEqual(registration._RunInChildProcess(os.getpid, name="Succeeds"), os.getpid(),
+                            "A new child should be started after the last one exited")
+
+    def testExceptionIsRaised(self):
+        with self.assertRaises(FileNotFoundError):
+            registration._RunInChildProcess(os.stat, args=('/nonexistent/path',), name="Raises")
+
+
+if __name__ == "__main__":
+    unittest.main()
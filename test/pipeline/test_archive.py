@@ -0,0 +1,205 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import collections
+import os
+import tarfile
+import unittest
+import unittest.mock
+import zipfile
+
+import numpy
+from PIL import Image
+
+from nornir_buildmanager.importers import archive
+import nornir_buildmanager.importers.idoc as idoc
+import nornir_buildmanager.importers.mrc as mrc
+import test.testbase
+from test.pipeline.test_idoc import WriteSyntheticIDoc
+from test.pipeline.test_mrc import WriteSyntheticMRC
+
+
+class ArchivedMRCTest(test.testbase.TestBase):
+    '''Read a synthetic .mrc section from each supported archive layout without extracting it'''
+
+    def setUp(self):
+        super(ArchivedMRCTest, self).setUp()
+        self.SourceDir = os.path.join(self.TestOutputPath, 'Source')
+        os.makedirs(os.path.join(self.SourceDir, '0005'), exist_ok=True)
+
+        self.MemberName = '0005/0005.mrc'
+        self.Pixels = WriteSyntheticMRC(os.path.join(self.SourceDir, self.MemberName))
+        with open(os.path.join(self.SourceDir, '0005', 'notes.txt'), 'w') as f:
+            f.write('Section notes')
+
+        self.ArchiveDir = os.path.join(self.TestOutputPath, 'Archives')
+        os.makedirs(self.ArchiveDir, exist_ok=True)
+
+    def tearDown(self):
+        mrc._WorkerMRCFiles.clear()
+        super(ArchivedMRCTest, self).tearDown()
+
+    def CreateTar(self, filename, mode):
+        ArchivePath = os.path.join(self.ArchiveDir, filename)
+        with tarfile.open(ArchivePath, mode) as tf:
+            tf.add(os.path.join(self.SourceDir, '0005'), arcname='0005')
+
+        return ArchivePath
+
+    def CreateZip(self, filename, compression):
+        ArchivePath = os.path.join(self.ArchiveDir, filename)
+        with zipfile.ZipFile(ArchivePath, 'w', compression=compression) as zf:
+            for name in (self.MemberName, '0005/notes.txt'):
+                zf.write(os.path.join(self.SourceDir, name), arcname=name)
+
+        return ArchivePath
+
+    def CheckTiles(self, ArchivePath, ExpectStreamed):
+        members = archive.FindArchivedInputs(self.ArchiveDir, 'mrc')
+        member = archive.ArchiveMember(ArchivePath, self.MemberName)
+        self.assertIn(member, members)
+
+        mrcObj = mrc.MRCFile.Load(member)
+        try:
+            self.assertEqual(mrcObj.streamed, ExpectStreamed)
+            self.assertEqual(mrcObj.num_tiles, self.Pixels.shape[0])
+
+            fileObj = mrc.MRCFile.Load(os.path.join(self.SourceDir, self.MemberName))
+            for (archived, extracted) in zip(mrcObj.tile_meta, fileObj.tile_meta):
+                numpy.testing.assert_array_equal(archived.pixel_coords, extracted.pixel_coords)
+            fileObj.close()
+
+            if not ExpectStreamed:
+                self.assertIsNotNone(mrcObj.tiles, "Stored members should be memory mapped from the archive")
+
+            for iTile in range(0, mrcObj.num_tiles):
+                numpy.testing.assert_array_equal(mrcObj.get_tile_as_numpy(iTile), self.Pixels[iTile])
+        finally:
+            mrcObj.close()
+
+        OutputDir = os.path.join(self.TestOutputPath, 'Sidecar' + os.path.basename(ArchivePath))
+        copied = archive.CopySidecarFiles(member, ['*notes*.*', '*.log'], OutputDir)
+        self.assertEqual([os.path.basename(c) for c in copied], ['notes.txt'])
+
+    def test_Tar(self):
+        self.CheckTiles(self.CreateTar('section.tar', 'w'), ExpectStreamed=False)
+
+    def test_CompressedTar(self):
+        self.CheckTiles(self.CreateTar('section.tar.gz', 'w:gz'), ExpectStreamed=True)
+
+    def test_StoredZip(self):
+        self.CheckTiles(self.CreateZip('stored.zip', zipfile.ZIP_STORED), ExpectStreamed=False)
+
+    def test_DeflatedZip(self):
+        self.CheckTiles(self.CreateZip('deflated.zip', zipfile.ZIP_DEFLATED), ExpectStreamed=True)
+
+    def test_WorkerExportFromArchive(self):
+        member = archive.ArchiveMember(self.CreateTar('section.tar', 'w'), self.MemberName)
+
+        min_max_gamma = mrc.shared.MinMaxGamma(0, 16383, 1.0)
+        for iTile in range(0, self.Pixels.shape[0]):
+            self.assertTrue(mrc.MRCImport.ExportImage(member, self.TestOutputPath, '.png', iTile, min_max_gamma))
+
+        self.assertIn(member, mrc._WorkerMRCFiles, "Workers should cache archive members like files")
+
+
+
+class ArchivedIDocTest(test.testbase.TestBase):
+    '''Stage a synthetic .idoc section from a compressed archive'''
+
+    NumTiles = 3
+
+    def setUp(self):
+        super(ArchivedIDocTest, self).setUp()
+        self.SourceDir = os.path.join(self.TestOutputPath, 'Source')
+        SectionDir = os.path.join(self.SourceDir, '0007')
+        os.makedirs(SectionDir, exist_ok=True)
+
+        WriteSyntheticIDoc(os.path.join(SectionDir, 'capture.idoc'), self.NumTiles)
+        with open(os.path.join(SectionDir, 'notes.txt'), 'w') as f:
+            f.write('Section notes')
+
+        self.Tiles = {}
+        for i in range(0, self.NumTiles):
+            name = '%d.tif' % (10000 + i)
+            pixels = (numpy.arange(64 * 48, dtype=numpy.uint16).reshape((48, 64)) * (i + 1)) % 16384
+            Image.fromarray(pixels).save(os.path.join(SectionDir, name))
+            self.Tiles[name] = pixels
+
+        # A tile the idoc does not list is not staged
+        Image.fromarray(numpy.zeros((48, 64), dtype=numpy.uint16)).save(os.path.join(SectionDir, 'unlisted.tif'))
+
+        self.ArchivePath = os.path.join(self.TestOutputPath, 'section.tar.gz')
+        with tarfile.open(self.ArchivePath, 'w:gz') as tf:
+            tf.add(SectionDir, arcname='0007')
+
+        self.Member = archive.ArchiveMember(self.ArchivePath, '0007/capture.idoc')
+        self.StagingDir = os.path.join(self.TestOutputPath, idoc.ArchivedCaptureDirName, '0007')
+
+    def test_ReadMembers(self):
+        Names = ['0007/10002.tif', '0007/10000.tif', '0007/missing.tif']
+        read = dict(archive.ReadMembers(self.ArchivePath, Names))
+        self.assertEqual(sorted(read.keys()), ['0007/10000.tif', '0007/10002.tif'])
+
+        with open(os.path.join(self.SourceDir, '0007', '10002.tif'), 'rb') as f:
+            self.assertEqual(read['0007/10002.tif'], f.read())
+
+    def test_StagingDir(self):
+        VolumeObj = collections.namedtuple('Volume', ('FullPath',))(self.TestOutputPath)
+        self.assertEqual(idoc._ArchiveStagingDir(VolumeObj, self.Member), self.StagingDir)
+
+    def test_StageCapture(self):
+        (StagedIDocFullPath, TileMembers) = idoc._StageArchivedIDoc(self.Member, self.StagingDir)
+
+        self.assertEqual(StagedIDocFullPath, os.path.join(self.StagingDir, 'capture.idoc'))
+        self.assertEqual(idoc.IDoc.Load(StagedIDocFullPath, UseCache=False).NumTiles, self.NumTiles)
+        self.assertTrue(os.path.exists(os.path.join(self.StagingDir, 'notes.txt')))
+        self.assertEqual(list(TileMembers.keys()), ['0007/%d.tif' % (10000 + i) for i in range(0, self.NumTiles)])
+        for StagedTile in TileMembers.values():
+            self.assertFalse(os.path.exists(StagedTile), "Tiles should not be staged with the .idoc")
+
+        StagedTiles = idoc._StageArchivedTiles(self.Member, TileMembers)
+        self.assertFalse(os.path.exists(os.path.join(self.StagingDir, 'unlisted.tif')))
+
+        self.assertEqual(sorted([os.path.basename(t) for t in StagedTiles]), sorted(self.Tiles.keys()))
+        ArchiveModified = os.path.getmtime(self.ArchivePath)
+        for StagedTile in [StagedIDocFullPath] + StagedTiles:
+            self.assertEqual(os.path.getmtime(StagedTile), ArchiveModified, "Staged files should be as old as the archive")
+
+        for StagedTile in StagedTiles:
+            with open(StagedTile, 'rb') as staged, open(os.path.join(self.SourceDir, '0007', os.path.basename(StagedTile)), 'rb') as source:
+                self.assertEqual(staged.read(), source.read(), "Tiles should be staged as they are stored in the archive")
+
+    def test_ChangedArchiveDiscardsStagedFiles(self):
+        idoc._StageArchivedIDoc(self.Member, self.StagingDir)
+        HistogramFullPath = os.path.join(self.StagingDir, 'Histogram.xml')
+        with open(HistogramFullPath, 'w') as f:
+            f.write('<Histogram />')
+
+        idoc._StageArchivedIDoc(self.Member, self.StagingDir)
+        self.assertTrue(os.path.exists(HistogramFullPath), "The histogram should be kept while the archive is unchanged")
+
+        ArchiveModified = os.path.getmtime(self.ArchivePath) + 10
+        os.utime(self.ArchivePath, (ArchiveModified, ArchiveModified))
+        idoc._StageArchivedIDoc(self.Member, self.StagingDir)
+        self.assertFalse(os.path.exists(HistogramFullPath), "The histogram of a changed archive should be rebuilt")
+
+    def test_UnimportedCaptureIsStaged(self):
+        (StagedIDocFullPath, TileMembers) = idoc._StageArchivedIDoc(self.Member, self.StagingDir)
+        VolumeObj = unittest.mock.Mock()
+        VolumeObj.find.return_value = None
+
+        self.assertFalse(idoc._ArchivedCaptureIsImported(VolumeObj, StagedIDocFullPath, len(TileMembers), ContrastCutoffs=None),
+                         "A capture without a histogram has not been imported")
+
+        with open(os.path.join(self.StagingDir, 'Histogram.xml'), 'w') as f:
+            f.write('<Histogram />')
+
+        self.assertFalse(idoc._ArchivedCaptureIsImported(VolumeObj, StagedIDocFullPath, len(TileMembers), ContrastCutoffs=None),
+                         "A capture without a filter in the volume has not been imported")
+        VolumeObj.find.assert_called_once_with("Block/Section[@Number='7']/Channel[@Name='TEM']/Filter[@Name='Raw8']")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import subprocess
+import sys
+import unittest
+
+import nornir_buildmanager.build as build
+
+# Modules that are slow to import and should only be loaded once a pipeline runs
+HeavyModules = ['matplotlib', 'nornir_imageregistration', 'nornir_buildmanager.VolumeManagerETree']
+
+
+def RunPython(code):
+    return subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=True).stdout
+
+
+class BuildStartupTests(unittest.TestCase):
+
+    def test_ParsingDoesNotImportHeavyModules(self):
+
+        code = "import sys; import nornir_buildmanager.build as build; " + \
+               "args = ['/tmp/volume', 'ImportMRC', '/tmp/import']; " + \
+               "build.BuildParserForArgs(args).parse_args(args); " + \
+               "print(','.join([m for m in %r if m in sys.modules]))" % HeavyModules
+
+        loaded = RunPython(code).strip()
+        self.assertEqual(loaded, '', "Modules imported while parsing the command line: " + loaded)
+
+    def test_SelectedPipelineParserMatchesFullParser(self):
+
+        args = ['-verbose', '/tmp/volume', 'ImportMRC', '/tmp/import', '-MaxConcurrentSections', '3']
+
+        selected = build.BuildParserForArgs(args).parse_args(args)
+        full = build.BuildParserRoot().parse_args(args)
+
+        self.assertEqual(vars(selected), vars(full))
+        self.assertEqual(selected.PipelineName, 'ImportMRC')
+        self.assertEqual(selected.MaxConcurrentSections, 3)
+
+    def test_FindPipelineName(self):
+
+        self.assertEqual(build._FindPipelineName(['-debug', '/tmp/volume', 'Mosaic', '-Filter', 'Leveled']), 'Mosaic')
+        self.assertIsNone(build._FindPipelineName(['/tmp/volume', '-h']))
+        self.assertIsNone(build._FindPipelineName(['/tmp/volume', 'NotAPipeline']))
+
+    def test_SplitPipelineCommands(self):
+
+        args = ['-debug', '/tmp/volume', 'Prune', '-Threshold', '1', '+', 'Histogram', '+', 'Mosaic', '-Filter', 'Leveled']
+        self.assertEqual(build.SplitPipelineCommands(args),
+                         [['-debug', '/tmp/volume', 'Prune', '-Threshold', '1'],
+                          ['-debug', '/tmp/volume', 'Histogram'],
+                          ['-debug', '/tmp/volume', 'Mosaic', '-Filter', 'Leveled']])
+
+        self.assertEqual(build.SplitPipelineCommands(['/tmp/volume', 'Histogram']), [['/tmp/volume', 'Histogram']])
+
+    def test_ParsePipelineCommands(self):
+
+        parsed = build.ParsePipelineCommands(['/tmp/volume', 'ListFilterContrast', '+', 'ImportMRC', '/tmp/import', '-MaxConcurrentSections', '3'])
+
+        self.assertEqual([args.PipelineName for (parser, args) in parsed], ['ListFilterContrast', 'ImportMRC'])
+        self.assertEqual(parsed[1][1].MaxConcurrentSections, 3)
+        self.assertFalse('MaxConcurrentSections' in parsed[0][1], "Arguments of one pipeline should not leak into another")
+
+        with self.assertRaises(SystemExit, msg="Errors in later pipelines should be reported before any pipeline runs"):
+            build.ParsePipelineCommands(['/tmp/volume', 'ListFilterContrast', '+', 'NotAPipeline'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import io
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+from nornir_buildmanager import daemon
+import test.testbase
+
+
+class RecordingSession(object):
+    '''Stands in for build.BuildSession and records the commands it receives'''
+
+    def __init__(self):
+        self.Commands = []
+        self.Reloads = 0
+
+    def Execute(self, buildArgs):
+        self.Commands.append(buildArgs)
+        if 'Fail' in buildArgs:
+            raise ValueError("Pipeline failed")
+
+        if 'Warn' in buildArgs:
+            logging.getLogger('nornir_buildmanager.test').warning("Pipeline warning")
+
+        print("Ran " + ' '.join(buildArgs))
+        return 0
+
+    def Reload(self):
+        self.Reloads += 1
+
+
+@unittest.skipUnless(hasattr(daemon.socket, 'AF_UNIX'), "Unix domain sockets are required")
+class BuildDaemonTests(test.testbase.TestBase):
+
+    def setUp(self):
+        super(BuildDaemonTests, self).setUp()
+        self.VolumePath = os.path.join(self.TestOutputPath, 'Volume')
+        self.SocketPath = os.path.join(tempfile.gettempdir(), 'nornir-build-test-%d.sock' % os.getpid())
+        self.Session = RecordingSession()
+
+        self.Daemon = daemon.BuildDaemon(self.VolumePath, self.Session, SocketPath=self.SocketPath)
+        self.Daemon.Listen()
+        self.Thread = threading.Thread(target=self.Daemon.ServeForever)
+        self.Thread.start()
+
+    def tearDown(self):
+        if self.Thread.is_alive():
+            self.Send('Shutdown')
+            self.Thread.join()
+
+        self.Daemon.Close()
+        super(BuildDaemonTests, self).tearDown()
+
+    def Send(self, Command, Args=None):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        (ReturnCode, Message) = daemon.SendRequest(self.VolumePath, Command, Args, SocketPath=self.SocketPath, stdout=stdout, stderr=stderr)
+        return (ReturnCode, Message, stdout.getvalue(), stderr.getvalue())
+
+    def test_RunForwardsOutput(self):
+        Args = [self.VolumePath, 'ListFilterContrast']
+        (ReturnCode, Message, stdout, stderr) = self.Send('Run', Args)
+
+        self.assertEqual(ReturnCode, 0)
+        self.assertEqual(stdout, 'Ran ' + ' '.join(Args) + '\n')
+
+        self.Send('Run', Args)
+        self.assertEqual(self.Session.Commands, [Args, Args], "Commands should run in the same session")
+
+    def test_FailureReloadsVolume(self):
+        (ReturnCode, Message, stdout, stderr) = self.Send('Run', [self.VolumePath, 'Fail'])
+
+        self.assertEqual(ReturnCode, 1)
+        self.assertEqual(Message, "Pipeline failed")
+        self.assertIn('ValueError', stderr)
+        self.assertEqual(self.Session.Reloads, 1)
+
+        (ReturnCode, Message, stdout, stderr) = self.Send('Run', [self.VolumePath, 'ListFilterContrast'])
+        self.assertEqual(ReturnCode, 0, "The daemon should keep serving after a pipeline fails")
+
+    def test_RunForwardsLogging(self):
+        HandlerCount = len(logging.getLogger().handlers)
+        (ReturnCode, Message, stdout, stderr) = self.Send('Run', [self.VolumePath, 'Warn'])
+
+        self.assertEqual(ReturnCode, 0)
+        self.assertIn("Pipeline warning", stderr)
+        self.assertEqual(len(logging.getLogger().handlers), HandlerCount, "Logging should only be forwarded during the request")
+
+    def test_PingAndShutdown(self):
+        self.assertTrue(daemon.Ping(self.VolumePath, SocketPath=self.SocketPath))
+
+        with self.assertRaises(OSError):
+            daemon.BuildDaemon(self.VolumePath, RecordingSession(), SocketPath=self.SocketPath).Listen()
+
+        (ReturnCode, Message, stdout, stderr) = self.Send('Shutdown')
+        self.assertEqual(ReturnCode, 0)
+        self.Thread.join(10)
+        self.assertFalse(self.Thread.is_alive())
+
+        self.Daemon.Close()
+        self.assertFalse(daemon.Ping(self.VolumePath, SocketPath=self.SocketPath))
+        with self.assertRaises(daemon.DaemonNotRunningError):
+            self.Send('Run', [self.VolumePath, 'ListFilterContrast'])
+
+    def test_SocketPathDependsOnVolume(self):
+        self.assertEqual(daemon.GetSocketPath(self.VolumePath), daemon.GetSocketPath(os.path.join(self.VolumePath, '.')))
+        self.assertNotEqual(daemon.GetSocketPath(self.VolumePath), daemon.GetSocketPath(self.TestOutputPath))
+
+
+if __name__ == "__main__":
+    unittest.main()
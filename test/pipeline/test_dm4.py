@@ -19,6 +19,9 @@ import nornir_shared.misc
 
 import nornir_buildmanager.build as build
 import nornir_buildmanager.importers.idoc as idoc
+import nornir_buildmanager.importers.dm4 as dm4
+import numpy as np
+import test.testbase
 from . import setup_pipeline
 
 
@@ -534,6 +537,48 @@ class DM4BuildTest(DM4Test, StosRebuildHelper):
 #         idoc.PlotDriftSettleTime(cachedLogData, outputDrift)
 #         return
 
+class DM4ImageLayoutTest(test.testbase.TestBase):
+    '''Reads image data directly from the offset recorded in a DM4ImageLayout'''
+
+    def WriteSyntheticFile(self, fullpath, image, tag_header_bytes):
+        leading_bytes = bytes(range(0, 100))
+        with open(fullpath, 'wb') as f:
+            f.write(leading_bytes)
+            f.write(tag_header_bytes)
+            f.write(image.astype('<u2').tobytes())
+            f.write(b'trailing tags')
+
+        return len(leading_bytes) + len(tag_header_bytes)
+
+    def setUp(self):
+        super(DM4ImageLayoutTest, self).setUp()
+        self.Image = np.arange(0, 16 * 8, dtype=np.uint16).reshape((8, 16)) * 100
+        self.TagHeaderBytes = b'%%%%' + bytes(dm4.DM4TagHeaderValidationLength - 4)
+        self.FileFullPath = os.path.join(self.TestOutputPath, 'tile.dm4')
+        data_offset = self.WriteSyntheticFile(self.FileFullPath, self.Image, self.TagHeaderBytes)
+
+        self.Layout = dm4.DM4ImageLayout(FileSize=os.path.getsize(self.FileFullPath),
+                                         DataOffset=data_offset,
+                                         Shape=self.Image.shape,
+                                         Bpp=16,
+                                         NumBytes=self.Image.nbytes,
+                                         TagHeaderBytes=self.TagHeaderBytes)
+
+    def test_ReadWithLayout(self):
+        im = dm4.TryReadDM4ImageWithLayout(self.FileFullPath, self.Layout)
+        self.assertIsNotNone(im)
+        np.testing.assert_array_equal(np.asarray(im), self.Image)
+
+    def test_TagHeaderMismatch(self):
+        self.WriteSyntheticFile(self.FileFullPath, self.Image, b'&' * dm4.DM4TagHeaderValidationLength)
+        self.assertIsNone(dm4.TryReadDM4ImageWithLayout(self.FileFullPath, self.Layout), "A different tag header should require parsing the tags")
+
+    def test_FileSizeMismatch(self):
+        larger = np.zeros((16, 16), dtype=np.uint16)
+        self.WriteSyntheticFile(self.FileFullPath, larger, self.TagHeaderBytes)
+        self.assertIsNone(dm4.TryReadDM4ImageWithLayout(self.FileFullPath, self.Layout), "A different file size should require parsing the tags")
+
+
 if __name__ == "__main__":
     # import syssys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,68 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import unittest
+from xml.etree import ElementTree
+
+from nornir_buildmanager import executionplan
+import test.testbase
+from test.pipeline.metadata_node import Node
+
+
+class ExecutionPlanTests(test.testbase.TestBase):
+
+    def setUp(self):
+        super(ExecutionPlanTests, self).setUp()
+        Node.Root = self.TestOutputPath
+
+        self.Section = Node('Section', Number='3', Path='0003')
+        self.Channel = Node('Channel', Parent=self.Section, Name='TEM', Path='TEM')
+        self.Filter = Node('Filter', Parent=self.Channel, Name='Raw8', Path='Raw8')
+        self.OtherSection = Node('Section', Number='4', Path='0004')
+
+        os.makedirs(self.Filter.FullPath, exist_ok=True)
+        for (filename, size) in (('001.png', 100), ('002.png', 300)):
+            with open(os.path.join(self.Filter.FullPath, filename), 'wb') as f:
+                f.write(b'0' * size)
+
+    def test_EstimateInputSize(self):
+        plan = executionplan.ExecutionPlan()
+        kwargs = {'FilterNode': self.Filter, 'section_node': self.Section, 'VolumeElement': self.Channel, 'Downsample': 4}
+        self.assertEqual(plan.EstimateInputSize(kwargs, self.Channel), 400, "Only the filter directory should be counted")
+
+    def test_PendingCoversDescendants(self):
+        plan = executionplan.ExecutionPlan()
+        plan.AddStage('Prune', self.Channel, 'Run', 0)
+
+        self.assertTrue(plan.IsPending(self.Filter))
+        self.assertFalse(plan.IsPending(self.Section))
+        self.assertFalse(plan.IsPending(self.OtherSection))
+
+        plan.AddStage('AutolevelTiles', self.OtherSection, 'Unchanged', 0)
+        self.assertFalse(plan.IsPending(self.OtherSection), "Unchanged stages do not change the volume")
+
+    def test_DeferredStages(self):
+        plan = executionplan.ExecutionPlan()
+        Pipeline = ElementTree.fromstring('<Iterate><Select VariableName="FilterNode" /><PythonCall Function="HistogramFilter" />'
+                                          '<Iterate><PythonCall Function="BuildTilePyramids" /></Iterate></Iterate>')
+        plan.AddDeferredStages(list(Pipeline), self.Channel)
+
+        self.assertEqual([s.Function for s in plan.Stages], ['HistogramFilter', 'BuildTilePyramids'])
+        self.assertTrue(all([s.Status == 'Run after' and s.Section == 3 for s in plan.Stages]))
+
+    def test_ReportGroupsBySection(self):
+        plan = executionplan.ExecutionPlan()
+        plan.AddStage('Prune', self.Channel, 'Run', 2048)
+        plan.AddStage('Prune', self.OtherSection, 'Unchanged', 1024)
+        plan.AddCleaned(self.Filter, 'Missing directory')
+
+        report = plan.Report()
+        self.assertIn('1 stages would run, 1 unchanged, 2.0 KB of input', report)
+        self.assertLess(report.index('Section 3'), report.index('Section 4'))
+        self.assertIn('Filter Raw8: Missing directory', report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,12 +3,17 @@ Created on Feb 13, 2013
 
 @author: u0490822
 '''
+import collections
 import glob
 import logging
 import os
 import shutil
 import time
 import unittest
+from unittest import mock
+
+import numpy
+from PIL import Image, TiffImagePlugin
 
 from nornir_buildmanager.VolumeManagerETree import VolumeManager 
 import nornir_buildmanager.importers
@@ -20,6 +25,7 @@ import nornir_shared.misc
 import nornir_buildmanager.build as build
 import nornir_buildmanager.importers.serialemlog as serialemlog
 import nornir_buildmanager.importers.idoc as idoc
+import test.testbase
 from . import setup_pipeline
 
 
@@ -402,6 +408,129 @@ class IDocSingleSectionImportTest(IDocTest):
             os.remove(self.HistogramFullPath)
           
  
+class IDocSinglePassImportTest(IDocTest):
+    '''Imports a section with compressed raw tiles with -SinglePass and compares the output to the default two pass import'''
+
+    @property
+    def VolumePath(self):
+        return "RC2_Micro\\%d" % self.SectionNumber
+
+    @property
+    def SectionNumber(self):
+        return 17
+
+    @property
+    def CompressedImportPath(self):
+        return os.path.join(self.TestOutputPath, 'CompressedImport')
+
+    @property
+    def SectionDir(self):
+        return os.path.dirname(glob.glob(os.path.join(self.CompressedImportPath, '**', '*.idoc'), recursive=True)[0])
+
+    def setUp(self):
+        super(IDocSinglePassImportTest, self).setUp()
+
+        # -SinglePass only caches compressed raw tiles
+        if os.path.exists(self.CompressedImportPath):
+            shutil.rmtree(self.CompressedImportPath)
+
+        shutil.copytree(self.ImportedDataPath, self.CompressedImportPath)
+        for (filename, unused) in self.RawTiles():
+            with Image.open(filename) as im:
+                im.load()
+                im.save(filename, format='TIFF', compression='tiff_lzw')
+
+    def RemoveSectionHistogram(self):
+        '''An existing histogram is loaded instead of reading the raw tiles'''
+        for filename in ('Histogram.xml', 'Histogram.png'):
+            fullpath = os.path.join(self.SectionDir, filename)
+            if os.path.exists(fullpath):
+                os.remove(fullpath)
+
+    def RawTiles(self):
+        IDocObj = idoc.IDoc.Load(glob.glob(os.path.join(self.SectionDir, '*.idoc'))[0], UseCache=False)
+        return [(os.path.join(self.SectionDir, t.Image), t) for t in IDocObj.tiles]
+
+    def Import(self, OutputPath, *args):
+        self.RemoveSectionHistogram()
+        buildArgs = [OutputPath, '-debug', 'ImportIDoc', self.CompressedImportPath, '-CameraBpp', '14']
+        buildArgs.extend(args)
+        build.Execute(buildArgs)
+
+        VolumeObj = VolumeManager.Load(OutputPath)
+        FilterObj = VolumeObj.find("Block/Section[@Number='%d']/Channel/Filter[@Name='Raw8']" % self.SectionNumber)
+        self.assertIsNotNone(FilterObj)
+        return FilterObj
+
+    def LoadTiles(self, FilterObj):
+        LevelObj = FilterObj.TilePyramid.GetLevel(1)
+        tiles = {}
+        for fullpath in glob.glob(os.path.join(LevelObj.FullPath, '*.png')):
+            with Image.open(fullpath) as im:
+                tiles[os.path.basename(fullpath)] = numpy.asarray(im)
+
+        self.assertGreater(len(tiles), 0)
+        return tiles
+
+    def runTest(self):
+        TwoPassFilter = self.Import(os.path.join(self.TestOutputPath, 'TwoPass'))
+
+        RawTiles = [os.path.normpath(filename) for (filename, unused) in self.RawTiles()]
+        DecodeCount = collections.Counter()
+        ConversionMaps = []
+
+        TiffLoad = TiffImagePlugin.TiffImageFile.load
+        def CountingLoad(im, *args, **kwargs):
+            # Pixels are decoded while tiles remain to be read
+            if isinstance(im.filename, str) and len(im.tile) > 0:
+                DecodeCount[os.path.normpath(im.filename)] += 1
+            return TiffLoad(im, *args, **kwargs)
+
+        UseCachedRawTiles = idoc._UseCachedRawTiles
+        def RecordConversionMap(*args, **kwargs):
+            ConversionMap = UseCachedRawTiles(*args, **kwargs)
+            ConversionMaps.append(ConversionMap)
+            return ConversionMap
+
+        with mock.patch.object(TiffImagePlugin.TiffImageFile, 'load', CountingLoad), mock.patch.object(idoc, '_UseCachedRawTiles', RecordConversionMap):
+            SinglePassFilter = self.Import(os.path.join(self.TestOutputPath, 'SinglePass'), '-SinglePass')
+
+        for RawTile in RawTiles:
+            self.assertEqual(DecodeCount[RawTile], 1, "Raw tile %s should be decoded once" % RawTile)
+
+        self.assertEqual(len(ConversionMaps), 1)
+        for source in ConversionMaps[0]:
+            self.assertFalse(os.path.normpath(source) in RawTiles, "Tiles should be converted from the cache, not %s" % source)
+
+        self.assertFalse(os.path.exists(os.path.join(SinglePassFilter.Parent.FullPath, idoc.RawTileCacheDirName)), "Cache should be removed after conversion")
+
+        self.assertEqual(SinglePassFilter.MinIntensityCutoff, TwoPassFilter.MinIntensityCutoff)
+        self.assertEqual(SinglePassFilter.MaxIntensityCutoff, TwoPassFilter.MaxIntensityCutoff)
+        self.assertEqual(SinglePassFilter.Gamma, TwoPassFilter.Gamma)
+
+        TwoPassTiles = self.LoadTiles(TwoPassFilter)
+        SinglePassTiles = self.LoadTiles(SinglePassFilter)
+        self.assertEqual(sorted(SinglePassTiles.keys()), sorted(TwoPassTiles.keys()))
+        for name in TwoPassTiles:
+            self.assertTrue(numpy.array_equal(SinglePassTiles[name], TwoPassTiles[name]), "Tile %s differs from the two pass import" % name)
+
+
+class SinglePassSourceTest(test.testbase.TestBase):
+    '''-SinglePass only caches raw tiles that cost more to decode than to read'''
+
+    def test_IsCompressedTile(self):
+        os.makedirs(self.TestOutputPath, exist_ok=True)
+        img = Image.fromarray(numpy.arange(64 * 64, dtype=numpy.uint16).reshape((64, 64)))
+
+        Uncompressed = os.path.join(self.TestOutputPath, 'Uncompressed.tif')
+        Compressed = os.path.join(self.TestOutputPath, 'Compressed.tif')
+        img.save(Uncompressed, format='TIFF')
+        img.save(Compressed, format='TIFF', compression='tiff_lzw')
+
+        self.assertFalse(idoc._IsCompressedTile(Uncompressed))
+        self.assertTrue(idoc._IsCompressedTile(Compressed))
+
+
 class IDocAlignOutputTest(setup_pipeline.CopySetupTestBase):
     '''Attemps an alignment on a cached copy of the output from IDocBuildTest'''
  
@@ -689,6 +818,142 @@ class LogReaderTest(IDocTest):
         serialemlog.PlotDriftSettleTime(cachedLogData, outputDrift)
         return
 
+def WriteSyntheticIDoc(fullpath, NumTiles):
+    '''Write an idoc file in the format SerialEM uses for montages'''
+    with open(fullpath, 'w') as f:
+        f.write("PixelSpacing = 21.76\nImageFile = synthetic.st\nImageSize = 4080 4080\nMontage = 1\nImageSeries = 1\nDataMode = 1\n\n")
+        for i in range(0, NumTiles):
+            f.write("[Image = %d.tif]\n" % (10000 + i))
+            f.write("TiltAngle = 0.3\nPieceCoordinates = %d %d 0\n" % ((i % 100) * 3590, (i // 100) * 3590))
+            f.write("StagePosition = -12.5 30.1\nStageZ = 4\nMagnification = 5000\nIntensity = 0.549157\n")
+            f.write("ExposureDose = 0\nSpotSize = 2\nDefocus = -6.8902\nImageShift = 0 -0.01\nRotationAngle = -178.3\n")
+            f.write("ExposureTime = 0.75\nBinning = 1\nMinMaxMean = 100 %d 8000.5\nDateTime = 22-Apr-12  16:04:07\n\n" % (16000 + (i % 383)))
+
+
+class IDocParserTest(test.testbase.TestBase):
+    '''Parses a synthetic idoc describing a large capture'''
+
+    NumTiles = 20000
+
+    def setUp(self):
+        super(IDocParserTest, self).setUp()
+        self.IDocFullPath = os.path.join(self.TestOutputPath, 'synthetic.idoc')
+        WriteSyntheticIDoc(self.IDocFullPath, self.NumTiles)
+        idoc._IDocCache.clear()
+
+    def test_ParsedValues(self):
+        IDocData = idoc.IDoc.Load(self.IDocFullPath, UseCache=False)
+
+        self.assertEqual(IDocData.PixelSpacing, 21.76)
+        self.assertEqual(IDocData.ImageSize, [4080, 4080])
+        self.assertEqual(IDocData.DataMode, 1)
+        self.assertEqual(IDocData.NumTiles, self.NumTiles)
+
+        TileData = IDocData.tiles[101]
+        self.assertEqual(TileData.Image, '10101.tif')
+        self.assertEqual(TileData.PieceCoordinates, [3590, 3590, 0])
+        self.assertEqual(TileData.Magnification, 5000)
+        self.assertEqual(TileData.Intensity, 0.549157)
+        self.assertEqual(TileData.StageZ, 4)
+        self.assertIsInstance(TileData.StageZ, int, "Integer values of float keys should remain ints")
+        self.assertEqual(TileData.Max, 16101)
+        self.assertEqual(TileData.DateTime, ['22-Apr-12', '16:04:07'])
+
+    def test_Cache(self):
+        start = time.perf_counter()
+        first = idoc.IDoc.Load(self.IDocFullPath)
+        parse_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        second = idoc.IDoc.Load(self.IDocFullPath, CameraBpp=12)
+        cached_elapsed = time.perf_counter() - start
+
+        print("Parsed %d tiles in %.3fs, loaded from cache in %.3fs" % (self.NumTiles, parse_elapsed, cached_elapsed))
+
+        self.assertEqual(second.NumTiles, first.NumTiles)
+        self.assertEqual(second.tiles[0].Max, 1 << 12, "CameraBpp should apply to cached values")
+        self.assertEqual(first.tiles[0].Max, 16000, "Changes to one loaded IDoc should not alter another")
+
+        # A changed file must be parsed again
+        stats = os.stat(self.IDocFullPath)
+        WriteSyntheticIDoc(self.IDocFullPath, 10)
+        os.utime(self.IDocFullPath, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000000000))
+        self.assertEqual(idoc.IDoc.Load(self.IDocFullPath).NumTiles, 10)
+
+
+def WriteSyntheticLog(fullpath, NumTiles):
+    '''Write a SerialEM log for a montage where tile i has (i % 3) + 1 drift measurements'''
+    with open(fullpath, 'w') as f:
+        f.write("Last update properties file: Sep 30, 2011\n")
+        f.write("SerialEM Version 3.1.1a,  built Nov  9 2011  14:20:16\n")
+        f.write("Started  4/23/2012  12:17:25\n")
+        f.write("100.000: Montage Start\n")
+        for i in range(0, NumTiles):
+            t0 = 101.0 + (i * 10)
+            f.write("%.3f: DoNextPiece Starting capture with stage move\n" % t0)
+            if i > 0:
+                f.write("%.3f: SaveImage Saving image at %d %d,  file Z = %d\n" % (t0 + 0.5, (i - 1) % 10, (i - 1) // 10, i - 1))
+            f.write("%.3f: BlankerProc finished stage move\n" % (t0 + 1))
+            for k in range(0, (i % 3) + 1):
+                f.write("%.3f: Autofocus Start\n" % (t0 + 2 + k))
+                f.write("Measured defocus = -0.80 microns                  drift = %.2f nm/sec\n" % (((i * 7) % 13) / 4.0 + k))
+                f.write("%.3f: Autofocus Done\n" % (t0 + 2.5 + k))
+
+        tEnd = 101.0 + (NumTiles * 10)
+        f.write("%.3f: DoNextPiece Starting capture with stage move\n" % tEnd)
+        f.write("%.3f: SaveImage Saving image at %d %d,  file Z = %d\n" % (tEnd + 0.5, (NumTiles - 1) % 10, (NumTiles - 1) // 10, NumTiles - 1))
+        f.write("%.3f: Montage Done processing\n" % (tEnd + 1))
+
+
+class LogColumnsTest(test.testbase.TestBase):
+    '''Compares the vectorized log statistics to per tile calculations'''
+
+    NumTiles = 500
+
+    def setUp(self):
+        super(LogColumnsTest, self).setUp()
+        self.LogFullPath = os.path.join(self.TestOutputPath, 'synthetic.log')
+        WriteSyntheticLog(self.LogFullPath, self.NumTiles)
+
+    def validateStatistics(self, LogData):
+        tiles = [t for t in LogData.tileData.values() if not (t.dwellTime is None or t.drift is None)]
+        self.assertEqual(LogData.NumTiles, self.NumTiles)
+        self.assertEqual(LogData.NumTiles, len(tiles))
+
+        self.assertAlmostEqual(LogData.AverageTileTime, sum([t.totalTime for t in tiles]) / len(tiles))
+        self.assertAlmostEqual(LogData.AverageTileDrift, sum([t.drift for t in tiles]) / len(tiles))
+        self.assertEqual(LogData.FastestTileTime, min([t.totalTime for t in tiles]))
+        self.assertEqual(LogData.MaxTileDrift, max([t.drift for t in tiles]))
+        self.assertEqual(LogData.MinTileDrift, min([t.drift for t in tiles]))
+
+        TileData = LogData.tileData[4]
+        self.assertEqual(len(TileData.driftStamps), 2)
+        self.assertEqual(TileData.driftStamps[1], (144.0 - 142.0, 1.5))
+        self.assertEqual(TileData.coordinates, (4, 0))
+        self.assertEqual(TileData.driftUnits, "nm/sec")
+
+    def test_Statistics(self):
+        LogData = SerialEMLog.Load(self.LogFullPath, usecache=False)
+        self.assertEqual(LogData.PropertiesVersion, "Sep 30, 2011")
+        self.assertEqual(LogData.MontageStart, 100.0)
+        self.validateStatistics(LogData)
+
+    def test_Cache(self):
+        LogData = SerialEMLog.Load(self.LogFullPath, usecache=False)
+        self.assertTrue(os.path.exists(self.LogFullPath + '.npz'))
+
+        cachedLogData = SerialEMLog.Load(self.LogFullPath, usecache=True)
+        self.assertIsNone(cachedLogData._tileData, "Statistics should be computed from the cached arrays")
+        self.assertEqual(cachedLogData.Version, LogData.Version)
+        self.assertEqual(cachedLogData.Startup, LogData.Startup)
+        self.assertEqual(cachedLogData.MontageEnd, LogData.MontageEnd)
+        self.assertEqual(cachedLogData.NumTiles, LogData.NumTiles)
+        self.assertEqual(cachedLogData.AverageTileDrift, LogData.AverageTileDrift)
+        self.assertIsNone(cachedLogData._tileData)
+
+        self.validateStatistics(cachedLogData)
+
+
 if __name__ == "__main__":
     # import syssys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,153 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import argparse
+import os
+import sys
+import unittest
+from xml.etree import ElementTree
+
+from nornir_buildmanager import journal, pipelinemanager, toolscheduler
+from test.pipeline.metadata_node import Node
+import test.testbase
+
+
+class JournalTests(test.testbase.TestBase):
+
+    def setUp(self):
+        super(JournalTests, self).setUp()
+        os.makedirs(self.TestOutputPath, exist_ok=True)
+        self.JournalPath = os.path.join(self.TestOutputPath, journal.JournalFileName)
+        if os.path.exists(self.JournalPath):
+            os.remove(self.JournalPath)
+
+        self.Volume = Node('Volume', Name='Test')
+        self.Section = Node('Section', Parent=self.Volume, Number='1', Name='0001')
+        self.Channel = Node('Channel', Parent=self.Section, Name='TEM')
+        self.Filter = Node('Filter', Parent=self.Channel, Name='Raw8')
+
+        self.Iterate = ElementTree.fromstring('<Iterate xpath="Block/Section" VariableName="SectionNode" />')
+        self.Call = ElementTree.fromstring('<PythonCall Function="tile.HistogramFilter" FilterNode="#FilterNode" />')
+        self.RunID = journal.RunID('Histogram', argparse.Namespace(volumepath='Volume', Downsample=4, debug=False))
+
+    def Open(self, Resume=True):
+        return journal.RunJournal(self.JournalPath, self.RunID, Resume=Resume)
+
+    def Kwargs(self, **kwargs):
+        args = {'FilterNode': self.Filter, 'Downsample': 4, 'Logger': object(), 'Parameters': {}}
+        args.update(kwargs)
+        return args
+
+    def Interrupt(self):
+        '''Journal an iteration and a stage, then stop without finishing'''
+        Run = self.Open()
+        Run.Add(self.Iterate, self.Section)
+        Run.Add(self.Call, self.Channel, self.Kwargs())
+        Run.Write(Run.TakePending())
+        Run.Close(Finished=False)
+
+    def test_ElementID(self):
+        self.assertEqual(journal.ElementID(self.Filter), 'Volume Test/Section 0001/Channel TEM/Filter Raw8')
+
+    def test_ElementIDOfIdenticalSiblings(self):
+        First = Node('Histogram', Parent=self.Filter)
+        Second = Node('Histogram', Parent=self.Filter)
+        Named = Node('Histogram', Parent=self.Filter, Name='Named')
+
+        self.assertNotEqual(journal.ElementID(First), journal.ElementID(Second))
+        self.assertTrue(journal.ElementID(First).endswith('/Histogram[1]'))
+        self.assertTrue(journal.ElementID(Second).endswith('/Histogram[2]'))
+        self.assertTrue(journal.ElementID(Named).endswith('/Histogram Named'), "Unique descriptions are not indexed")
+
+    def test_RunID(self):
+        self.assertEqual(self.RunID, journal.RunID('Histogram', argparse.Namespace(volumepath='Volume', Downsample=4, debug=True)),
+                         "Debug output does not change the work")
+        self.assertNotEqual(self.RunID, journal.RunID('Histogram', argparse.Namespace(volumepath='Volume', Downsample=8, debug=False)))
+
+    def test_Resume(self):
+        self.Interrupt()
+
+        Run = self.Open()
+        self.assertTrue(Run.Resumed)
+        self.assertTrue(Run.IsComplete(self.Iterate, self.Section))
+        self.assertTrue(Run.IsComplete(self.Call, self.Channel, self.Kwargs(Logger=object())))
+        self.assertFalse(Run.IsComplete(self.Call, self.Channel, self.Kwargs(Downsample=8)))
+        self.assertFalse(Run.IsComplete(self.Iterate, self.Channel))
+
+    def test_ChangedElementIsRepeated(self):
+        self.Interrupt()
+        self.Section.attrib['Name'] = '0001'
+        self.Section.attrib['Notes'] = 'Rescanned'
+
+        Run = self.Open()
+        self.assertFalse(Run.IsComplete(self.Iterate, self.Section))
+
+    def test_PendingEntriesAreNotResumed(self):
+        Run = self.Open()
+        Run.Add(self.Iterate, self.Section)
+        Run.Close(Finished=False)
+
+        self.assertFalse(self.Open().Resumed, "Entries are only journaled once written")
+
+    def test_NoResume(self):
+        self.Interrupt()
+        self.assertFalse(self.Open(Resume=False).Resumed)
+        self.assertFalse(self.Open().Resumed, "Starting over discards the interrupted run's journal")
+
+    def test_OtherRunIsNotResumed(self):
+        self.Interrupt()
+        self.RunID = journal.RunID('Prune', argparse.Namespace(volumepath='Volume'))
+        self.assertFalse(self.Open().Resumed)
+
+    def test_FinishedRunDeletesJournal(self):
+        Run = self.Open()
+        Run.Close(Finished=True)
+        self.assertFalse(os.path.exists(self.JournalPath))
+
+    def test_IncompleteLineIgnored(self):
+        self.Interrupt()
+        with open(self.JournalPath, 'a') as hFile:
+            hFile.write('{"Stage": "Iterate')
+
+        Run = self.Open()
+        self.assertTrue(Run.IsComplete(self.Iterate, self.Section))
+
+    def test_TakePendingSubtree(self):
+        OtherSection = Node('Section', Parent=self.Volume, Number='2', Name='0002')
+
+        Run = self.Open()
+        Run.Add(self.Iterate, self.Section)
+        Run.Add(self.Call, self.Channel, self.Kwargs())
+        Run.Add(self.Iterate, OtherSection)
+
+        entries = Run.TakePending(Root=self.Section)
+        self.assertEqual([entry['Element'] for entry in entries], [journal.ElementID(self.Section), journal.ElementID(self.Channel)])
+        self.assertEqual([entry['Element'] for entry in Run.TakePending()], [journal.ElementID(OtherSection)])
+
+    def test_FailuresMarkAncestors(self):
+        Run = self.Open()
+        Run.MarkFailed(self.Channel)
+        self.assertTrue(Run.HasFailed(self.Section))
+        self.assertFalse(Run.HasFailed(self.Filter))
+
+    def test_StageJournaledAfterQueuedTools(self):
+        '''A stage that queued an external tool is journaled by the tool's completion callback'''
+        Run = self.Open()
+        manager = pipelinemanager.PipelineManager.__new__(pipelinemanager.PipelineManager)
+        manager.Journal = Run
+
+        scheduler = toolscheduler.ExternalToolScheduler()
+        with toolscheduler.RecordSubmissions() as jobs:
+            scheduler.Submit('tool', '"%s" -c "pass"' % sys.executable)
+
+        manager._JournalAfterTools(self.Call, self.Channel, self.Kwargs(), jobs)
+        self.assertTrue(Run.HasFailed(self.Section), "The iteration finishes before the tool and is not journaled")
+        self.assertEqual(Run.TakePending(), [])
+
+        scheduler.Wait()
+        self.assertEqual([entry['Element'] for entry in Run.TakePending()], [journal.ElementID(self.Channel)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import struct
+import time
+import unittest
+
+import numpy
+
+import nornir_buildmanager.importers.mrc as mrc
+import test.testbase
+
+
+def WriteSyntheticMRC(fullpath, num_tiles=4, img_shape=(256, 192), max_pixel_value=16383, seed=0):
+    '''Write a little-endian, unsigned 16-bit SerialEM style .mrc file with stage coordinates for each tile.
+    :return: The pixel data that was written, shape (num_tiles, XDim, YDim)
+    '''
+    tile_header_size = 4
+    extended_header_size = tile_header_size * num_tiles
+
+    header = bytearray(mrc.MRCFile.HeaderLength)
+    struct.pack_into('<IIII', header, 0x00, img_shape[0], img_shape[1], num_tiles, 6)
+    struct.pack_into('<III', header, 0x1C, img_shape[0], img_shape[1], 1)
+    struct.pack_into('<fff', header, 0x28, img_shape[0] * 20.0, img_shape[1] * 20.0, 1.0)
+    struct.pack_into('<III', header, 0x40, 1, 2, 3)
+    struct.pack_into('<fff', header, 0x4C, 0, max_pixel_value, max_pixel_value / 2.0)
+    struct.pack_into('<I', header, 0x5C, extended_header_size)
+    struct.pack_into('<HH', header, 0x80, tile_header_size, int(mrc.MRCTileHeaderFlags.StageCoord))
+    struct.pack_into('<I', header, 0xD4, 68)
+
+    rng = numpy.random.RandomState(seed)
+    pixels = rng.randint(0, max_pixel_value + 1, size=(num_tiles, img_shape[0], img_shape[1])).astype('<u2')
+
+    with open(fullpath, 'wb') as f:
+        f.write(header)
+        for iTile in range(0, num_tiles):
+            f.write(struct.pack('<HH', iTile * 25, 0))
+
+        f.write(pixels.tobytes())
+
+    return pixels
+
+
+class MRCFileTest(test.testbase.TestBase):
+
+    def setUp(self):
+        super(MRCFileTest, self).setUp()
+        self.MRCFullPath = os.path.join(self.TestOutputPath, 'synthetic.mrc')
+        self.Pixels = WriteSyntheticMRC(self.MRCFullPath)
+
+    def tearDown(self):
+        mrc._WorkerMRCFiles.clear()
+        super(MRCFileTest, self).tearDown()
+
+    def test_MemoryMappedTilesMatchFileReads(self):
+
+        mrcObj = mrc.MRCFile.Load(self.MRCFullPath)
+        self.assertIsNotNone(mrcObj.tiles, "Unsigned 16-bit data should be memory mapped")
+
+        readObj = mrc.MRCFile.Load(self.MRCFullPath)
+        readObj._tiles_unavailable = True
+
+        for iTile in range(0, mrcObj.num_tiles):
+            mapped = mrcObj.get_tile_as_numpy(iTile)
+            numpy.testing.assert_array_equal(mapped, self.Pixels[iTile])
+            numpy.testing.assert_array_equal(mapped, readObj.get_tile_as_numpy(iTile))
+            self.assertEqual(mrcObj.get_tile_as_bytes(iTile), readObj.get_tile_as_bytes(iTile))
+
+        mrcObj.close()
+        readObj.close()
+
+    def test_WorkerFileIsReused(self):
+
+        first = mrc.GetWorkerMRCFile(self.MRCFullPath)
+        self.assertIs(first, mrc.GetWorkerMRCFile(self.MRCFullPath), "Header should be parsed once per process")
+
+        # Replacing the file should load the new contents
+        stats = os.stat(self.MRCFullPath)
+        first.close()
+        self.Pixels = WriteSyntheticMRC(self.MRCFullPath, num_tiles=2, seed=1)
+        os.utime(self.MRCFullPath, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000000000))
+
+        second = mrc.GetWorkerMRCFile(self.MRCFullPath)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.num_tiles, 2)
+        numpy.testing.assert_array_equal(second.get_tile_as_numpy(1), self.Pixels[1])
+
+    def test_WorkerFilesAreEvicted(self):
+
+        paths = [self.MRCFullPath]
+        for i in range(1, mrc.MaxWorkerMRCFiles + 1):
+            paths.append(os.path.join(self.TestOutputPath, 'synthetic%d.mrc' % i))
+            WriteSyntheticMRC(paths[-1], num_tiles=2, seed=i)
+
+        opened = [mrc.GetWorkerMRCFile(path) for path in paths[:-1]]
+
+        # Using the first file again makes the second the least recently used
+        self.assertIs(mrc.GetWorkerMRCFile(paths[0]), opened[0])
+        last = mrc.GetWorkerMRCFile(paths[-1])
+
+        self.assertEqual(len(mrc._WorkerMRCFiles), mrc.MaxWorkerMRCFiles)
+        self.assertEqual(list(mrc._WorkerMRCFiles.keys())[-1], paths[-1])
+        self.assertIn(paths[0], mrc._WorkerMRCFiles)
+        self.assertNotIn(paths[1], mrc._WorkerMRCFiles)
+        self.assertIsNone(opened[1].mrc, "Evicted files should be closed")
+        self.assertIsNotNone(opened[0].mrc)
+        self.assertIsNotNone(last.mrc)
+
+    def test_ExportImage(self):
+
+        min_max_gamma = mrc.shared.MinMaxGamma(0, 16383, 1.0)
+        for iTile in range(0, self.Pixels.shape[0]):
+            self.assertTrue(mrc.MRCImport.ExportImage(self.MRCFullPath, self.TestOutputPath, '.png', iTile, min_max_gamma))
+
+        self.assertEqual(len(mrc._WorkerMRCFiles), 1)
+
+        for iTile in range(0, self.Pixels.shape[0]):
+            filename = mrc.GetFileNameForTileNumber(tile_number=iTile, ext='.png')
+            self.assertTrue(os.path.exists(os.path.join(self.TestOutputPath, filename)))
+
+
+    def test_ContrastLookupTableMatchesFloatPath(self):
+
+        # Values above max, but below twice max, are halved by both paths without clipping
+        min_max_gamma = mrc.shared.MinMaxGamma(0, 12000, 1.0)
+        mrcObj = mrc.MRCFile.Load(self.MRCFullPath)
+
+        for iTile in range(0, mrcObj.num_tiles):
+            img = numpy.transpose(mrcObj.get_tile_as_numpy(iTile))
+            expected = mrc.MRCImport.ApplyContrast(img, min_max_gamma)
+            actual = mrc.MRCImport.ApplyContrastLookupTable(img, min_max_gamma)
+            self.assertEqual(actual.dtype, expected.dtype)
+            numpy.testing.assert_array_equal(actual, expected)
+
+        mrcObj.close()
+
+    def test_ContrastLookupTableClipsToDtypeRange(self):
+
+        min_max_gamma = mrc.shared.MinMaxGamma(1000, 4000, 1.0)
+        img = numpy.asarray([[0, 999, 1000, 4000, 8000, 16383]], dtype=numpy.uint16)
+        result = mrc.MRCImport.ApplyContrastLookupTable(img, min_max_gamma)
+
+        self.assertEqual(result[0, 0], 0, "Values below the minimum should clip to zero")
+        self.assertEqual(result[0, 2], 0)
+        self.assertEqual(result[0, -1], numpy.iinfo(numpy.uint16).max, "Values far above the maximum should clip to the dtype maximum")
+
+    def test_ContrastLookupTablesAreBounded(self):
+
+        mrc._ContrastLookupTables.clear()
+        settings = [mrc.shared.MinMaxGamma(0, 1000 * (i + 1), 1.0) for i in range(0, mrc.MaxContrastLookupTables + 1)]
+        tables = [mrc.MRCImport.GetContrastLookupTable(numpy.uint16, min_max_gamma) for min_max_gamma in settings[:-1]]
+
+        # Using the first table again makes the second the least recently used
+        self.assertIs(mrc.MRCImport.GetContrastLookupTable(numpy.uint16, settings[0]), tables[0])
+        mrc.MRCImport.GetContrastLookupTable(numpy.uint16, settings[-1])
+
+        self.assertEqual(len(mrc._ContrastLookupTables), mrc.MaxContrastLookupTables)
+        cached = [key[1] for key in mrc._ContrastLookupTables.keys()]
+        self.assertIn(settings[0], cached)
+        self.assertNotIn(settings[1], cached)
+        self.assertEqual(cached[-1], settings[-1])
+
+    def test_ContrastThroughput(self):
+        '''The lookup table contrast path should be at least as fast as the float path on synthetic 16-bit tiles'''
+
+        mrcFullPath = os.path.join(self.TestOutputPath, 'benchmark.mrc')
+        WriteSyntheticMRC(mrcFullPath, num_tiles=8, img_shape=(1024, 1024))
+        min_max_gamma = mrc.shared.MinMaxGamma(200, 12000, 1.0)
+
+        mrcObj = mrc.MRCFile.Load(mrcFullPath)
+        tiles = [numpy.transpose(mrcObj.get_tile_as_numpy(iTile)) for iTile in range(0, mrcObj.num_tiles)]
+        megabytes = sum([t.nbytes for t in tiles]) / float(1 << 20)
+
+        # Build the table outside of the timed loop, workers reuse it for every tile in a section
+        mrc.MRCImport.GetContrastLookupTable(tiles[0].dtype, min_max_gamma)
+
+        # Keep the fastest of several passes so a busy machine does not decide the comparison
+        float_elapsed = None
+        lut_elapsed = None
+        for iPass in range(0, 3):
+            start = time.perf_counter()
+            for t in tiles:
+                mrc.MRCImport.ApplyContrast(t, min_max_gamma)
+            elapsed = time.perf_counter() - start
+            float_elapsed = elapsed if float_elapsed is None else min(float_elapsed, elapsed)
+
+            start = time.perf_counter()
+            for t in tiles:
+                mrc.MRCImport.ApplyContrastLookupTable(t, min_max_gamma)
+            elapsed = time.perf_counter() - start
+            lut_elapsed = elapsed if lut_elapsed is None else min(lut_elapsed, elapsed)
+
+        mrcObj.close()
+
+        self.Logger.info("Contrast float path: %.1f MB/s, lookup table path: %.1f MB/s" % (megabytes / float_elapsed, megabytes / lut_elapsed))
+        self.assertLessEqual(lut_elapsed, float_elapsed, "Lookup table contrast path should not be slower than the float path")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,15 +9,19 @@ import logging
 import os
 import shutil
 import unittest
+import unittest.mock
 
 import nornir_buildmanager.VolumeManagerETree
+import nornir_imageregistration
 from nornir_buildmanager.importers.pmg import ParsePMGFilename, PMGInfo
 from nornir_imageregistration.files.mosaicfile import MosaicFile
 import nornir_shared.files
 import nornir_shared.misc
+from PIL import Image
 
 import nornir_buildmanager.importers.pmg as pmg
 from . import setup_pipeline
+import test.testbase
 
 
 PMGData = {"6750_10677D_WDF_20x_02_G.pmg" : PMGInfo(Slide=6750,
@@ -355,6 +359,45 @@ class ParsePMG(PMGTest):
             for f in list(FilesDict.keys()):
                 self.assertTrue(os.path.exists(os.path.join(pmgDir, f)))
 
+
+class ProbeImageSizesTest(test.testbase.TestBase):
+    '''Tile sizes read from image headers match the sizes nornir_imageregistration reports'''
+
+    Sizes = {'tile.bmp': (48, 64),
+             'tile.tif': (37, 91),
+             'tile.png': (120, 16)}
+
+    def setUp(self):
+        super(ProbeImageSizesTest, self).setUp()
+
+        self.ImageFullPaths = []
+        for (name, (Height, Width)) in self.Sizes.items():
+            ImageFullPath = os.path.join(self.TestOutputPath, name)
+            Image.new('L', (Width, Height)).save(ImageFullPath)
+            self.ImageFullPaths.append(ImageFullPath)
+
+    def test_MatchesGetImageSize(self):
+        SizeTasks = pmg.ProbeImageSizes(self.ImageFullPaths + self.ImageFullPaths)
+        self.assertEqual(sorted(SizeTasks.keys()), sorted(self.ImageFullPaths), "Each image should be probed once")
+
+        for ImageFullPath in self.ImageFullPaths:
+            Size = SizeTasks[ImageFullPath].wait_return()
+            self.assertEqual(Size, self.Sizes[os.path.basename(ImageFullPath)])
+            self.assertEqual(list(Size), list(nornir_imageregistration.GetImageSize(ImageFullPath)))
+
+    def test_Fallback(self):
+        UnreadableFullPath = os.path.join(self.TestOutputPath, 'unreadable.tif')
+        with open(UnreadableFullPath, 'wb') as f:
+            f.write(b'Not an image')
+
+        with unittest.mock.patch('nornir_imageregistration.GetImageSize', return_value=(10, 20)) as GetImageSize:
+            self.assertEqual(pmg.ReadImageSizeFromHeader(UnreadableFullPath), (10, 20))
+            GetImageSize.assert_called_once_with(UnreadableFullPath)
+
+            self.assertEqual(pmg.ReadImageSizeFromHeader(self.ImageFullPaths[0]), self.Sizes['tile.bmp'])
+            GetImageSize.assert_called_once_with(UnreadableFullPath)
+
+
 if __name__ == "__main__":
     # import syssys.argv = ['', 'Test.testpmg']
     unittest.main()
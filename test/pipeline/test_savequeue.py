@@ -0,0 +1,136 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import time
+import unittest
+
+from nornir_buildmanager import savequeue
+from test.pipeline.metadata_node import Node
+
+
+class Container(Node):
+    '''Meta-data element saved in its own VolumeData.xml file'''
+
+    def Save(self, tabLevel=None, recurse=True):
+        pass
+
+
+class SaveQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.Saved = []
+        self.Section = Container('Section', Number='1')
+        self.Channel = Container('Channel', Parent=self.Section, Name='TEM')
+        self.Filter = Container('Filter', Parent=self.Channel, Name='Raw8')
+        self.Level = Container('Level', Parent=self.Filter, Downsample='1')
+        self.Image = Node('Image', Parent=self.Level, Path='001.png')
+        self.OtherChannel = Container('Channel', Parent=self.Section, Name='LM')
+
+    def Queue(self, **kwargs):
+        return savequeue.SaveQueue(self.Saved.append, **kwargs)
+
+    def test_SavedElement(self):
+        self.assertIs(savequeue.SavedElement(self.Image), self.Level)
+        self.assertIs(savequeue.SavedElement(self.Level), self.Level)
+
+    def test_RepeatedNodesSavedOnce(self):
+        queue = self.Queue()
+        for i in range(10):
+            queue.Add(self.Image)
+
+        self.assertEqual(self.Saved, [], "Nothing is saved until a flush")
+        self.assertEqual(queue.Flush(), 1)
+        self.assertEqual(self.Saved, [self.Level])
+        self.assertEqual(queue.Flush(), 0)
+
+    def test_AncestorSavesDescendants(self):
+        queue = self.Queue()
+        queue.Add(self.Image)
+        queue.Add(self.OtherChannel)
+        queue.Add(self.Channel)
+
+        queue.Flush()
+        self.assertEqual(self.Saved, [self.OtherChannel, self.Channel], "The level is saved by its channel")
+
+    def test_DeepestSavedFirst(self):
+        queue = self.Queue()
+        queue.Add(self.OtherChannel)
+        queue.Add(self.Image)
+
+        queue.Flush()
+        self.assertEqual(self.Saved, [self.Level, self.OtherChannel])
+
+    def test_CountThreshold(self):
+        queue = self.Queue(MaxNodes=3)
+        queue.Add(self.Image)
+        queue.Add(self.Image)
+        self.assertEqual(self.Saved, [])
+
+        queue.Add(self.OtherChannel)
+        self.assertEqual(self.Saved, [self.Level, self.OtherChannel])
+        self.assertEqual(len(queue), 0)
+
+    def test_TimeThreshold(self):
+        queue = self.Queue(MaxSeconds=0.05)
+        queue.Add(self.Image)
+        time.sleep(0.06)
+        self.assertEqual(self.Saved, [])
+
+        queue.Add(self.OtherChannel)
+        self.assertEqual(len(self.Saved), 2)
+
+    def test_FlushSubtree(self):
+        queue = self.Queue()
+        queue.Add(self.Image)
+        queue.Add(self.OtherChannel)
+
+        self.assertEqual(queue.Flush(Root=self.Channel), 1)
+        self.assertEqual(self.Saved, [self.Level], "Only containers below the root are saved")
+        self.assertEqual(len(queue), 1)
+
+        queue.Flush()
+        self.assertEqual(self.Saved, [self.Level, self.OtherChannel])
+
+    def test_RunningStagesDoNotFlush(self):
+        queue = self.Queue(MaxNodes=2)
+        queue.Add(self.Image, CheckThresholds=False)
+        queue.Add(self.OtherChannel, CheckThresholds=False)
+        self.assertEqual(self.Saved, [])
+
+        queue.Add(self.Image)
+        self.assertEqual(len(self.Saved), 2)
+
+    def test_HasDirtyAncestor(self):
+        queue = self.Queue()
+        queue.Add(self.Image)
+        self.assertFalse(queue.HasDirtyAncestor(self.Level))
+        self.assertTrue(queue.HasDirtyAncestor(self.Image))
+
+        queue.Add(self.Section)
+        self.assertTrue(queue.HasDirtyAncestor(self.OtherChannel))
+
+    def test_IsInSubtree(self):
+        self.assertTrue(savequeue.IsInSubtree(self.Image, self.Channel))
+        self.assertTrue(savequeue.IsInSubtree(self.Channel, self.Channel))
+        self.assertFalse(savequeue.IsInSubtree(self.OtherChannel, self.Channel))
+
+    def test_FailedSaveIsRetried(self):
+        def FailingSave(container):
+            if container is self.Level:
+                raise OSError()
+
+            self.Saved.append(container)
+
+        queue = savequeue.SaveQueue(FailingSave)
+        queue.Add(self.Image)
+        queue.Add(self.OtherChannel)
+
+        with self.assertRaises(OSError):
+            queue.Flush()
+
+        self.assertEqual(len(queue), 2, "Containers not saved remain dirty")
+
+
+if __name__ == "__main__":
+    unittest.main()
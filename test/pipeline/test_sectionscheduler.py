@@ -0,0 +1,101 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import threading
+import time
+import unittest
+
+import nornir_pools
+
+from nornir_buildmanager.importers import sectionscheduler
+
+
+class SectionSchedulerTests(unittest.TestCase):
+
+    def tearDown(self):
+        nornir_pools.ClosePools()
+        unittest.TestCase.tearDown(self)
+
+    def test_SerialImportPreservesOrder(self):
+
+        def ImportGenerator(name):
+            yield name + '.block'
+            yield name + '.section'
+
+        SectionImports = [('1', lambda: '1'),
+                          ('2', lambda: None),
+                          ('3', lambda: ImportGenerator('3'))]
+
+        results = list(sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections=1))
+        self.assertEqual(results, ['1', '3.block', '3.section'])
+
+    def test_UnlockedWorkOverlaps(self):
+
+        NumSections = 3
+        barrier = threading.Barrier(NumSections, timeout=10)
+
+        def ImportSection(name):
+            with sectionscheduler.MetadataUnlocked():
+                # Fails with BrokenBarrierError unless every section reaches this point at once
+                barrier.wait()
+
+            return name
+
+        SectionImports = [(str(i), lambda i=i: ImportSection(i)) for i in range(0, NumSections)]
+
+        results = list(sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections=NumSections))
+        self.assertEqual(sorted(results), list(range(0, NumSections)))
+
+    def test_MetadataAccessIsSerialized(self):
+
+        state = {'active': 0, 'max_active': 0}
+
+        def TouchMetadata():
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+            time.sleep(0.01)
+            state['active'] -= 1
+
+        def ImportSection(name):
+            TouchMetadata()
+            with sectionscheduler.MetadataUnlocked():
+                time.sleep(0.01)
+
+            TouchMetadata()
+            yield name
+
+        SectionImports = [(str(i), lambda i=i: ImportSection(i)) for i in range(0, 8)]
+
+        for result in sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections=4):
+            # Saving the node must not overlap meta-data changes on other threads
+            TouchMetadata()
+
+        self.assertEqual(state['max_active'], 1)
+
+    def test_FailureIsRaisedAfterOtherSectionsComplete(self):
+
+        completed = []
+
+        def FailingImport():
+            raise ValueError("Bad section")
+
+        def ImportSection(name):
+            with sectionscheduler.MetadataUnlocked():
+                time.sleep(0.05)
+
+            completed.append(name)
+            return name
+
+        SectionImports = [('bad', FailingImport),
+                          ('1', lambda: ImportSection(1)),
+                          ('2', lambda: ImportSection(2))]
+
+        with self.assertRaises(ValueError):
+            list(sectionscheduler.ImportSections(SectionImports, MaxConcurrentSections=2))
+
+        self.assertEqual(sorted(completed), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import unittest
+from xml.etree import ElementTree
+
+from nornir_buildmanager import pipelinemanager, stagememo
+import test.testbase
+from test.pipeline.metadata_node import Node
+
+
+class StageMemoTests(test.testbase.TestBase):
+
+    def setUp(self):
+        super(StageMemoTests, self).setUp()
+        Node.Root = self.TestOutputPath
+
+        self.Section = Node('Section', Number='1', Path='0001')
+        self.Channel = Node('Channel', Parent=self.Section, Name='TEM', Path='TEM')
+        self.Filter = Node('Filter', Parent=self.Channel, Name='Raw8', Path='Raw8')
+        self.OtherChannel = Node('Channel', Parent=self.Section, Name='LM', Path='LM')
+
+        os.makedirs(self.Filter.FullPath, exist_ok=True)
+
+        self.CallNode = ElementTree.fromstring('<PythonCall Function="tile.HistogramFilter" Memoize="True" FilterNode="#FilterNode" />')
+
+    def Key(self, **kwargs):
+        args = {'section_node': self.Section, 'FilterNode': self.Filter, 'VolumeElement': self.Channel, 'Downsample': 4}
+        args.update(kwargs)
+        return stagememo.ComputeKey('nornir_buildmanager.operations.tile.HistogramFilter', args, self.Channel)
+
+    def test_KeyIsStable(self):
+        self.assertEqual(self.Key(), self.Key())
+        self.assertEqual(self.Key(Logger=object()), self.Key(VolumeNode=object()), "The logger and volume should not affect the key")
+        self.assertEqual(self.Key(), self.Key(VolumeElement=self.OtherChannel), "The element the stage runs against should not affect the key")
+
+    def test_ArgumentsChangeKey(self):
+        self.assertNotEqual(self.Key(), self.Key(Downsample=8))
+
+        before = self.Key()
+        self.Filter.attrib['MaxIntensityCutoff'] = '200'
+        self.assertNotEqual(before, self.Key())
+
+    def test_OutputsBelowInputsChangeKey(self):
+        before = self.Key()
+        Node('Histogram', Parent=self.Filter, Path='Histogram.xml')
+        self.assertNotEqual(before, self.Key())
+
+    def test_FileChangesChangeKey(self):
+        before = self.Key()
+        os.rmdir(self.Filter.FullPath)
+        self.assertNotEqual(before, self.Key(), "A missing input directory should change the key")
+
+    def test_DescendantFileChangesChangeKey(self):
+        Histogram = Node('Histogram', Parent=self.Filter, Path='Histogram.xml')
+        with open(Histogram.FullPath, 'w') as f:
+            f.write('<Histogram />')
+
+        before = self.Key()
+        with open(Histogram.FullPath, 'w') as f:
+            f.write('<Histogram NumBins="256" />')
+
+        self.assertNotEqual(before, self.Key(), "A replaced output file below the input should change the key")
+
+    def test_FileRewrittenInDirectoryChangesKey(self):
+        TilePath = os.path.join(self.Filter.FullPath, '000.png')
+        with open(TilePath, 'w') as f:
+            f.write('tile')
+
+        DirStats = os.stat(self.Filter.FullPath)
+        before = self.Key()
+
+        with open(TilePath, 'w') as f:
+            f.write('tile')
+        os.utime(TilePath, ns=(DirStats.st_atime_ns, DirStats.st_mtime_ns + 1000000))
+        os.utime(self.Filter.FullPath, ns=(DirStats.st_atime_ns, DirStats.st_mtime_ns))
+
+        self.assertEqual(DirStats.st_mtime_ns, os.stat(self.Filter.FullPath).st_mtime_ns)
+        self.assertNotEqual(before, self.Key(), "A tile rewritten in place should change the key")
+
+    def test_KeyRecordedWhenIterationFinishes(self):
+        manager = pipelinemanager.PipelineManager(None, ElementTree.Element('Pipeline'))
+        manager.VolumeTree = self.Section
+
+        args = {'section_node': self.Section, 'FilterNode': self.Filter, 'VolumeElement': self.Channel, 'Downsample': 4, 'Parameters': {}}
+        manager._QueueMemoKey(self.Channel, self.CallNode, 'nornir_buildmanager.operations.tile.HistogramFilter', args)
+        args['Parameters']['Cleared'] = True
+        self.assertFalse(stagememo.MemoAttributeName(self.CallNode) in self.Channel.attrib)
+
+        # A later stage of the iteration adds its output below the element
+        Node('Filter', Parent=self.Channel, Name='Leveled', Path='Leveled')
+        manager._RecordMemoKeys(self.Channel)
+
+        self.assertTrue(stagememo.IsCurrent(self.Channel, self.CallNode, self.Key(Parameters={})),
+                        "The next run should match the key before the stage is called")
+
+    def test_AncestorsOnlyContributeAttributes(self):
+        before = self.Key()
+        Node('Filter', Parent=self.OtherChannel, Name='Leveled', Path='Leveled')
+        self.assertEqual(before, self.Key(), "Work elsewhere in the section should not change the key")
+
+        self.Section.attrib['Number'] = '2'
+        self.assertNotEqual(before, self.Key())
+
+    def test_RecordedKeysAreIgnored(self):
+        key = self.Key()
+        stagememo.Record(self.Channel, self.CallNode, key)
+        stagememo.Record(self.Filter, self.CallNode, 'OtherKey')
+
+        self.assertTrue(stagememo.IsCurrent(self.Channel, self.CallNode, self.Key()))
+        self.assertFalse(stagememo.IsCurrent(self.Filter, self.CallNode, self.Key()))
+
+    def test_CallSitesUseDifferentAttributes(self):
+        OtherCall = ElementTree.fromstring('<PythonCall Function="tile.HistogramFilter" Memoize="True" FilterNode="#LeveledFilterNode" />')
+        self.assertNotEqual(stagememo.MemoAttributeName(self.CallNode), stagememo.MemoAttributeName(OtherCall))
+        self.assertTrue(stagememo.MemoAttributeName(self.CallNode).startswith(stagememo.MemoAttributePrefix))
+
+
+if __name__ == "__main__":
+    unittest.main()
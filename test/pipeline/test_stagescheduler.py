@@ -0,0 +1,134 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import threading
+import time
+import unittest
+from xml.etree import ElementTree
+
+from nornir_buildmanager import stagescheduler
+
+IterateXML = '''
+<Iterate VariableName="section_node" XPath="Block/Section" Concurrent="True">
+    <RequireMatch Attribute="Number" RegEx="*" />
+    <Iterate VariableName="ChannelNode" XPath="Channel">
+        <Select VariableName="FilterNode" XPath="Filter" />
+        <PythonCall Function="tile.HistogramFilter" IO="1" />
+        <PythonCall Function="tile.AssembleTransform" MemoryGB="4" />
+    </Iterate>
+    <PythonCall Function="tile.BuildTilePyramids" Cores="2" />
+</Iterate>'''
+
+
+class StageSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.IterateNode = ElementTree.fromstring(IterateXML)
+        self.Elements = ['Section%d' % i for i in range(0, 4)]
+
+    def Compile(self):
+        return stagescheduler.CompileIterate(self.IterateNode, [(e, {}) for e in self.Elements])
+
+    def test_StageResources(self):
+
+        (Require, ChannelIterate, Pyramids) = list(self.IterateNode)
+
+        self.assertEqual(stagescheduler.GetStageResources(Require), stagescheduler.StageResources(0, 0, 0))
+        self.assertEqual(stagescheduler.GetStageResources(ChannelIterate), stagescheduler.StageResources(1, 4.0, 1),
+                         "Undeclared stages should use the largest resources of their children")
+        self.assertEqual(stagescheduler.GetStageResources(Pyramids), stagescheduler.StageResources(2, 0.0, 0))
+
+    def test_CompileIterate(self):
+
+        Roots = self.Compile()
+        self.assertEqual(len(Roots), len(self.Elements))
+
+        for (iElement, root) in enumerate(Roots):
+            chain = []
+            task = root
+            while not task is None:
+                self.assertEqual(task.Element, self.Elements[iElement])
+                chain.append(task.StageNode.tag)
+                task = task.Next
+
+            self.assertEqual(chain, ['RequireMatch', 'Iterate', 'PythonCall'])
+
+    def test_StagesForOneElementRunInOrder(self):
+
+        lock = threading.Lock()
+        order = []
+
+        def RunTask(task):
+            with lock:
+                order.append((task.Element, task.StageIndex))
+            time.sleep(0.01)
+            return True
+
+        NumRun = stagescheduler.StageScheduler(MaxCores=4).Run(self.Compile(), RunTask)
+        self.assertEqual(NumRun, len(self.Elements) * 3)
+
+        for e in self.Elements:
+            self.assertEqual([iStage for (element, iStage) in order if element == e], [0, 1, 2])
+
+    def test_ElementsOverlap(self):
+
+        barrier = threading.Barrier(len(self.Elements), timeout=10)
+
+        def RunTask(task):
+            if task.StageIndex == 1:
+                # Fails with BrokenBarrierError unless every section runs this stage at once
+                barrier.wait()
+            return True
+
+        stagescheduler.StageScheduler(MaxCores=len(self.Elements)).Run(self.Compile(), RunTask)
+
+    def test_ResourceLimits(self):
+
+        lock = threading.Lock()
+        state = {'cores': 0, 'max_cores': 0, 'memory': 0, 'max_memory': 0}
+
+        def RunTask(task):
+            with lock:
+                state['cores'] += task.Resources.Cores
+                state['memory'] += task.Resources.MemoryGB
+                state['max_cores'] = max(state['max_cores'], state['cores'])
+                state['max_memory'] = max(state['max_memory'], state['memory'])
+            time.sleep(0.01)
+            with lock:
+                state['cores'] -= task.Resources.Cores
+                state['memory'] -= task.Resources.MemoryGB
+            return True
+
+        stagescheduler.StageScheduler(MaxCores=3, MaxMemoryGB=8).Run(self.Compile(), RunTask)
+
+        self.assertLessEqual(state['max_cores'], 3)
+        self.assertLessEqual(state['max_memory'], 8)
+
+    def test_SkippedIterationDropsRemainingStages(self):
+
+        ran = []
+
+        def RunTask(task):
+            ran.append((task.Element, task.StageIndex))
+            # The first section fails its <RequireMatch>
+            return not (task.Element == 'Section0' and task.StageIndex == 0)
+
+        NumRun = stagescheduler.StageScheduler(MaxCores=2).Run(self.Compile(), RunTask)
+
+        self.assertEqual([iStage for (element, iStage) in ran if element == 'Section0'], [0])
+        self.assertEqual(NumRun, (len(self.Elements) - 1) * 3)
+
+    def test_FailureIsRaised(self):
+
+        def RunTask(task):
+            if task.Element == 'Section1' and task.StageIndex == 1:
+                raise ValueError("Stage failed")
+            return True
+
+        with self.assertRaises(ValueError):
+            stagescheduler.StageScheduler(MaxCores=2).Run(self.Compile(), RunTask)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import json
+import os
+import time
+import unittest
+from xml.etree import ElementTree
+
+from nornir_buildmanager import stagetrace
+import test.testbase
+
+
+class StageTraceTests(test.testbase.TestBase):
+
+    def tearDown(self):
+        stagetrace.End()
+        super(StageTraceTests, self).tearDown()
+
+    def test_InactiveTraceRecordsNothing(self):
+        with stagetrace.Record('Prune', 'Stage'):
+            pass
+
+        self.assertIsNone(stagetrace.End())
+
+    def test_RecordSpans(self):
+        Trace = stagetrace.Begin()
+        Section = ElementTree.Element('Section', {'Number': '7'})
+
+        with stagetrace.Record('Iterate', 'Iterate', Section):
+            with stagetrace.Record('Prune', 'Stage', Section):
+                time.sleep(0.05)
+
+        self.assertIs(stagetrace.End(), Trace)
+        self.assertEqual([span.Name for span in Trace.Spans], ['Prune', 'Iterate'], "Spans are recorded as they finish")
+
+        (Prune, Iterate) = Trace.Spans
+        self.assertGreaterEqual(Prune.Wall, 0.05)
+        self.assertGreaterEqual(Iterate.Wall, Prune.Wall)
+        self.assertLessEqual(Iterate.Start, Prune.Start)
+        self.assertEqual(Prune.Section, 7)
+        self.assertEqual(Prune.Element, 'Section 7')
+
+    def test_SpanRecordedOnException(self):
+        Trace = stagetrace.Begin()
+        with self.assertRaises(ValueError):
+            with stagetrace.Record('Prune', 'Stage'):
+                raise ValueError()
+
+        self.assertEqual(len(Trace.Spans), 1)
+
+    def test_ChromeTrace(self):
+        Trace = stagetrace.Begin()
+        with stagetrace.Record('Prune', 'Stage', ElementTree.Element('Channel', {'Name': 'TEM'})):
+            pass
+
+        FullPath = os.path.join(self.TestOutputPath, stagetrace.TraceFileName)
+        Trace.WriteChromeTrace(FullPath)
+        with open(FullPath, 'r') as InputFile:
+            document = json.load(InputFile)
+
+        (event,) = document['traceEvents']
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(event['name'], 'Prune')
+        self.assertEqual(event['cat'], 'Stage')
+        self.assertEqual(event['args']['Element'], 'Channel TEM')
+        self.assertIn('dur', event)
+
+    def test_SummaryOrdersByTime(self):
+        Trace = stagetrace.Begin()
+        for i in range(2):
+            with stagetrace.Record('Slow', 'Stage'):
+                time.sleep(0.02)
+
+        with stagetrace.Record('Fast', 'Stage'):
+            pass
+
+        lines = Trace.Summary().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Slow', lines[1])
+        self.assertEqual(lines[1].split()[2], '2', "Calls of one stage are combined")
+        self.assertIn('Fast', lines[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+from xml.etree import ElementTree
+
+from nornir_buildmanager import pipelinemanager, savequeue, subtreesnapshot
+from test.pipeline.metadata_node import Node
+
+
+def ChangeOtherSection(VolumeElement, OtherSection, **kwargs):
+    '''A stage that adds nodes outside its own element, then fails'''
+    Node('Transform', Parent=OtherSection, Name='HalfWritten')
+    yield OtherSection
+    raise ValueError("Stage failed")
+
+
+@subtreesnapshot.OnlyChangesOwnElement
+def ChangeOwnElement(VolumeElement, **kwargs):
+    '''A stage that only changes its own element, then fails'''
+    VolumeElement.attrib['Number'] = '5'
+    yield VolumeElement
+    raise ValueError("Stage failed")
+
+
+class SubtreeSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.Volume = Node('Volume')
+        self.Section = Node('Section', Parent=self.Volume, Number='1')
+        self.Channel = Node('Channel', Parent=self.Section, Name='TEM')
+        self.Filter = Node('Filter', Parent=self.Channel, Name='Raw8')
+        self.OtherSection = Node('Section', Parent=self.Volume, Number='2')
+
+    def test_RestoreAttributesAndText(self):
+        snapshot = subtreesnapshot.SubtreeSnapshot(self.Section)
+        self.assertEqual(len(snapshot), 3)
+
+        self.Filter.attrib['MaxIntensityCutoff'] = '200'
+        del self.Channel.attrib['Name']
+        self.Filter.text = 'Changed'
+
+        self.assertEqual(snapshot.Restore(), [])
+        self.assertEqual(self.Filter.attrib, {'Name': 'Raw8'})
+        self.assertEqual(self.Channel.attrib['Name'], 'TEM')
+        self.assertIsNone(self.Filter.text)
+
+    def test_RestoreChildren(self):
+        snapshot = subtreesnapshot.SubtreeSnapshot(self.Section)
+
+        Added = Node('Filter', Parent=self.Channel, Name='Leveled')
+        AddedChild = Node('Histogram', Parent=Added)
+        self.Channel.remove(self.Filter)
+        self.Filter.Parent = None
+
+        self.assertEqual(snapshot.Restore(), [Added, AddedChild])
+        self.assertEqual(list(self.Channel), [self.Filter])
+        self.assertIs(self.Filter.Parent, self.Channel)
+
+    def test_OnlySubtreeRestored(self):
+        snapshot = subtreesnapshot.SubtreeSnapshot(self.Section)
+        self.OtherSection.attrib['Number'] = '3'
+        snapshot.Restore()
+        self.assertEqual(self.OtherSection.attrib['Number'], '3')
+
+    def test_ElementsKeepIdentity(self):
+        snapshot = subtreesnapshot.SubtreeSnapshot(self.Volume)
+        self.Section.attrib['Number'] = '5'
+        snapshot.Restore()
+        self.assertIs(self.Volume[0], self.Section)
+        self.assertEqual(self.Section.attrib['Number'], '1')
+
+
+class FailedStageTests(unittest.TestCase):
+    '''Recovery of the meta-data when a stage run by the pipeline manager fails'''
+
+    def setUp(self):
+        self.Volume = Node('Volume')
+        self.Section = Node('Section', Parent=self.Volume, Number='1')
+        self.OtherSection = Node('Section', Parent=self.Volume, Number='2')
+
+        self.Saved = []
+        self.Reloads = []
+
+        self.Manager = pipelinemanager.PipelineManager(None, ElementTree.Element('Pipeline'))
+        self.Manager.VolumeTree = self.Volume
+        self.Manager.SaveQueue = savequeue.SaveQueue(self.Saved.append)
+        self.Manager._ReloadVolume = lambda: self.Reloads.append(True)
+
+        self.ArgSet = pipelinemanager.ArgumentSet()
+        self.ArgSet.AddArguments({'debug': False, 'verbose': False})
+        self.ArgSet.AddVariable('OtherSection', self.OtherSection)
+
+    def Run(self, Function):
+        PipelineNode = ElementTree.Element('PythonCall', Module=__name__, Function=Function)
+        self.Manager.ProcessPythonCall(self.ArgSet, self.Section, PipelineNode)
+
+    def test_StageChangingOtherElementReloads(self):
+        # Work of an earlier stage is saved before the stage runs
+        self.Manager.SaveQueue.Add(self.Section)
+
+        self.Run('ChangeOtherSection')
+
+        self.assertEqual(self.Reloads, [True])
+        self.assertEqual(self.Saved, [self.Volume])
+        self.assertEqual(len(self.Manager.SaveQueue), 0, "Changes made by the failed stage are not saved")
+
+    def test_StageChangingOwnElementRollsBack(self):
+        self.Run('ChangeOwnElement')
+
+        self.assertEqual(self.Reloads, [])
+        self.assertEqual(self.Saved, [])
+        self.assertEqual(self.Section.attrib['Number'], '1')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import sys
+import threading
+import unittest
+
+import nornir_buildmanager.toolscheduler as toolscheduler
+
+
+def PythonCmd(code):
+    return '"%s" -c "%s"' % (sys.executable, code)
+
+
+class ExternalToolSchedulerTests(unittest.TestCase):
+
+    def test_ExitStatusAndOutput(self):
+
+        scheduler = toolscheduler.ExternalToolScheduler(MaxCores=2)
+
+        scheduler.Submit('pass', PythonCmd("print('pass')"), OnComplete=lambda result: result)
+        scheduler.Submit('fail', PythonCmd("import sys; print('fail'); sys.exit(3)"), OnComplete=lambda result: result)
+
+        results = scheduler.Wait()
+        self.assertEqual(len(results), 2)
+
+        resultsByName = {r.Name: r for r in results}
+        self.assertEqual(resultsByName['pass'].ReturnCode, 0)
+        self.assertEqual(resultsByName['pass'].Output.strip(), 'pass')
+        self.assertEqual(resultsByName['fail'].ReturnCode, 3)
+        self.assertEqual(resultsByName['fail'].Output.strip(), 'fail')
+
+        self.assertEqual(scheduler.Outstanding, 0)
+
+    def test_CallbacksRunOnWaitingThread(self):
+
+        scheduler = toolscheduler.ExternalToolScheduler(MaxCores=4)
+
+        for i in range(0, 4):
+            scheduler.Submit(str(i), PythonCmd("print(%d)" % i), OnComplete=lambda result: threading.current_thread())
+
+        threads = scheduler.Wait()
+        self.assertEqual(len(threads), 4)
+        for t in threads:
+            self.assertEqual(t, threading.current_thread())
+
+    def test_MemoryLimitSerializesTools(self):
+
+        scheduler = toolscheduler.ExternalToolScheduler(MaxCores=4, MaxMemory=100)
+
+        for i in range(0, 3):
+            scheduler.Submit(str(i), PythonCmd("import time; print(time.time()); time.sleep(0.2); print(time.time())"),
+                             OnComplete=lambda result: [float(t) for t in result.Output.split()],
+                             Memory=75)
+
+        intervals = sorted(scheduler.Wait())
+        self.assertEqual(len(intervals), 3)
+
+        for i in range(1, len(intervals)):
+            self.assertGreaterEqual(intervals[i][0], intervals[i - 1][1], "Tools exceeding the memory limit should not run concurrently")
+
+    def test_RecordSubmissions(self):
+
+        scheduler = toolscheduler.ExternalToolScheduler(MaxCores=2)
+        completed = []
+
+        with toolscheduler.RecordSubmissions() as jobs:
+            scheduler.Submit('pass', PythonCmd("print('pass')"), OnComplete=lambda result: None)
+            scheduler.Submit('fail', PythonCmd("import sys; sys.exit(3)"))
+
+        scheduler.Submit('unrecorded', PythonCmd("print('unrecorded')"))
+
+        self.assertEqual([job.Name for job in jobs], ['pass', 'fail'])
+        for job in jobs:
+            self.assertFalse(job.Completed, "Jobs complete when their callback is invoked by Poll or Wait")
+            job.WhenComplete(completed.append)
+
+        scheduler.Wait()
+        self.assertEqual(sorted([job.Name for job in completed]), ['fail', 'pass'])
+        self.assertTrue(jobs[0].Succeeded)
+        self.assertFalse(jobs[1].Succeeded)
+
+        jobs[0].WhenComplete(completed.append)
+        self.assertIs(completed[-1], jobs[0], "Functions added after the job completed are called immediately")
+
+    def test_RecordToolResult(self):
+
+        class Node(object):
+
+            def __init__(self):
+                self.attrib = {}
+
+        node = Node()
+        output = '\n'.join([str(i) for i in range(0, 20)])
+        toolscheduler.RecordToolResult(node, toolscheduler.ToolResult('test', 'cmd', 1, output))
+
+        self.assertEqual(node.attrib['ToolReturnCode'], '1')
+        self.assertEqual(node.attrib['ToolOutput'].splitlines(), [str(i) for i in range(20 - toolscheduler.OutputLinesRecorded, 20)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import sys
+import types
+import unittest
+
+from nornir_buildmanager.importers import watch
+import test.testbase
+
+
+class CaptureTrackerTests(test.testbase.TestBase):
+
+    def setUp(self):
+        super(CaptureTrackerTests, self).setUp()
+        self.SectionPath = os.path.join(self.TestOutputPath, '0001')
+        os.makedirs(self.SectionPath, exist_ok=True)
+        self.CaptureFullPath = os.path.abspath(os.path.join(self.SectionPath, '0001.idoc'))
+        self.WriteFile(self.CaptureFullPath, 'ImageFile = 0001.idoc.st')
+
+    def WriteFile(self, fullpath, text):
+        with open(fullpath, 'w') as f:
+            f.write(text)
+
+    def test_CaptureMustBeStable(self):
+
+        tracker = watch.CaptureTracker(StableInterval=60)
+
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=0), [], "First sighting of a capture should never be ready")
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=30), [])
+
+        # A new tile beside the capture restarts the interval
+        self.WriteFile(os.path.join(self.SectionPath, '1.tif'), 'tile')
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=61), [])
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=100), [])
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=122), [self.CaptureFullPath])
+
+    def test_ImportedCaptureIsReimportedOnlyWhenChanged(self):
+
+        tracker = watch.CaptureTracker(StableInterval=10)
+        tracker.Poll([self.CaptureFullPath], now=0)
+
+        ready = tracker.Poll([self.CaptureFullPath], now=20)
+        self.assertEqual(ready, [self.CaptureFullPath])
+        tracker.MarkImported(ready)
+
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=40), [], "Imported captures should not be imported again")
+
+        self.WriteFile(self.CaptureFullPath, 'ImageFile = 0001.idoc.st\nNumTiles = 2')
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=50), [])
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=70), [self.CaptureFullPath])
+
+    def test_IncompleteCaptureIsNotReady(self):
+
+        complete = {'value': False}
+        tracker = watch.CaptureTracker(StableInterval=0, IsCaptureComplete=lambda path: complete['value'])
+
+        tracker.Poll([self.CaptureFullPath], now=0)
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=1), [])
+
+        complete['value'] = True
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=2), [self.CaptureFullPath])
+
+    def test_IgnoredFilesDoNotChangeCapture(self):
+
+        tracker = watch.CaptureTracker(StableInterval=10, IgnoredFiles=('Histogram.*',))
+        tracker.Poll([self.CaptureFullPath], now=0)
+        ready = tracker.Poll([self.CaptureFullPath], now=20)
+        tracker.MarkImported(ready, now=20)
+
+        self.WriteFile(os.path.join(self.SectionPath, 'Histogram.png'), 'plot')
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=40), [])
+        self.assertEqual(tracker.Poll([self.CaptureFullPath], now=60), [], "Files matching IgnoredFiles should not cause another import")
+
+    def test_FilesWrittenByImportDoNotCauseReimport(self):
+
+        ImportedFiles = []
+        SectionPath = self.SectionPath
+        WriteFile = self.WriteFile
+
+        def Import(VolumeElement, ImportPath, extension=None, InputFiles=None, **kwargs):
+            ImportedFiles.append(InputFiles)
+            if len(ImportedFiles) > 1:
+                # Watch stops when interrupted
+                raise KeyboardInterrupt()
+
+            WriteFile(os.path.join(SectionPath, 'Histogram.xml'), '<Histogram %d />' % len(ImportedFiles))
+            yield VolumeElement
+
+        importer = types.ModuleType('WritingImporter')
+        importer.Import = Import
+        sys.modules[importer.__name__] = importer
+        try:
+            yielded = list(watch.Watch('Volume', self.TestOutputPath, importer.__name__, 'idoc', PollInterval=0.05, StableInterval=0, IdleTimeout=1))
+        finally:
+            del sys.modules[importer.__name__]
+
+        self.assertEqual(ImportedFiles, [set([self.CaptureFullPath])], "Files the importer writes beside the capture should not cause another import")
+        self.assertEqual(yielded, ['Volume'])
+
+    def test_IncludeInputFile(self):
+
+        self.assertTrue(watch.IncludeInputFile(None, self.CaptureFullPath))
+        self.assertTrue(watch.IncludeInputFile(set([self.CaptureFullPath]), self.CaptureFullPath))
+        self.assertFalse(watch.IncludeInputFile(set(), self.CaptureFullPath))
+
+
+if __name__ == "__main__":
+    unittest.main()